@@ -0,0 +1,299 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from .local_engine import create_local_engine, is_local_url, local_backend
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:  # greenlet missing; the async path falls back to threads
+    create_async_engine = None  # type: ignore
+
+DEFAULT_SOURCE = "default"
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite", "mysql": "aiomysql"}
+
+# Data source of the request being served; set by main.select_data_source
+current_source: ContextVar[Optional[str]] = ContextVar("data_source", default=None)
+
+
+class UnknownDataSource(KeyError):
+    pass
+
+
+def default_db_url() -> str:
+    db_url = os.getenv("DB_URL")
+    if not db_url:
+        dbname = os.getenv("PGDATABASE", "your_db_name")
+        user = os.getenv("PGUSER", "your_user")
+        password = os.getenv("PGPASSWORD", "your_password")
+        host = os.getenv("PGHOST", "localhost")
+        port = os.getenv("PGPORT", "5432")
+        db_url = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
+    return db_url
+
+
+def async_url_for(db_url: str) -> Optional[str]:
+    """db_url with its driver swapped for an asyncio one (None if unknown)."""
+    scheme, _, rest = db_url.partition("://")
+    dialect = scheme.split("+")[0].lower()
+    driver = _ASYNC_DRIVERS.get(dialect)
+    if driver is None:
+        return None
+    return f"{dialect}+{driver}://{rest}"
+
+
+class DataSource:
+    """One warehouse: where it is, how to pool connections to it and which semantic layer describes it."""
+
+    def __init__(
+        self,
+        name: str,
+        db_url: str,
+        semantic_layer_path: str,
+        dialect: Optional[str] = None,
+        async_db_url: Optional[str] = None,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_recycle: int = 1800,
+        pool_timeout: float = 30,
+    ):
+        self.name = name
+        self.db_url = db_url
+        self.semantic_layer_path = semantic_layer_path
+        self.dialect = dialect.lower() if dialect else None
+        self.async_db_url = async_db_url
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.pool_timeout = pool_timeout
+
+    @property
+    def dialect_name(self) -> str:
+        # Examples: postgresql+psycopg2://, mysql+pymysql://, sqlite:///path.db
+        if self.dialect:
+            return self.dialect
+        if self.is_local:
+            return local_backend()
+        return self.db_url.split("://", 1)[0].split("+")[0].lower() or "postgresql"
+
+    @property
+    def is_local(self) -> bool:
+        """local:///data/processed: the embedded engine over the CSV/Parquet files (backend/local_engine.py)."""
+        return is_local_url(self.db_url)
+
+    def create_engine(self) -> Engine:
+        if self.is_local:
+            return create_local_engine(self.db_url)
+        return create_engine(self.db_url, pool_pre_ping=True, **self.pool_options())
+
+    def pool_options(self) -> dict:
+        if self.db_url.startswith("sqlite"):
+            # SQLite uses a per-thread/singleton pool that takes no sizing arguments
+            return {"pool_recycle": self.pool_recycle}
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_recycle": self.pool_recycle,
+            "pool_timeout": self.pool_timeout,
+        }
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "dialect": self.dialect_name,
+            "semantic_layer_path": self.semantic_layer_path,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_recycle": self.pool_recycle,
+        }
+
+
+class DataSourceRegistry:
+    """
+    Data sources by name, with connection pools created on first use. Pools unused for
+    ``idle_seconds``, and the least recently used beyond ``max_pools``, are disposed by
+    evict_idle() and re-created on the next request; the default source's pool is kept.
+    """
+
+    def __init__(self, sources: Dict[str, DataSource], default: str, idle_seconds: float = 900, max_pools: int = 16):
+        if default not in sources:
+            raise ValueError(f"Default data source {default!r} is not configured")
+        self.sources = sources
+        self.default = default
+        self.idle_seconds = idle_seconds
+        self.max_pools = max_pools
+        self._engines: Dict[str, Engine] = {}
+        self._async_engines: Dict[str, object] = {}
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def names(self) -> List[str]:
+        return list(self.sources)
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        name = name or current_source.get() or self.default
+        if name not in self.sources:
+            raise UnknownDataSource(name)
+        return name
+
+    def get(self, name: Optional[str] = None) -> DataSource:
+        return self.sources[self.resolve(name)]
+
+    def engine(self, name: Optional[str] = None) -> Engine:
+        name = self.resolve(name)
+        with self._lock:
+            self._last_used[name] = time.monotonic()
+            engine = self._engines.get(name)
+            if engine is None:
+                engine = self.sources[name].create_engine()
+                self._engines[name] = engine
+            return engine
+
+    def async_engine(self, name: Optional[str] = None):
+        """The source's asyncio engine, or None when it has no async driver."""
+        name = self.resolve(name)
+        with self._lock:
+            self._last_used[name] = time.monotonic()
+            if name in self._async_engines:
+                return self._async_engines[name]
+            source = self.sources[name]
+            # The embedded engine is in-process; it runs in the threadpool like any sync engine
+            db_url = source.async_db_url or (None if source.is_local else async_url_for(source.db_url))
+            engine = None
+            if db_url is not None and create_async_engine is not None:
+                try:
+                    engine = create_async_engine(db_url, pool_pre_ping=True, **source.pool_options())
+                except ImportError:
+                    # Async driver not installed; callers fall back to the sync engine in a thread
+                    engine = None
+            self._async_engines[name] = engine
+            return engine
+
+    def _pop_idle(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            open_names = [n for n in self._last_used if n in self._engines or n in self._async_engines]
+            by_age = sorted(open_names, key=lambda n: self._last_used[n])
+            overflow = max(0, len(by_age) - self.max_pools)
+            victims = [
+                n for i, n in enumerate(by_age)
+                if n != self.default and (i < overflow or now - self._last_used[n] > self.idle_seconds)
+            ]
+            popped = []
+            for name in victims:
+                popped.append((name, self._engines.pop(name, None), self._async_engines.pop(name, None)))
+                self._last_used.pop(name, None)
+            self.evictions += len(popped)
+            return popped
+
+    async def evict_idle(self) -> List[str]:
+        """Disposes idle pools; returns the names of the sources whose pools were closed."""
+        popped = self._pop_idle()
+        for _, engine, async_engine in popped:
+            if engine is not None:
+                engine.dispose()
+            if async_engine is not None:
+                await async_engine.dispose()
+        return [name for name, _, _ in popped]
+
+    async def dispose_all(self) -> None:
+        with self._lock:
+            engines, async_engines = list(self._engines.values()), list(self._async_engines.values())
+            self._engines.clear()
+            self._async_engines.clear()
+        for engine in engines:
+            engine.dispose()
+        for engine in async_engines:
+            if engine is not None:
+                await engine.dispose()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "default": self.default,
+                "open_pools": {
+                    name: {
+                        "idle_seconds": round(now - self._last_used.get(name, now), 1),
+                        "checked_out": engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else None,
+                        "size": engine.pool.size() if hasattr(engine.pool, "size") else None,
+                        "overflow": max(0, engine.pool.overflow()) if hasattr(engine.pool, "overflow") else None,
+                    }
+                    for name, engine in self._engines.items()
+                },
+                "max_pools": self.max_pools,
+                "idle_seconds": self.idle_seconds,
+                "evictions": self.evictions,
+            }
+
+
+def _source_from_env() -> DataSource:
+    return DataSource(
+        DEFAULT_SOURCE,
+        default_db_url(),
+        os.getenv("SEMANTIC_LAYER_PATH", "backend/semantic_config.json"),
+        dialect=os.getenv("SQL_DIALECT"),
+        async_db_url=os.getenv("ASYNC_DB_URL"),
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    )
+
+
+def _source_from_config(name: str, config: dict) -> DataSource:
+    # "db_url_env" keeps credentials out of the file
+    db_url = os.getenv(config["db_url_env"]) if config.get("db_url_env") else config.get("db_url")
+    if not db_url:
+        raise ValueError(f"Data source {name!r} has no db_url (or its db_url_env is unset)")
+    return DataSource(
+        name,
+        db_url,
+        config.get("semantic_layer", "backend/semantic_config.json"),
+        dialect=config.get("dialect"),
+        async_db_url=config.get("async_db_url"),
+        pool_size=int(config.get("pool_size", 5)),
+        max_overflow=int(config.get("max_overflow", 10)),
+        pool_recycle=int(config.get("pool_recycle", 1800)),
+        pool_timeout=float(config.get("pool_timeout", 30)),
+    )
+
+
+def load_data_sources(path: Optional[str] = None) -> DataSourceRegistry:
+    """
+    Reads DATA_SOURCES_PATH, e.g.
+    {"default": "sales", "sources": {"sales": {"db_url_env": "SALES_DB_URL", "semantic_layer": "..."}}}.
+    Without the file there is one source, "default", configured from DB_URL / PG* as before.
+    """
+    path = path or os.getenv("DATA_SOURCES_PATH", "backend/data_sources.json")
+    idle_seconds = float(os.getenv("DATA_SOURCE_IDLE_SECONDS", "900"))
+    max_pools = int(os.getenv("DATA_SOURCE_MAX_POOLS", "16"))
+    if not os.path.exists(path):
+        return DataSourceRegistry({DEFAULT_SOURCE: _source_from_env()}, DEFAULT_SOURCE, idle_seconds, max_pools)
+    with open(path) as f:
+        config = json.load(f)
+    sources = {name: _source_from_config(name, c) for name, c in config.get("sources", {}).items()}
+    default = config.get("default") or next(iter(sources), DEFAULT_SOURCE)
+    return DataSourceRegistry(sources, default, idle_seconds, max_pools)
+
+
+_registry: Optional[DataSourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_data_sources() -> DataSourceRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = load_data_sources()
+    return _registry
+
+
+def current_source_name() -> str:
+    return get_data_sources().resolve()
@@ -0,0 +1,424 @@
+"""
+Index and partitioning advisor for the star schema.
+
+Reads the executed-SQL log written by /query (see query_log.py) and the semantic layer, counts
+how often each column is joined on, filtered on and grouped by, and recommends DDL: indexes on
+join keys and filtered columns (BRIN for a well-ordered date key on a large fact table),
+statistics targets for the fact's join keys and range partitioning of the fact table by date.
+On PostgreSQL the logged workload is EXPLAINed before and after the index changes, using
+hypothetical indexes when the hypopg extension is installed. ``--explain trial`` instead builds
+them for real in a transaction that is rolled back, which locks and scans the tables, so it
+only runs when asked for.
+
+    python -m backend.index_advisor
+    python -m backend.index_advisor --log backend/query_log.jsonl --output db/schema/recommended_indexes.sql
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except Exception:  # pragma: no cover - sqlglot is optional
+    sqlglot = None  # type: ignore
+    exp = None  # type: ignore
+
+from .query_log import read_query_log
+from .result_cache import normalize_sql
+from .rollups import ROLLUP_PREFIX, additive_measures
+from .schema_retrieval import build_join_graph
+from .schema_snapshot import fetch_schema
+
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite", "mysql": "mysql", "duckdb": "duckdb"}
+# Below these sizes a btree (or a single table) is as good as BRIN (or partitions)
+BRIN_MIN_ROWS = 1_000_000
+BRIN_MIN_CORRELATION = 0.9
+STATISTICS_TARGET = 1000
+
+
+def load_workload(path: str, limit: Optional[int] = None, source: Optional[str] = None) -> List[Tuple[str, int]]:
+    """Distinct logged statements with how often they ran, most frequent first."""
+    counts = Counter(
+        normalize_sql(entry["sql"]) for entry in read_query_log(path)
+        # Entries written before data sources existed belong to the default one
+        if source is None or entry.get("source", "default") == source
+    )
+    return counts.most_common(limit)
+
+
+def _usage_kind(column) -> Optional[str]:
+    node = column
+    while node is not None:
+        if isinstance(node, exp.Join):
+            return "join"
+        if isinstance(node, (exp.Where, exp.Having)):
+            parent = column.parent
+            # WHERE a.x = b.y is an implicit join, not a filter
+            if isinstance(parent, exp.EQ) and isinstance(parent.left, exp.Column) and isinstance(parent.right, exp.Column):
+                return "join"
+            return "filter"
+        if isinstance(node, exp.Group):
+            return "group"
+        if isinstance(node, exp.Order):
+            return "order"
+        if isinstance(node, exp.Select):
+            return None
+        node = node.parent
+    return None
+
+
+def column_usage(workload: List[Tuple[str, int]], semantic_layer: dict, dialect: Optional[str]) -> Tuple[Dict[tuple, Counter], int]:
+    """Returns ({(table, column): Counter(join=, filter=, range=, group=, order=)}, unparsed statements)."""
+    columns_by_table = {
+        t.lower(): {c.lower() for c in cfg.get("columns", {})}
+        for t, cfg in semantic_layer.get("tables", {}).items()
+    }
+    usage: Dict[tuple, Counter] = {}
+    unparsed = 0
+    for sql, weight in workload:
+        try:
+            tree = sqlglot.parse_one(sql, read=dialect)
+        except sqlglot.errors.SqlglotError:
+            unparsed += 1
+            continue
+        aliases = {t.alias_or_name.lower(): t.name.lower() for t in tree.find_all(exp.Table)}
+        tables = set(aliases.values())
+        for column in tree.find_all(exp.Column):
+            name = column.name.lower()
+            if column.table:
+                table = aliases.get(column.table.lower())
+            else:
+                owners = [t for t in tables if name in columns_by_table.get(t, set())]
+                table = owners[0] if len(owners) == 1 else None
+            kind = _usage_kind(column)
+            if table is None or kind is None:
+                continue
+            counter = usage.setdefault((table, name), Counter())
+            counter[kind] += weight
+            if kind == "filter" and isinstance(column.parent, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)):
+                counter["range"] += weight
+    return usage, unparsed
+
+
+def _indexed_leading_columns(engine: Engine, db_schema: dict) -> Dict[str, set]:
+    inspector = inspect(engine)
+    leading: Dict[str, set] = {}
+    for table, tdef in db_schema.get("tables", {}).items():
+        columns = leading.setdefault(table.lower(), set())
+        if tdef.get("primary_key"):
+            columns.add(tdef["primary_key"][0].lower())
+        for index in inspector.get_indexes(table):
+            names = [c for c in index.get("column_names") or [] if c]
+            if names:
+                columns.add(names[0].lower())
+    return leading
+
+
+def _row_count(engine: Engine, table: str) -> int:
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            estimate = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = :t"), {"t": table}).scalar()
+            if estimate is not None and estimate >= 0:
+                return int(estimate)
+        return int(conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() or 0)
+
+
+def _correlation(engine: Engine, table: str, column: str) -> Optional[float]:
+    """How closely the physical row order follows the column (pg_stats, after ANALYZE)."""
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as conn:
+        value = conn.execute(
+            text("SELECT correlation FROM pg_stats WHERE tablename = :t AND attname = :c"),
+            {"t": table, "c": column},
+        ).scalar()
+    return abs(float(value)) if value is not None else None
+
+
+def find_date_key(semantic_layer: dict, db_schema: dict, fact: str) -> Optional[dict]:
+    """The fact column joining a dimension that has a DATE column, e.g. revenue.date_id -> date."""
+    graph = build_join_graph(semantic_layer, db_schema)
+    schema_tables = {t.lower(): tdef for t, tdef in db_schema.get("tables", {}).items()}
+    for dim, (fact_col, dim_col) in graph.get(fact, {}).items():
+        for column in schema_tables.get(dim.lower(), {}).get("columns", []):
+            if column["type"].upper().startswith(("DATE", "TIMESTAMP")):
+                return {"fact_column": fact_col.lower(), "dimension": dim.lower(),
+                        "dimension_key": dim_col.lower(), "date_column": column["name"].lower()}
+    return None
+
+
+def yearly_key_bounds(engine: Engine, date_key: dict) -> Optional[List[tuple]]:
+    """[(year, first key)] if the key sorts in date order, else None (ranges over it would be meaningless)."""
+    dim, key, date_col = date_key["dimension"], date_key["dimension_key"], date_key["date_column"]
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT {key}, {date_col} FROM {dim} WHERE {date_col} IS NOT NULL ORDER BY {key}")).fetchall()
+    bounds: List[tuple] = []
+    previous = None
+    for key_value, day in rows:
+        day = str(day)[:10]
+        if previous is not None and day < previous:
+            return None
+        previous = day
+        if not bounds or bounds[-1][0] != day[:4]:
+            bounds.append((day[:4], key_value))
+    return bounds or None
+
+
+def partition_ddl(fact: str, columns: List[str], primary_key: List[str], key: str, bounds: List[tuple]) -> List[str]:
+    staging = f"{fact}_partitioned"
+    statements = [
+        f"CREATE TABLE {staging} (LIKE {fact} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({key})",
+    ]
+    for i, (year, first_key) in enumerate(bounds):
+        lower = "MINVALUE" if i == 0 else f"'{first_key}'"
+        upper = f"'{bounds[i + 1][1]}'" if i + 1 < len(bounds) else "MAXVALUE"
+        statements.append(f"CREATE TABLE {fact}_y{year} PARTITION OF {staging} FOR VALUES FROM ({lower}) TO ({upper})")
+    if primary_key:
+        # A partitioned table's primary key has to include the partition key
+        pk = primary_key if key in primary_key else primary_key + [key]
+        statements.append(f"ALTER TABLE {staging} ADD PRIMARY KEY ({', '.join(pk)})")
+    statements += [
+        f"INSERT INTO {staging} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {fact}",
+        f"ALTER TABLE {fact} RENAME TO {fact}_unpartitioned",
+        f"ALTER TABLE {staging} RENAME TO {fact}",
+        f"ANALYZE {fact}",
+    ]
+    return statements
+
+
+def recommend(
+    engine: Engine,
+    usage: Dict[tuple, Counter],
+    semantic_layer: dict,
+    db_schema: dict,
+    min_uses: int = 1,
+    partition_min_rows: int = 10_000_000,
+) -> Tuple[List[dict], List[str]]:
+    """Returns (recommendations, notes). Each recommendation carries its DDL statements and the reason."""
+    postgres = engine.dialect.name == "postgresql"
+    tables = semantic_layer.get("tables", {})
+    facts = {t.lower(): cfg for t, cfg in tables.items() if cfg.get("metrics")}
+    measures = {(t, m.lower()) for t, cfg in facts.items() for m in additive_measures(cfg)}
+    schema_tables = {t.lower(): tdef for t, tdef in db_schema.get("tables", {}).items() if not t.lower().startswith(ROLLUP_PREFIX)}
+    indexed = _indexed_leading_columns(engine, db_schema)
+    recommendations: List[dict] = []
+    notes: List[str] = []
+
+    date_keys = {fact: find_date_key(semantic_layer, db_schema, fact) for fact in facts}
+    fact_rows = {fact: _row_count(engine, fact) for fact in facts if fact in schema_tables}
+
+    ranked = sorted(usage.items(), key=lambda item: -(item[1]["join"] + item[1]["filter"]))
+    for (table, column), counts in ranked:
+        if table not in schema_tables or (table, column) in measures:
+            continue
+        uses = counts["join"] + counts["filter"]
+        if uses < min_uses:
+            continue
+        if column in indexed.get(table, set()):
+            notes.append(f"{table}.{column}: already the leading column of an index ({uses} uses)")
+            continue
+        reason = f"{counts['join']} joins, {counts['filter']} filters" + (f" ({counts['range']} range)" if counts["range"] else "")
+        date_key = date_keys.get(table)
+        if postgres and date_key and date_key["fact_column"] == column and fact_rows.get(table, 0) >= BRIN_MIN_ROWS:
+            correlation = _correlation(engine, table, column)
+            if correlation is not None and correlation >= BRIN_MIN_CORRELATION:
+                recommendations.append({
+                    "kind": "brin", "table": table, "columns": [column], "uses": uses,
+                    "ddl": [f"CREATE INDEX IF NOT EXISTS brin_{table}_{column} ON {table} USING brin ({column})"],
+                    "reason": f"{reason}; rows are stored in {column} order (correlation {correlation:.2f})",
+                })
+                continue
+        recommendations.append({
+            "kind": "index", "table": table, "columns": [column], "uses": uses,
+            "ddl": [f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})"],
+            "reason": reason,
+        })
+
+    if postgres:
+        for fact in facts:
+            join_keys = sorted(c for (t, c), counts in usage.items() if t == fact and counts["join"] >= min_uses)
+            if join_keys:
+                recommendations.append({
+                    "kind": "statistics", "table": fact, "columns": join_keys,
+                    "uses": sum(usage[(fact, c)]["join"] for c in join_keys),
+                    "ddl": [f"ALTER TABLE {fact} ALTER COLUMN {c} SET STATISTICS {STATISTICS_TARGET}" for c in join_keys] + [f"ANALYZE {fact}"],
+                    "reason": "finer histograms on the join keys sharpen join row estimates",
+                })
+
+    for fact, date_key in date_keys.items():
+        if fact not in schema_tables:
+            continue
+        if date_key is None:
+            notes.append(f"{fact}: no date dimension found, not partitioning")
+            continue
+        date_uses = sum(
+            counts["join"] + counts["filter"] for (t, c), counts in usage.items()
+            if (t, c) == (fact, date_key["fact_column"]) or (t == date_key["dimension"] and counts["filter"])
+        )
+        if not postgres:
+            notes.append(f"{fact}: range partitioning is only generated for PostgreSQL")
+        elif fact_rows.get(fact, 0) < partition_min_rows:
+            notes.append(f"{fact}: {fact_rows.get(fact, 0)} rows is below --partition-min-rows ({partition_min_rows}), not partitioning")
+        elif not date_uses:
+            notes.append(f"{fact}: the workload never restricts by date, not partitioning")
+        else:
+            bounds = yearly_key_bounds(engine, date_key)
+            if bounds is None:
+                notes.append(f"{fact}: {date_key['dimension']}.{date_key['dimension_key']} does not sort in date order, not partitioning")
+            else:
+                tdef = schema_tables[fact]
+                recommendations.append({
+                    "kind": "partition", "table": fact, "columns": [date_key["fact_column"]], "uses": date_uses,
+                    "ddl": partition_ddl(
+                        fact, [c["name"].lower() for c in tdef["columns"]],
+                        [c.lower() for c in tdef.get("primary_key", [])], date_key["fact_column"], bounds,
+                    ),
+                    "reason": f"{date_uses} date-restricted uses; one partition per year lets the planner prune",
+                })
+    return recommendations, notes
+
+
+def explain_cost(conn, sql: str) -> Optional[float]:
+    try:
+        # A savepoint keeps one failing statement from aborting the surrounding transaction
+        with conn.begin_nested():
+            plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    except Exception:
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+def _workload_cost(conn, workload: List[Tuple[str, int]]) -> dict:
+    costs = {sql: explain_cost(conn, sql) for sql, _ in workload}
+    total = sum(cost * weight for (sql, weight), cost in zip(workload, costs.values()) if cost is not None)
+    return {"total": total, "per_statement": costs}
+
+
+def workload_costs(engine: Engine, workload: List[Tuple[str, int]], recommendations: List[dict], mode: str = "auto") -> Optional[dict]:
+    """
+    Weighted EXPLAIN cost of the workload before and after the index recommendations.
+    Partitioning is left out: trying it means copying the fact table. "auto" uses hypopg when
+    it is installed and otherwise reports no after-cost (mode "none").
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    indexes = [r for r in recommendations if r["kind"] in ("index", "brin")]
+    with engine.connect() as conn:
+        before = _workload_cost(conn, workload)
+        if mode == "auto":
+            has_hypopg = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")).scalar()
+            mode = "hypopg" if has_hypopg else "none"
+        conn.rollback()
+
+        if mode == "hypopg":
+            for rec in indexes:
+                conn.execute(text("SELECT * FROM hypopg_create_index(:ddl)"), {"ddl": rec["ddl"][0].replace(" IF NOT EXISTS", "")})
+            after = _workload_cost(conn, workload)
+            conn.execute(text("SELECT hypopg_reset()"))
+            conn.commit()
+        elif mode == "trial":
+            # DDL is transactional in PostgreSQL: build, EXPLAIN, then roll everything back
+            trial = conn.begin()
+            try:
+                for rec in indexes + [r for r in recommendations if r["kind"] == "statistics"]:
+                    for statement in rec["ddl"]:
+                        conn.exec_driver_sql(statement)
+                after = _workload_cost(conn, workload)
+            finally:
+                trial.rollback()
+        else:
+            return {"mode": mode, "before": before, "after": None}
+    return {"mode": mode, "before": before, "after": after}
+
+
+def render_ddl(recommendations: List[dict]) -> str:
+    blocks = []
+    for rec in recommendations:
+        statements = ";\n".join(rec["ddl"]) + ";"
+        if rec["kind"] == "partition":
+            statements = f"BEGIN;\n{statements}\nCOMMIT;"
+        blocks.append(f"-- {rec['kind']} on {rec['table']}({', '.join(rec['columns'])}): {rec['reason']}\n{statements}")
+    return "\n\n".join(blocks) + "\n"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Recommend indexes and partitioning from the /query SQL log.")
+    parser.add_argument("--db-url", default=os.getenv("DB_URL"), help="SQLAlchemy URL (default: DB_URL)")
+    parser.add_argument("--semantic-layer", default=os.getenv("SEMANTIC_LAYER_PATH", "backend/semantic_config.json"))
+    parser.add_argument("--log", default=os.getenv("QUERY_LOG_PATH", "backend/query_log.jsonl"))
+    parser.add_argument("--source", help="Only statements run against this data source (as named in the log)")
+    parser.add_argument("--limit", type=int, help="Only the N most frequent statements")
+    parser.add_argument("--min-uses", type=int, default=1, help="Joins+filters a column needs before it is indexed")
+    parser.add_argument("--partition-min-rows", type=int, default=10_000_000)
+    parser.add_argument("--explain", choices=["auto", "hypopg", "trial", "none"], default="auto",
+                        help="How after-costs are measured (PostgreSQL only)")
+    parser.add_argument("--output", help="Write the DDL here instead of printing it")
+    args = parser.parse_args(argv)
+
+    if sqlglot is None:
+        print("❌ sqlglot is required to analyse the logged SQL (pip install sqlglot)")
+        return 1
+    if not args.db_url:
+        print("❌ No database URL (set DB_URL or pass --db-url)")
+        return 1
+    with open(args.semantic_layer) as f:
+        semantic_layer = json.load(f)
+
+    workload = load_workload(args.log, args.limit, args.source)
+    if not workload:
+        print(f"⚠️  No executed SQL in {args.log}; run some /query requests first")
+        return 1
+    engine = create_engine(args.db_url, pool_pre_ping=True)
+    dialect = _SQLGLOT_DIALECTS.get(engine.dialect.name)
+
+    try:
+        usage, unparsed = column_usage(workload, semantic_layer, dialect)
+        print(f"📥 {sum(w for _, w in workload)} executions, {len(workload)} distinct statements"
+              + (f", {unparsed} unparsable" if unparsed else ""))
+        for (table, column), counts in sorted(usage.items(), key=lambda item: -sum(item[1].values()))[:20]:
+            print(f"   {table}.{column}: " + ", ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+
+        recommendations, notes = recommend(
+            engine, usage, semantic_layer, fetch_schema(engine),
+            min_uses=args.min_uses, partition_min_rows=args.partition_min_rows,
+        )
+        for note in notes:
+            print(f"   ⚠️  {note}")
+        ddl = render_ddl(recommendations) if recommendations else "-- nothing to recommend\n"
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(ddl)
+            print(f"✅ {len(recommendations)} recommendations written to {args.output}")
+        else:
+            print(ddl)
+
+        costs = workload_costs(engine, workload, recommendations, args.explain) if args.explain != "none" else None
+        if costs is None:
+            if args.explain != "none":
+                print("⚠️  EXPLAIN costs are only compared on PostgreSQL")
+        else:
+            if args.explain == "auto" and costs["mode"] == "none":
+                print("⚠️  hypopg is not installed, so after-costs are skipped (CREATE EXTENSION hypopg, or pass --explain trial)")
+            before = costs["before"]["total"]
+            print(f"✅ workload cost before: {before:,.0f}")
+            if costs["after"] is not None:
+                after = costs["after"]["total"]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"✅ workload cost after ({costs['mode']}): {after:,.0f} ({change:+.1f}%)")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,100 +1,284 @@
 import os
+import re
+import copy
 import json
-from typing import Optional
+import time
+import asyncio
+import threading
+import urllib.request
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional
 
 from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-
-# LLM providers (imported lazily in get_llm)
-# OpenAI
-try:
-    from langchain.chat_models import ChatOpenAI  # langchain < 0.2
-except Exception:  # pragma: no cover
-    ChatOpenAI = None  # type: ignore
-try:
-    from langchain_openai import ChatOpenAI as ChatOpenAINew  # langchain-openai package
-except Exception:
-    ChatOpenAINew = None  # type: ignore
-
-# Ollama
-try:
-    from langchain_community.chat_models import ChatOllama
-except Exception:
-    ChatOllama = None  # type: ignore
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+
+from .cache import TTLCache
+from .data_sources import get_data_sources
+from .metric_compiler import CompileError, MetricIndex, compile_question
+from .metrics import LLM_TOKENS, record_stage, timed
+from .schema_retrieval import estimate_tokens, format_joins, get_encoding, prune_semantic_layer
+from .semantic_snapshot import (
+    SemanticSnapshot,
+    file_signature,
+    format_semantic_layer,
+    hash_semantic_layer,
+    load_semantic_layer_file,
+)
+from .semantic_suggest import RateLimiter, chunk_tables, merge_suggestions, parse_suggestion, table_fingerprint
 
 load_dotenv()
 
-SEMANTIC_LAYER_PATH = os.getenv("SEMANTIC_LAYER_PATH", "backend/semantic_config.json")
-semantic_layer: dict = {"tables": {}}
+SCHEMA_PRUNING_ENABLED = os.getenv("SCHEMA_PRUNING", "true").lower() in ("1", "true", "yes")
+SCHEMA_PRUNING_MAX_COLUMNS = int(os.getenv("SCHEMA_PRUNING_MAX_COLUMNS", "30"))
 
-def _load_semantic_layer_from_disk() -> dict:
-    global semantic_layer
-    try:
-        with open(SEMANTIC_LAYER_PATH) as f:
-            semantic_layer = json.load(f)
-    except FileNotFoundError:
-        semantic_layer = {"tables": {}}
-    return semantic_layer
-
-def format_semantic_layer(semantic_layer: dict) -> str:
-    formatted = []
-    for table, config in semantic_layer["tables"].items():
-        columns = ", ".join(config["columns"].keys())
-        metrics = ", ".join(config.get("metrics", {}).keys())
-        formatted.append(f"Table: {table}\nColumns: {columns}")
-        if metrics:
-            formatted.append(f"Metrics: {metrics}")
-    return "\n\n".join(formatted)
-
-semantic_knowledge = format_semantic_layer(_load_semantic_layer_from_disk())
+# Rule-based "metric by dimension" compiler that answers simple questions without the LLM
+METRIC_COMPILER_ENABLED = os.getenv("METRIC_COMPILER", "true").lower() in ("1", "true", "yes")
+
+
+class SourceState:
+    """
+    Per data source: the current SemanticSnapshot, swapped whole (never edited in place)
+    when the layer or the introspected DB schema changes, and the generated-SQL cache.
+    """
+
+    def __init__(self, semantic_layer_path: str):
+        self.semantic_layer_path = semantic_layer_path
+        # Generated-SQL cache, keyed on (question, semantic layer version, dialect, model)
+        self.generation_cache = TTLCache(
+            max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "512")),
+            ttl=float(os.getenv("SQL_CACHE_TTL_SECONDS", "3600")),
+        )
+        self._lock = threading.Lock()
+        # (mtime_ns, size) of the file the watcher last loaded
+        self.file_signature = file_signature(semantic_layer_path)
+        self.snapshot = SemanticSnapshot(load_semantic_layer_file(semantic_layer_path))
+
+    def swap(self, build) -> SemanticSnapshot:
+        """
+        Replaces the snapshot with build(current). Writers are serialised so a schema change
+        and a layer change cannot drop each other; readers just take self.snapshot.
+        """
+        with self._lock:
+            snapshot = build(self.snapshot)
+            self.snapshot = snapshot
+        return snapshot
+
+
+_source_states: dict = {}
+_source_states_lock = threading.Lock()
+# (data source, snapshot) a request pinned when it started; see pin_semantic_snapshot
+_pinned_snapshot: ContextVar[Optional[tuple]] = ContextVar("semantic_snapshot", default=None)
+
+
+def get_source_state(source: Optional[str] = None) -> SourceState:
+    """State of ``source``, else of the data source serving the current request."""
+    name = get_data_sources().resolve(source)
+    state = _source_states.get(name)
+    if state is None:
+        with _source_states_lock:
+            state = _source_states.get(name)
+            if state is None:
+                state = SourceState(get_data_sources().get(name).semantic_layer_path)
+                _source_states[name] = state
+    return state
+
+
+def pin_semantic_snapshot(source: Optional[str] = None) -> SemanticSnapshot:
+    """
+    Fixes the snapshot the current request (context) uses from here on, so a reload while
+    it runs cannot hand it a prompt from one layer and a cache key from another.
+    """
+    name = get_data_sources().resolve(source)
+    snapshot = get_source_state(name).snapshot
+    _pinned_snapshot.set((name, snapshot))
+    return snapshot
 
-def infer_sql_dialect() -> str:
-    # Priority: explicit env, then DB_URL scheme, fallback to postgresql
-    env_dialect = os.getenv("SQL_DIALECT")
-    if env_dialect:
-        return env_dialect.lower()
 
-    db_url = os.getenv("DB_URL", "")
-    if db_url:
-        # Examples: postgresql+psycopg2://, mysql+pymysql://, sqlite:///path.db
-        scheme = db_url.split("://", 1)[0]
-        # Strip driver suffix
-        dialect = scheme.split("+")[0].lower()
-        return dialect
+def get_semantic_snapshot(source: Optional[str] = None) -> SemanticSnapshot:
+    name = get_data_sources().resolve(source)
+    pinned = _pinned_snapshot.get()
+    if pinned is not None and pinned[0] == name:
+        return pinned[1]
+    return get_source_state(name).snapshot
 
-    return "postgresql"
 
+# Speculative generation: SQL_CANDIDATES > 1 asks the LLM for that many candidates at once,
+# cycling through these temperatures; the caller runs the cheapest one that plans
+SQL_CANDIDATES = int(os.getenv("SQL_CANDIDATES", "1"))
+SQL_CANDIDATE_TEMPERATURES = [
+    float(t) for t in os.getenv("SQL_CANDIDATE_TEMPERATURES", "0,0.3,0.7,1.0").split(",") if t.strip()
+]
 
-def get_llm():
+def infer_sql_dialect() -> str:
+    # The data source's declared dialect (SQL_DIALECT for the env-configured one), else its URL scheme
+    return get_data_sources().get().dialect_name
+
+
+def get_llm_settings() -> tuple:
     provider = os.getenv("LLM_PROVIDER", "openai").lower()
-    model = os.getenv("LLM_MODEL") or (
-        "gpt-4o-mini" if provider == "openai" else "llama3.1"
-    )
+    model = os.getenv("LLM_MODEL") or {"openai": "gpt-4o-mini", "replay": "canned"}.get(provider, "llama3.1")
+    return provider, model
+
+
+# Default number of concurrent LLM calls per provider; override with LLM_CONCURRENCY_<PROVIDER>
+_DEFAULT_LLM_CONCURRENCY = {"openai": 8, "ollama": 2}
+_llm_semaphores: dict = {}
+
+
+def get_llm_concurrency(provider: str) -> int:
+    env_value = os.getenv(f"LLM_CONCURRENCY_{provider.upper()}")
+    if env_value:
+        return max(1, int(env_value))
+    return _DEFAULT_LLM_CONCURRENCY.get(provider, 4)
+
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    provider, _ = get_llm_settings()
+    if provider not in _llm_semaphores:
+        _llm_semaphores[provider] = asyncio.Semaphore(get_llm_concurrency(provider))
+    return _llm_semaphores[provider]
 
+
+def _chat_model_class(provider: str):
+    """
+    Imports the configured provider's integration only; langchain_openai and
+    langchain_community each take a large share of a cold start to import.
+    """
     if provider == "openai":
         # Prefer new integration if available
-        if ChatOpenAINew is not None:
-            return ChatOpenAINew(model=model, temperature=0)
-        if ChatOpenAI is not None:
-            return ChatOpenAI(model=model, temperature=0)
-        raise RuntimeError("OpenAI integration not available; install langchain-openai or compatible langchain.")
+        try:
+            from langchain_openai import ChatOpenAI
+            return ChatOpenAI
+        except ImportError:
+            pass
+        try:
+            from langchain.chat_models import ChatOpenAI  # langchain < 0.2
+            return ChatOpenAI
+        except ImportError:
+            raise RuntimeError("OpenAI integration not available; install langchain-openai or compatible langchain.")
 
     if provider == "ollama":
-        if ChatOllama is None:
+        try:
+            from langchain_community.chat_models import ChatOllama
+            return ChatOllama
+        except ImportError:
             raise RuntimeError("Ollama integration not available; install langchain-community and run Ollama.")
-        base_url = os.getenv("OLLAMA_BASE_URL")
-        kwargs = {"model": model, "temperature": 0}
-        if base_url:
-            kwargs["base_url"] = base_url
-        return ChatOllama(**kwargs)
 
     # Placeholder for other providers; users can extend
     raise RuntimeError(f"Unsupported LLM provider: {provider}")
 
+
+# How long Ollama keeps the model loaded after a request (e.g. "30m", "-1" for forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE")
+# Chains print their prompts to stdout when true
+LLM_VERBOSE = os.getenv("LLM_VERBOSE", "false").lower() in ("1", "true", "yes")
+
+
+class _LLMMetrics(BaseCallbackHandler):
+    """
+    Times every LLM call (stage "llm") and counts its tokens: the provider's usage report
+    when it sends one (OpenAI token_usage, Ollama eval counts), else an estimate.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: dict = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._started[run_id] = (time.perf_counter(), "\n".join(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._started[run_id] = (time.perf_counter(), text)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        started, prompt = self._started.pop(run_id, (None, ""))
+        if started is not None:
+            record_stage("llm", time.perf_counter() - started)
+        _, model = get_llm_settings()
+        prompt_tokens, completion_tokens = _token_usage(response)
+        generations = [g for batch in response.generations for g in batch]
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        if completion_tokens is None:
+            completion_tokens = sum(estimate_tokens(g.text) for g in generations)
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt", model=model)
+        LLM_TOKENS.inc(completion_tokens, kind="completion", model=model)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        started, _ = self._started.pop(run_id, (None, ""))
+        if started is not None:
+            record_stage("llm", time.perf_counter() - started)
+
+
+def _token_usage(response) -> tuple:
+    """(prompt_tokens, completion_tokens) reported by the provider; None for what it did not report."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    for batch in response.generations:
+        for generation in batch:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens"), metadata.get("output_tokens")
+            info = generation.generation_info or {}
+            if "eval_count" in info:
+                return info.get("prompt_eval_count"), info.get("eval_count")
+    return None, None
+
+
+_llm_metrics = _LLMMetrics()
+
+
+def get_llm(temperature: float = 0, streaming: bool = False):
+    provider, model = get_llm_settings()
+    if provider == "replay":
+        # Canned SQL per question, for load tests and offline runs (backend/replay_llm.py)
+        from .replay_llm import build_replay_llm
+        return build_replay_llm(callbacks=[_llm_metrics])
+    chat_model = _chat_model_class(provider)
+
+    if provider == "openai":
+        return chat_model(model=model, temperature=temperature, streaming=streaming, callbacks=[_llm_metrics])
+
+    # ChatOllama always streams from the server, so token callbacks fire either way
+    base_url = os.getenv("OLLAMA_BASE_URL")
+    kwargs = {"model": model, "temperature": temperature, "callbacks": [_llm_metrics]}
+    if base_url:
+        kwargs["base_url"] = base_url
+    if OLLAMA_KEEP_ALIVE:
+        kwargs["keep_alive"] = OLLAMA_KEEP_ALIVE
+    return chat_model(**kwargs)
+
+# Dialect-specific guidelines appended to the generation and repair prompts
+DIALECT_NOTES = {
+    "duckdb": [
+        "Tables are views over CSV/Parquet files; text values may carry leading spaces, so compare them with trim()",
+        "Use date_trunc('month', col), year(col) or strftime(col, '%Y-%m') for dates",
+        "Column aliases may be reused in GROUP BY and ORDER BY",
+    ],
+    "sqlite": [
+        "There is no date_trunc or EXTRACT: use strftime('%Y', col) and strftime('%Y-%m', col) on ISO date text",
+        "Integer division truncates: CAST one side to REAL for ratios and averages of integers",
+        "No ILIKE: LIKE is already case-insensitive for ASCII",
+    ],
+    "mysql": [
+        "Quote identifiers with backticks only when they are reserved words",
+        "Use DATE_FORMAT(col, '%Y-%m') or YEAR(col) for date parts",
+    ],
+}
+
+
+def dialect_notes(dialect: str) -> str:
+    return "".join(f"\n- {note}" for note in DIALECT_NOTES.get(dialect, []))
+
+
 # Prompt Template
 custom_prompt = PromptTemplate(
-    input_variables=["question", "table_info", "dialect"],
+    input_variables=["question", "table_info", "dialect", "dialect_notes"],
     template="""
 You are an expert SQL generator for the {dialect} dialect. Use the following semantic layer info to generate accurate SQL.
 
@@ -106,126 +290,558 @@ Question: {question}
 Guidelines:
 - Unless required by the dialect, do not quote identifiers
 - Prefer lowercase for table/column names when possible
-- Return only valid SQL for the declared dialect: {dialect}
+- Return only valid SQL for the declared dialect: {dialect}{dialect_notes}
+- Do NOT include explanation or formatting
+
+SQL:
+"""
+)
+
+repair_prompt = PromptTemplate(
+    input_variables=["question", "table_info", "dialect", "dialect_notes", "sql", "error"],
+    template="""
+You are an expert SQL generator for the {dialect} dialect. The SQL below was written for the question but the database rejected it. Fix it.
+
+Semantic Layer Info:
+{table_info}
+
+Question: {question}
+
+Failed SQL:
+{sql}
+
+Database error:
+{error}
+
+Guidelines:
+- Keep the intent of the question; change only what the error requires
+- Return only valid SQL for the declared dialect: {dialect}{dialect_notes}
 - Do NOT include explanation or formatting
 
 SQL:
 """
 )
 
-# SQL generation chain
+# SQL generation chain (temperature 0); speculative candidates use _candidate_chains
 sql_chain: Optional[LLMChain] = None
+_candidate_chains: dict = {}
+repair_chain: Optional[LLMChain] = None
+# Same prompt and temperature as sql_chain, on an LLM that emits tokens to callbacks
+streaming_chain: Optional[LLMChain] = None
 
-def generate_sql_response(question: str) -> dict:
+
+def normalize_question(question: str) -> str:
+    # Case, whitespace and trailing punctuation do not change the SQL we want
+    text = re.sub(r"\s+", " ", question or "").strip().lower()
+    return text.rstrip("?!. ")
+
+
+def generation_cache_key(question: str, dialect: str) -> tuple:
+    provider, model = get_llm_settings()
+    return (normalize_question(question), get_semantic_snapshot().version, dialect, f"{provider}:{model}")
+
+
+def get_generation_cache_stats() -> dict:
+    return get_source_state().generation_cache.stats()
+
+
+def generation_cache_stats_by_source() -> dict:
+    """{source: stats} for the sources that have served a request so far."""
+    return {name: state.generation_cache.stats() for name, state in list(_source_states.items())}
+
+
+def clear_generation_cache() -> None:
+    get_source_state().generation_cache.clear()
+
+
+def set_db_schema(schema: Optional[dict], source: Optional[str] = None) -> None:
+    get_source_state(source).swap(lambda current: current.with_db_schema(schema))
+
+
+def build_table_info(question: str) -> tuple:
+    """Returns (table_info, tables_kept) for the prompt, pruned to what the question needs."""
+    snapshot = get_semantic_snapshot()
+    if not SCHEMA_PRUNING_ENABLED:
+        return snapshot.knowledge, list(snapshot.layer["tables"].keys())
+    pruned, joins = prune_semantic_layer(
+        question,
+        snapshot.layer,
+        snapshot.db_schema,
+        max_columns_per_table=SCHEMA_PRUNING_MAX_COLUMNS,
+        phrase_index=snapshot.phrase_index,
+        graph=snapshot.graph,
+    )
+    table_info = format_semantic_layer(pruned)
+    join_text = format_joins(joins)
+    if join_text:
+        table_info = f"{table_info}\n\n{join_text}"
+    return table_info, list(pruned.get("tables", {}).keys())
+
+
+def get_metric_index() -> MetricIndex:
+    return get_semantic_snapshot().metric_index
+
+
+def compile_sql_response(question: str) -> Optional[dict]:
+    """Answers simple metric questions deterministically; None means ask the LLM."""
+    if not METRIC_COMPILER_ENABLED:
+        return None
     try:
-        global sql_chain
-        if sql_chain is None:
-            llm = get_llm()
-            sql_chain = LLMChain(
-                llm=llm,
-                prompt=custom_prompt,
-                verbose=True
-            )
-
-        output = sql_chain.invoke({
+        compiled = compile_question(get_metric_index(), question)
+    except CompileError:
+        return None
+    return {
+        "type": "query_result",
+        "sql": compiled["sql"],
+        "cached": False,
+        "path": "compiler",
+        "compiled": {k: compiled[k] for k in ("metrics", "dimensions", "filters")},
+    }
+
+
+def get_sql_chain() -> LLMChain:
+    global sql_chain
+    if sql_chain is None:
+        llm = get_llm()
+        sql_chain = LLMChain(
+            llm=llm,
+            prompt=custom_prompt,
+            verbose=LLM_VERBOSE
+        )
+    return sql_chain
+
+
+def _prepare_generation(question: str) -> tuple:
+    """
+    Returns (response, None) when the compiler or cache already answered, else
+    (None, job) where job carries the chain inputs for an LLM round trip.
+    """
+    with timed("compile"):
+        compiled = compile_sql_response(question)
+    if compiled is not None:
+        return compiled, None
+
+    dialect = infer_sql_dialect()
+    cache_key = generation_cache_key(question, dialect)
+    cached_sql = get_source_state().generation_cache.get(cache_key)
+    if cached_sql is not None:
+        return {"type": "query_result", "sql": cached_sql, "cached": True, "path": "cache"}, None
+
+    with timed("prompt"):
+        table_info, tables_used = build_table_info(question)
+        prompt_stats = {
+            "prompt_tokens": estimate_tokens(custom_prompt.format(
+                question=question, table_info=table_info, dialect=dialect, dialect_notes=dialect_notes(dialect)
+            )),
+            "full_schema_prompt_tokens": estimate_tokens(custom_prompt.format(
+                question=question, table_info=get_semantic_snapshot().knowledge, dialect=dialect,
+                dialect_notes=dialect_notes(dialect),
+            )),
+            "tables": tables_used,
+        }
+    job = {
+        "inputs": {
             "question": question,
-            "table_info": semantic_knowledge,
-            "dialect": infer_sql_dialect()
-        })
+            "table_info": table_info,
+            "dialect": dialect,
+            "dialect_notes": dialect_notes(dialect),
+        },
+        "cache_key": cache_key,
+        "prompt": prompt_stats,
+    }
+    return None, job
 
-        sql = output.get("text", "").strip().strip("```sql").strip("```").strip()
-        if not sql:
-            return {"type": "error", "error": "Failed to generate SQL."}
 
-        # Just return SQL string
+def get_candidate_chain(temperature: float) -> LLMChain:
+    if temperature == 0:
+        return get_sql_chain()
+    if temperature not in _candidate_chains:
+        _candidate_chains[temperature] = LLMChain(llm=get_llm(temperature), prompt=custom_prompt, verbose=LLM_VERBOSE)
+    return _candidate_chains[temperature]
+
+
+def get_streaming_chain() -> LLMChain:
+    global streaming_chain
+    if streaming_chain is None:
+        streaming_chain = LLMChain(llm=get_llm(streaming=True), prompt=custom_prompt)
+    return streaming_chain
+
+
+def get_repair_chain() -> LLMChain:
+    global repair_chain
+    if repair_chain is None:
+        repair_chain = LLMChain(llm=get_llm(), prompt=repair_prompt, verbose=LLM_VERBOSE)
+    return repair_chain
+
+
+def _clean_sql(text: str) -> str:
+    return (text or "").strip().strip("```sql").strip("```").strip()
+
+
+def _finish_generation(output: dict, job: dict) -> dict:
+    sql = _clean_sql(output.get("text", ""))
+    if not sql:
+        return {"type": "error", "error": "Failed to generate SQL."}
+
+    # Not cached here: the caller remembers it once it has executed (remember_generated_sql)
+    return {
+        "type": "query_result",
+        "sql": sql,
+        "cached": False,
+        "path": "llm",
+        "prompt": job["prompt"]
+    }
+
+
+def generate_sql_response(question: str) -> dict:
+    try:
+        response, job = _prepare_generation(question)
+        if response is not None:
+            return response
+        output = get_sql_chain().invoke(job["inputs"])
+        return _finish_generation(output, job)
+
+    except Exception as e:
+        return {"type": "error", "error": str(e)}
+
+
+async def agenerate_sql_response(question: str) -> dict:
+    """Async variant of generate_sql_response; the LLM call does not hold a worker thread."""
+    try:
+        response, job = _prepare_generation(question)
+        if response is not None:
+            return response
+        async with get_llm_semaphore():
+            output = await get_sql_chain().ainvoke(job["inputs"])
+        return _finish_generation(output, job)
+
+    except Exception as e:
+        return {"type": "error", "error": str(e)}
+
+
+async def agenerate_sql_candidates(question: str, n: Optional[int] = None) -> List[dict]:
+    """
+    Speculative mode of agenerate_sql_response: ``n`` (default SQL_CANDIDATES) LLM candidates
+    generated concurrently at different temperatures, duplicates dropped. Compiler and cache
+    answers come back alone. Nothing is cached until the chosen one executes (remember_generated_sql).
+    """
+    n = n or SQL_CANDIDATES
+    if n <= 1:
+        return [await agenerate_sql_response(question)]
+    try:
+        response, job = _prepare_generation(question)
+        if response is not None:
+            return [response]
+        temperatures = [SQL_CANDIDATE_TEMPERATURES[i % len(SQL_CANDIDATE_TEMPERATURES)] for i in range(n)]
+
+        async def generate(temperature: float) -> dict:
+            async with get_llm_semaphore():
+                return await get_candidate_chain(temperature).ainvoke(job["inputs"])
+
+        outputs = await asyncio.gather(*(generate(t) for t in temperatures), return_exceptions=True)
+        candidates, seen = [], set()
+        for temperature, output in zip(temperatures, outputs):
+            if isinstance(output, BaseException):
+                continue
+            result = _finish_generation(output, job)
+            if result["type"] == "error" or result["sql"] in seen:
+                continue
+            seen.add(result["sql"])
+            candidates.append({**result, "temperature": temperature})
+        if not candidates:
+            errors = [str(o) for o in outputs if isinstance(o, BaseException)]
+            return [{"type": "error", "error": errors[0] if errors else "Failed to generate SQL."}]
+        return candidates
+
+    except Exception as e:
+        return [{"type": "error", "error": str(e)}]
+
+
+class _TokenQueue(AsyncCallbackHandler):
+    """Forwards LLM tokens to an asyncio.Queue as they are generated."""
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        await self.queue.put(token)
+
+
+_STREAM_DONE = object()
+
+
+async def astream_sql_response(question: str) -> AsyncIterator[tuple]:
+    """
+    Streaming variant of agenerate_sql_response for /query/events. Yields ("stage", name)
+    as the pipeline advances, ("token", text) as the LLM writes the SQL, and finally
+    ("result", response) with the same dict agenerate_sql_response returns.
+    """
+    try:
+        yield ("stage", "retrieving_schema")
+        response, job = _prepare_generation(question)
+        if response is not None:
+            yield ("result", response)
+            return
+        yield ("stage", "generating")
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def generate() -> dict:
+            try:
+                async with get_llm_semaphore():
+                    return await get_streaming_chain().ainvoke(
+                        job["inputs"], config={"callbacks": [_TokenQueue(queue)]}
+                    )
+            finally:
+                await queue.put(_STREAM_DONE)
+
+        task = asyncio.ensure_future(generate())
+        try:
+            while True:
+                token = await queue.get()
+                if token is _STREAM_DONE:
+                    break
+                yield ("token", token)
+            output = await task
+        finally:
+            # The consumer went away mid-stream (e.g. the client disconnected)
+            if not task.done():
+                task.cancel()
+        yield ("result", _finish_generation(output, job))
+
+    except Exception as e:
+        yield ("result", {"type": "error", "error": str(e)})
+
+
+def remember_generated_sql(question: str, sql: str) -> None:
+    get_source_state().generation_cache.set(generation_cache_key(question, infer_sql_dialect()), sql)
+
+
+async def arepair_sql_response(question: str, failed_sql: str, error: str) -> dict:
+    """One LLM round trip that fixes SQL the database refused, given its error message."""
+    try:
+        dialect = infer_sql_dialect()
+        table_info, _ = build_table_info(question)
+        async with get_llm_semaphore():
+            output = await get_repair_chain().ainvoke({
+                "question": question,
+                "table_info": table_info,
+                "dialect": dialect,
+                "dialect_notes": dialect_notes(dialect),
+                "sql": failed_sql,
+                "error": error[:1000],
+            })
+        sql = _clean_sql(output.get("text", ""))
+        if not sql:
+            return {"type": "error", "error": "Failed to repair SQL."}
         return {
             "type": "query_result",
-            "sql": sql
+            "sql": sql,
+            "cached": False,
+            "path": "repair",
+            "repaired_from": failed_sql,
         }
 
     except Exception as e:
         return {"type": "error", "error": str(e)}
 
 
-def get_semantic_layer() -> dict:
-    return semantic_layer
+# Warm-up at startup: "preload" loads the Ollama model into memory (no tokens generated),
+# "ping" sends a one-token request to any provider, "none" only builds the chains
+LLM_WARMUP = os.getenv("LLM_WARMUP", "").lower()
+
+
+def _preload_ollama(model: str) -> None:
+    base_url = (os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434").rstrip("/")
+    payload = {"model": model}
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    request = urllib.request.Request(
+        base_url + "/api/generate",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    # An empty prompt makes Ollama load the model and return
+    with urllib.request.urlopen(request, timeout=float(os.getenv("LLM_WARMUP_TIMEOUT", "120"))) as response:
+        response.read()
 
 
-def set_semantic_layer(new_layer: dict) -> None:
-    global semantic_layer, semantic_knowledge
-    semantic_layer = new_layer or {"tables": {}}
-    semantic_knowledge = format_semantic_layer(semantic_layer)
+def warm_up_generation() -> dict:
+    """
+    Does the one-time work the first question would otherwise pay for: importing the
+    provider, building the chains, the metric index and the token encoder, and optionally
+    getting the model ready (LLM_WARMUP). Returns seconds (and any error) per step.
+    """
+    timings = {}
 
+    def step(name: str, fn) -> None:
+        started = time.perf_counter()
+        try:
+            fn()
+            timings[name] = {"seconds": round(time.perf_counter() - started, 4)}
+        except Exception as e:
+            # The first real request retries whatever failed here
+            timings[name] = {"seconds": round(time.perf_counter() - started, 4), "error": str(e)}
 
-def reload_semantic_layer() -> dict:
-    new_layer = _load_semantic_layer_from_disk()
-    set_semantic_layer(new_layer)
-    return semantic_layer
+    provider, model = get_llm_settings()
+    mode = LLM_WARMUP or ("preload" if provider == "ollama" else "none")
+    step("chains", lambda: (get_sql_chain(), get_streaming_chain()))
+    step("metric_index", get_metric_index)
+    step("token_encoder", get_encoding)
+    if mode == "preload" and provider == "ollama":
+        step("llm_preload", lambda: _preload_ollama(model))
+    elif mode in ("ping", "preload"):
+        step("llm_ping", lambda: get_sql_chain().llm.invoke("Reply with OK."))
+    return timings
 
 
-def suggest_semantic_layer_from_schema(db_schema: dict) -> dict:
+def get_semantic_layer(source: Optional[str] = None) -> dict:
+    """The layer of the request's snapshot; shared, so treat it as read-only."""
+    return get_semantic_snapshot(source).layer
+
+
+def get_semantic_layer_version(source: Optional[str] = None) -> str:
+    return get_semantic_snapshot(source).version
+
+
+def set_semantic_layer(new_layer: dict, source: Optional[str] = None) -> SemanticSnapshot:
+    # Cache keys carry the content hash, so entries for the old layer simply stop matching
+    return get_source_state(source).swap(lambda current: SemanticSnapshot(new_layer, current.db_schema))
+
+
+def reload_semantic_layer(source: Optional[str] = None) -> dict:
+    state = get_source_state(source)
+    state.file_signature = file_signature(state.semantic_layer_path)
+    return set_semantic_layer(load_semantic_layer_file(state.semantic_layer_path), source).layer
+
+
+def reload_changed_semantic_layers() -> List[str]:
     """
-    Given a schema like { tables: { table: { columns: [{name, type}], primary_key: [], foreign_keys: [] } } },
-    ask the LLM to propose a semantic layer with synonyms and candidate metrics.
-    """
-    llm = get_llm()
-    prompt = PromptTemplate(
-        input_variables=["schema", "dialect"],
-        template="""
-You are an analytics engineer. Based on the following database schema and SQL dialect, propose a compact semantic layer in JSON with the structure:
-{
-  "tables": {
-    "<table>": {
-      "columns": {
+    Polled by the file watcher: reloads each loaded source whose semantic layer file
+    changed on disk and returns their names. A file caught mid-write (invalid JSON) is
+    retried on the next poll; a rewrite with identical content keeps the current snapshot.
+    """
+    reloaded = []
+    for name, state in list(_source_states.items()):
+        signature = file_signature(state.semantic_layer_path)
+        if signature is None or signature == state.file_signature:
+            continue
+        try:
+            layer = load_semantic_layer_file(state.semantic_layer_path)
+        except ValueError:
+            continue
+        state.file_signature = signature
+        if hash_semantic_layer(layer) == state.snapshot.version:
+            continue
+        state.swap(lambda current: SemanticSnapshot(layer, current.db_schema))
+        reloaded.append(name)
+    return reloaded
+
+
+# /semantic/suggest describes a large schema a few tables per prompt, several prompts at once
+SEMANTIC_SUGGEST_CHUNK_TABLES = int(os.getenv("SEMANTIC_SUGGEST_CHUNK_TABLES", "6"))
+SEMANTIC_SUGGEST_CHUNK_TOKENS = int(os.getenv("SEMANTIC_SUGGEST_CHUNK_TOKENS", "2000"))
+SEMANTIC_SUGGEST_CONCURRENCY = int(os.getenv("SEMANTIC_SUGGEST_CONCURRENCY", "0"))  # 0: the provider's LLM concurrency
+_suggest_rate_limiter = RateLimiter(float(os.getenv("SEMANTIC_SUGGEST_RPM", "0")))
+# Per table, keyed on a hash of its definition (see table_fingerprint), so unchanged tables are never re-asked
+_suggestion_cache = TTLCache(max_entries=int(os.getenv("SEMANTIC_SUGGEST_CACHE_MAX_ENTRIES", "4096")), ttl=0)
+
+suggest_prompt = PromptTemplate(
+    input_variables=["schema", "dialect"],
+    template="""
+You are an analytics engineer. Based on the following database tables and SQL dialect, propose a compact semantic layer in JSON with the structure:
+{{
+  "tables": {{
+    "<table>": {{
+      "columns": {{
         "<column>": ["synonym1", "synonym2"]
-      },
-      "metrics": {
+      }},
+      "metrics": {{
         "<metric_name>": "<SQL aggregation expression using this table>"
-      }
-    }
-  }
-}
+      }}
+    }}
+  }}
+}}
 
 Rules:
 - Only output valid JSON. Do not include markdown fences or explanations.
+- Describe every table listed below, and only those tables.
 - Prefer intuitive synonyms for business users.
 - For numeric columns, propose a few useful SUM/AVG metrics where it makes sense.
 - Use the {dialect} dialect when writing metric SQL expressions (no schema qualifiers).
 
-Schema:
+Tables:
 {schema}
 """,
-    )
+)
 
-    chain = LLMChain(llm=llm, prompt=prompt, verbose=False)
-    raw = chain.invoke({
-        "schema": json.dumps(db_schema, indent=2),
-        "dialect": infer_sql_dialect(),
-    })
-    text = raw.get("text", "").strip()
-    # Clean common wrappers
-    if text.startswith("```"):
-        text = text.strip("`\n ")
-        if text.lower().startswith("json"):
-            text = text[4:].strip()
-    try:
-        proposed = json.loads(text)
-        # minimal validation
-        if not isinstance(proposed, dict) or "tables" not in proposed:
-            raise ValueError("Invalid shape")
-        return proposed
-    except Exception:
-        # Fallback minimal layer based on schema
-        fallback = {"tables": {}}
-        for table, tdef in db_schema.get("tables", {}).items():
-            cols = {c["name"]: [] for c in tdef.get("columns", [])}
-            fallback["tables"][table] = {"columns": cols, "metrics": {}}
-        return fallback
+
+async def asuggest_semantic_layer_from_schema(db_schema: dict) -> tuple:
+    """
+    Given a schema like { tables: { table: { columns: [{name, type}], primary_key: [], foreign_keys: [] } } },
+    asks the LLM to propose a semantic layer with synonyms and candidate metrics.
+
+    Tables are described in chunks (FK clusters, capped by SEMANTIC_SUGGEST_CHUNK_TABLES and
+    SEMANTIC_SUGGEST_CHUNK_TOKENS) that run concurrently under SEMANTIC_SUGGEST_RPM, and each
+    table's suggestion is cached, so only new or changed tables cost an LLM call. A table
+    whose chunk fails keeps its bare columns. Returns (layer, report).
+    """
+    tables = db_schema.get("tables", {})
+    provider, model = get_llm_settings()
+    dialect = infer_sql_dialect()
+    keys = {table: table_fingerprint(table, tdef, dialect, f"{provider}:{model}") for table, tdef in tables.items()}
+    entries = {}
+    for table, key in keys.items():
+        cached = _suggestion_cache.get(key)
+        if cached is not None:
+            entries[table] = copy.deepcopy(cached)
+    missing = [table for table in tables if table not in entries]
+    chunks = chunk_tables(db_schema, missing, SEMANTIC_SUGGEST_CHUNK_TABLES, SEMANTIC_SUGGEST_CHUNK_TOKENS)
+    report = {"tables": len(tables), "cached_tables": len(entries), "llm_calls": len(chunks), "failed_tables": []}
+    if not chunks:
+        return merge_suggestions(db_schema, entries), report
+
+    chain = LLMChain(llm=get_llm(), prompt=suggest_prompt, verbose=False)
+    semaphore = asyncio.Semaphore(SEMANTIC_SUGGEST_CONCURRENCY or get_llm_concurrency(provider))
+
+    async def suggest(chunk: List[str]) -> dict:
+        async with semaphore:
+            await _suggest_rate_limiter.wait()
+            raw = await chain.ainvoke({
+                "schema": json.dumps({"tables": {t: tables[t] for t in chunk}}, indent=2),
+                "dialect": dialect,
+            })
+        return parse_suggestion(raw.get("text", ""), chunk)
+
+    outputs = await asyncio.gather(*(suggest(chunk) for chunk in chunks), return_exceptions=True)
+    for chunk, output in zip(chunks, outputs):
+        suggested = output if isinstance(output, dict) else {}
+        for table in chunk:
+            if table in suggested:
+                entries[table] = suggested[table]
+                _suggestion_cache.set(keys[table], copy.deepcopy(suggested[table]))
+            else:
+                # Not cached, so the next suggest run asks again
+                report["failed_tables"].append(table)
+    return merge_suggestions(db_schema, entries), report
+
+
+def suggest_semantic_layer_from_schema(db_schema: dict) -> dict:
+    layer, _ = asyncio.run(asuggest_semantic_layer_from_schema(db_schema))
+    return layer
+
+
+def get_suggestion_cache_stats() -> dict:
+    return _suggestion_cache.stats()
 
 
 def save_semantic_layer_to_disk(path: Optional[str] = None) -> str:
-    target_path = path or SEMANTIC_LAYER_PATH
+    state = get_source_state()
+    target_path = path or state.semantic_layer_path
     os.makedirs(os.path.dirname(target_path), exist_ok=True)
     with open(target_path, "w") as f:
-        json.dump(semantic_layer, f, indent=2)
+        json.dump(get_semantic_snapshot().layer, f, indent=2)
+    if target_path == state.semantic_layer_path:
+        # Our own write; nothing for the watcher to reload
+        state.file_signature = file_signature(target_path)
     return target_path
@@ -0,0 +1,266 @@
+"""
+Offline end-to-end load test. Generates (or reuses) a synthetic star schema, runs the app
+in-process against it with the replay LLM (backend/replay_llm.py) standing in for the
+model, and drives /query, /schema and /freshness with concurrent clients. It reports
+throughput and p50/p95/p99 latency per endpoint and per pipeline stage, the stages coming
+from each response's Server-Timing header. Nothing leaves the machine.
+
+    python -m backend.load_test                                   # 10K fact rows, 8 clients
+    python -m backend.load_test --fact-rows 1000000 --clients 32 --requests 2000
+    python -m backend.load_test --no-caches --llm-latency-ms 400  # every question pays for "the LLM"
+    python -m backend.load_test --json > run.json                 # for comparing runs
+
+Progress goes to stderr, so stdout carries only the report.
+
+The default database is a SQLite file per scale under the temp directory, generated on
+first use; pass --db-url to run against PostgreSQL (or any other SQLAlchemy URL).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+
+from .synthetic_star import fact_row_count, generate
+
+# Questions the metric compiler answers, next to the replay LLM's canned ones
+COMPILER_QUESTIONS = ["total revenue by year", "total units sold by quarter", "total revenue by dealer"]
+DEFAULT_MIX = "query=8,schema=1,freshness=1"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (which need not be sorted)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct * len(ordered) / 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """{stage: milliseconds} from ``llm;dur=812.4, db_execute;dur=12.1``."""
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                timings[name] = float(value)
+    return timings
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    unknown = set(weights) - {"query", "schema", "freshness"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in --mix: {sorted(unknown)}")
+    return weights
+
+
+def prepare_database(db_url: str, fact_rows: int, regenerate: bool, seed: int) -> None:
+    engine = create_engine(db_url)
+    try:
+        existing = fact_row_count(engine)
+        if existing == fact_rows and not regenerate:
+            print(f"✅ Reusing {db_url} ({existing:,} fact rows)", file=sys.stderr)
+            return
+        print(f"📥 Generating {fact_rows:,} fact rows into {db_url}", file=sys.stderr)
+        started = time.perf_counter()
+        generate(engine, fact_rows, seed)
+        print(f"✅ Generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        engine.dispose()
+
+
+def configure_environment(args, workdir: str) -> None:
+    """Everything backend.main reads at import time; must run before it is imported."""
+    os.environ.update({
+        "DB_URL": args.db_url,
+        "LLM_PROVIDER": "replay",
+        "LLM_REPLAY_LATENCY_MS": str(args.llm_latency_ms),
+        "USERS_DB_PATH": os.path.join(workdir, "users.db"),
+        "QUERY_LOG_PATH": os.path.join(workdir, "query_log.jsonl"),
+        "WARMUP_ENABLED": "true" if args.warmup else "false",
+        "SEMANTIC_WATCH_ENABLED": "false",
+    })
+    os.environ.pop("DATA_SOURCES_PATH", None)
+    if args.no_caches:
+        os.environ.update({"SIMILARITY_CACHE_ENABLED": "false", "RESULT_CACHE_ENABLED": "false"})
+
+
+def build_plan(args) -> List[tuple]:
+    """The (endpoint, question) sequence the clients work through, fixed by --seed."""
+    from .replay_llm import load_replay_pairs
+
+    rng = random.Random(args.seed)
+    weights = parse_mix(args.mix)
+    endpoints = [name for name, weight in weights.items() for _ in range(weight)]
+    questions = list(load_replay_pairs()) + COMPILER_QUESTIONS
+    plan = []
+    for i in range(args.requests):
+        endpoint = rng.choice(endpoints)
+        question = rng.choice(questions) if endpoint == "query" else None
+        if question is not None and args.no_caches:
+            # A distinct question per request also defeats the generation cache; the replay
+            # LLM still recognises the canned question inside it
+            question = f"{question} (request {i})"
+        plan.append((endpoint, question))
+    return plan
+
+
+async def run_load(args, plan: List[tuple]) -> tuple:
+    import httpx
+    from . import main as app_module
+
+    app = app_module.app
+    samples: List[dict] = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            await client.post("/auth/register", json={"username": "load", "password": "load"})
+            login = await client.post("/auth/login", json={"username": "load", "password": "load"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+            if args.warmup:
+                while (await client.get("/ready")).status_code != 200:
+                    await asyncio.sleep(0.05)
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for item in plan:
+                queue.put_nowait(item)
+
+            async def worker() -> None:
+                while True:
+                    try:
+                        endpoint, question = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    started = time.perf_counter()
+                    if endpoint == "query":
+                        response = await client.post("/query", json={"question": question}, headers=headers)
+                    else:
+                        response = await client.get(f"/{endpoint}", headers=headers)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    ok = response.status_code == 200
+                    path = None
+                    if ok and endpoint == "query":
+                        body = response.json()
+                        ok = body.get("success", False) and body["response"].get("type") != "error"
+                        path = body.get("response", {}).get("path")
+                    samples.append({
+                        "endpoint": endpoint,
+                        "ms": elapsed,
+                        "ok": ok,
+                        "path": path,
+                        "stages": parse_server_timing(response.headers.get("server-timing")),
+                    })
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.clients)))
+            wall = time.perf_counter() - started
+    return samples, wall
+
+
+def summarize(samples: List[dict], wall: float) -> dict:
+    def stats(values: List[float]) -> dict:
+        return {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "mean_ms": round(statistics.fmean(values), 2),
+        }
+
+    report = {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not s["ok"]),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 1) if wall else None,
+        "endpoints": {},
+        "stages": {},
+        "query_paths": {},
+    }
+    for endpoint in sorted({s["endpoint"] for s in samples}):
+        rows = [s for s in samples if s["endpoint"] == endpoint]
+        report["endpoints"][endpoint] = {
+            **stats([s["ms"] for s in rows]),
+            "errors": sum(1 for s in rows if not s["ok"]),
+            "throughput_rps": round(len(rows) / wall, 1) if wall else None,
+        }
+    stage_values: Dict[str, List[float]] = {}
+    for sample in samples:
+        if sample["endpoint"] != "query":
+            continue
+        for stage, ms in sample["stages"].items():
+            stage_values.setdefault(stage, []).append(ms)
+        if sample["path"]:
+            report["query_paths"][sample["path"]] = report["query_paths"].get(sample["path"], 0) + 1
+    report["stages"] = {stage: stats(values) for stage, values in sorted(stage_values.items())}
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"🏁 {report['requests']} requests in {report['wall_seconds']:.2f}s "
+        f"({report['throughput_rps']} req/s), {report['errors']} errors"
+    )
+    print(f"{'endpoint':<16}{'count':>7}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}")
+    for name, row in report["endpoints"].items():
+        print(
+            f"{name:<16}{row['count']:>7}{row['throughput_rps']:>9}{row['p50_ms']:>8.1f}ms"
+            f"{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms{row['errors']:>8}"
+        )
+    print(f"{'/query stage':<16}{'count':>7}{'':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, row in report["stages"].items():
+        print(f"{name:<16}{row['count']:>7}{'':>9}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms")
+    if report["query_paths"]:
+        print("   paths: " + ", ".join(f"{path} {count}" for path, count in sorted(report["query_paths"].items())))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test with a replay LLM and a synthetic star schema.")
+    parser.add_argument("--fact-rows", type=int, default=10000, help="Scale of the synthetic revenue table")
+    parser.add_argument("--db-url", help="Database to generate into and query (default: a SQLite file per scale)")
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild the data even if the scale matches")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests across clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Simulated latency of each LLM call")
+    parser.add_argument("--no-caches", action="store_true", help="Disable the similarity/result caches and vary every question")
+    parser.add_argument("--warmup", action="store_true", help="Run the startup warm-up and wait for /ready first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    args.db_url = args.db_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), f'text_to_sql_star_{args.fact_rows}.db')}"
+    try:
+        plan = build_plan(args)
+        prepare_database(args.db_url, args.fact_rows, args.regenerate, args.seed)
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        print(f"📥 {len(plan)} requests from {args.clients} clients (LLM latency {args.llm_latency_ms:.0f}ms)", file=sys.stderr)
+        samples, wall = asyncio.run(run_load(args, plan))
+
+    report = summarize(samples, wall)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if report["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Embedded engine over the star-schema files in data/processed, for dev, CI and edge
+deployments without a PostgreSQL server. Point a data source at it with
+
+    DB_URL=local:///data/processed          # or "local://" for the default directory
+
+With DuckDB installed (``pip install duckdb duckdb-engine``) every CSV becomes a view that
+DuckDB scans in place, preferring a Parquet conversion of the file when one sits next to
+it, so there is no load step. Without DuckDB the files are copied once into a SQLite
+cache database, which is rebuilt for a table only when its file changes.
+
+    python -m backend.local_engine --to-parquet       # write <table>.parquet next to each CSV
+    python -m backend.local_engine --describe
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+try:
+    import duckdb
+except ImportError:  # falls back to the SQLite cache
+    duckdb = None  # type: ignore
+
+try:
+    import duckdb_engine  # the SQLAlchemy dialect; DuckDB alone is not enough
+except ImportError:
+    duckdb_engine = None  # type: ignore
+
+LOCAL_SCHEME = "local"
+DEFAULT_DATA_DIR = "data/processed"
+# File stems that do not match their table name
+TABLE_NAME_OVERRIDES = {"procduct": "product"}
+
+
+def is_local_url(db_url: str) -> bool:
+    return db_url.split("://", 1)[0].lower() == LOCAL_SCHEME
+
+
+def data_dir_for(db_url: str) -> str:
+    """local:///data/processed -> data/processed (relative to the working directory, like SQLite URLs)."""
+    path = db_url.split("://", 1)[1] if "://" in db_url else ""
+    path = path[1:] if path.startswith("/") else path
+    return path or os.getenv("LOCAL_DATA_DIR", DEFAULT_DATA_DIR)
+
+
+def local_backend() -> str:
+    """LOCAL_ENGINE=duckdb|sqlite; by default DuckDB when it and its SQLAlchemy dialect are installed."""
+    wanted = os.getenv("LOCAL_ENGINE", "auto").lower()
+    if wanted == "duckdb" and (duckdb is None or duckdb_engine is None):
+        raise RuntimeError("LOCAL_ENGINE=duckdb but duckdb or duckdb-engine is not installed; pip install duckdb duckdb-engine")
+    if wanted in ("duckdb", "sqlite"):
+        return wanted
+    return "duckdb" if duckdb is not None and duckdb_engine is not None else "sqlite"
+
+
+def normalize_identifier(name: str) -> str:
+    """Branch_ID -> branch_id, Date_ID.1 -> date_id_1; keywords are kept as they are (year)."""
+    name = re.sub(r"[^0-9a-zA-Z_]+", "_", name.strip()).strip("_").lower()
+    return f"_{name}" if not name or name[0].isdigit() else name
+
+
+def discover_tables(data_dir: str) -> Dict[str, str]:
+    """
+    {table: file} for the CSVs in data_dir, with <stem>.parquet used instead of <stem>.csv
+    when it exists and is at least as new.
+    """
+    tables = {}
+    for entry in sorted(os.listdir(data_dir)):
+        stem, ext = os.path.splitext(entry)
+        if ext.lower() != ".csv":
+            continue
+        path = os.path.join(data_dir, entry)
+        parquet = os.path.join(data_dir, stem + ".parquet")
+        if os.path.exists(parquet) and os.path.getmtime(parquet) >= os.path.getmtime(path):
+            path = parquet
+        tables[TABLE_NAME_OVERRIDES.get(stem.lower(), normalize_identifier(stem))] = path
+    return tables
+
+
+def _select_sql(path: str) -> str:
+    """
+    SELECT over a data file with its columns named by normalize_identifier, as in the SQLite
+    cache. (DuckDB's own normalize_names also prefixes keywords: year becomes _year.) Parquet
+    files were written from this SELECT, so their names are already normalized.
+    """
+    quoted = path.replace("'", "''")
+    if path.endswith(".parquet"):
+        return f"SELECT * FROM read_parquet('{quoted}')"
+    with open(path, newline="") as f:
+        header = next(csv.reader(f), [])
+    columns = ", ".join(
+        '"{}" AS "{}"'.format(name.replace('"', '""'), normalize_identifier(name)) for name in header
+    )
+    return f"SELECT {columns or '*'} FROM read_csv_auto('{quoted}', header = true)"
+
+
+def create_duckdb_engine(data_dir: str) -> Engine:
+    """
+    A DuckDB database with a view per file, through the duckdb-engine dialect. By default it
+    is a named in-memory database, which every connection of this process opens, so pooled
+    connections share it (and any rollup tables created later). The views are (re)created
+    on each new connection, which also brings them back if the pool ever let go of the
+    database entirely.
+    """
+    default = f":memory:text_to_sql_{hashlib.sha256(os.path.abspath(data_dir).encode('utf-8')).hexdigest()[:12]}"
+    engine = create_engine(f"duckdb:///{os.getenv('LOCAL_DUCKDB_PATH', default)}", pool_pre_ping=True)
+    statements = [
+        f'CREATE OR REPLACE VIEW "{table}" AS {_select_sql(os.path.abspath(path))}'
+        for table, path in discover_tables(data_dir).items()
+    ]
+    threads = os.getenv("LOCAL_DUCKDB_THREADS")
+    if threads:
+        statements.insert(0, f"SET threads = {int(threads)}")
+    # Concurrent catalog writes from two new connections would conflict
+    lock = threading.Lock()
+
+    @event.listens_for(engine, "connect")
+    def _create_views(dbapi_connection, _record) -> None:
+        with lock:
+            for statement in statements:
+                dbapi_connection.execute(statement)
+
+    return engine
+
+
+def _file_signature(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _sqlite_cache_path(data_dir: str) -> str:
+    default = os.path.join(
+        tempfile.gettempdir(),
+        f"text_to_sql_local_{hashlib.sha256(os.path.abspath(data_dir).encode('utf-8')).hexdigest()[:12]}.db",
+    )
+    return os.getenv("LOCAL_SQLITE_PATH", default)
+
+
+def _infer_sqlite_type(values: list) -> str:
+    kinds = set()
+    for value in values:
+        if value == "":
+            continue
+        try:
+            int(value)
+            kinds.add("INTEGER")
+            continue
+        except ValueError:
+            pass
+        try:
+            float(value)
+            kinds.add("REAL")
+        except ValueError:
+            return "TEXT"
+    if kinds == {"INTEGER"}:
+        return "INTEGER"
+    return "REAL" if kinds else "TEXT"
+
+
+def _load_csv_into_sqlite(conn, table: str, path: str, sample_rows: int = 1000) -> int:
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = [normalize_identifier(h) for h in next(reader)]
+        rows = list(reader)
+    types = [_infer_sqlite_type([row[i] for row in rows[:sample_rows] if i < len(row)]) for i in range(len(header))]
+    columns = ", ".join(f'"{name}" {col_type}' for name, col_type in zip(header, types))
+    conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{table}"')
+    conn.exec_driver_sql(f'CREATE TABLE "{table}" ({columns})')
+    placeholders = ", ".join("?" for _ in header)
+    width = len(header)
+    # SQLite's type affinity turns the numeric-looking strings into INTEGER/REAL
+    conn.exec_driver_sql(
+        f'INSERT INTO "{table}" VALUES ({placeholders})',
+        [tuple(value if value != "" else None for value in (row + [""] * width)[:width]) for row in rows],
+    )
+    return len(rows)
+
+
+_sqlite_sync_lock = threading.Lock()
+
+
+def sync_sqlite_cache(data_dir: str, path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Brings the SQLite cache in line with the CSVs; returns {table: rows} for the tables
+    it (re)loaded. Unchanged files, by mtime and size, are skipped.
+    """
+    path = path or _sqlite_cache_path(data_dir)
+    # Which file version each table was loaded from; kept beside the database so it does
+    # not show up in schema introspection
+    manifest_path = path + ".json"
+    engine = create_engine(f"sqlite:///{path}")
+    loaded = {}
+    with _sqlite_sync_lock:
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        with engine.begin() as conn:
+            existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table, file in discover_tables(data_dir).items():
+                if not file.endswith(".csv"):
+                    # Parquet needs pyarrow or DuckDB; the CSV it was converted from is equivalent
+                    file = os.path.splitext(file)[0] + ".csv"
+                signature = [os.path.abspath(file), _file_signature(file)]
+                if table in existing and manifest.get(table) == signature:
+                    continue
+                loaded[table] = _load_csv_into_sqlite(conn, table, file)
+                manifest[table] = signature
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    engine.dispose()
+    return loaded
+
+
+def create_sqlite_engine(data_dir: str) -> Engine:
+    path = _sqlite_cache_path(data_dir)
+    sync_sqlite_cache(data_dir, path)
+    return create_engine(f"sqlite:///{path}", pool_pre_ping=True)
+
+
+def create_local_engine(db_url: str) -> Engine:
+    data_dir = data_dir_for(db_url)
+    if not os.path.isdir(data_dir):
+        raise FileNotFoundError(f"Local data directory {data_dir!r} does not exist")
+    if local_backend() == "duckdb":
+        return create_duckdb_engine(data_dir)
+    return create_sqlite_engine(data_dir)
+
+
+def convert_to_parquet(data_dir: str) -> Dict[str, str]:
+    """Writes <stem>.parquet next to each CSV (DuckDB only); returns {table: parquet path}."""
+    if duckdb is None:
+        raise RuntimeError("Parquet conversion needs duckdb; pip install duckdb")
+    written = {}
+    database = duckdb.connect()
+    for entry in sorted(os.listdir(data_dir)):
+        stem, ext = os.path.splitext(entry)
+        if ext.lower() != ".csv":
+            continue
+        source = os.path.join(data_dir, entry)
+        target = os.path.join(data_dir, stem + ".parquet")
+        quoted = target.replace("'", "''")
+        database.execute(f"COPY ({_select_sql(source)}) TO '{quoted}' (FORMAT parquet)")
+        written[TABLE_NAME_OVERRIDES.get(stem.lower(), normalize_identifier(stem))] = target
+    database.close()
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Embedded DuckDB/SQLite engine over data/processed.")
+    parser.add_argument("--data-dir", default=os.getenv("LOCAL_DATA_DIR", DEFAULT_DATA_DIR))
+    parser.add_argument("--to-parquet", action="store_true", help="Convert every CSV to Parquet (needs duckdb)")
+    parser.add_argument("--describe", action="store_true", help="List the tables and their row counts")
+    args = parser.parse_args(argv)
+
+    if args.to_parquet:
+        try:
+            for table, path in convert_to_parquet(args.data_dir).items():
+                print(f"✅ {table} → {path}")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return 1
+
+    print(f"📥 Opening {args.data_dir} with {local_backend()}")
+    started = time.perf_counter()
+    engine = create_local_engine(f"{LOCAL_SCHEME}:///{args.data_dir}")
+    print(f"✅ Ready in {time.perf_counter() - started:.2f}s")
+    if args.describe:
+        with engine.connect() as conn:
+            for table, path in discover_tables(args.data_dir).items():
+                rows = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                print(f"   {table}: {rows} rows from {os.path.basename(path)}")
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,74 @@
 import os
+import json
+import asyncio
 import sqlite3
+import math
+import time
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterator, List, Optional
 
 import jwt
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from .langchain_agent import (
     generate_sql_response,
+    agenerate_sql_candidates,
+    astream_sql_response,
+    arepair_sql_response,
+    remember_generated_sql,
     get_semantic_layer,
     set_semantic_layer,
     reload_semantic_layer,
-    suggest_semantic_layer_from_schema,
+    asuggest_semantic_layer_from_schema,
+    get_suggestion_cache_stats,
     save_semantic_layer_to_disk,
+    get_generation_cache_stats,
+    generation_cache_stats_by_source,
+    get_semantic_layer_version,
+    get_semantic_snapshot,
+    pin_semantic_snapshot,
+    reload_changed_semantic_layers,
+    set_db_schema,
+    normalize_question,
+    warm_up_generation,
 )
+from .data_sources import UnknownDataSource, current_source, get_data_sources
+from .metrics import (
+    QUERY_PATHS,
+    REQUEST_SECONDS,
+    current_timings,
+    registry as metrics_registry,
+    server_timing_header,
+    start_request_timings,
+    timed,
+)
+from .question_index import SimilarityCache, build_similarity_cache
+from .query_log import QueryLog, build_query_log
+from .response_encoding import (
+    JSON_MEDIA_TYPE,
+    column_types,
+    compress,
+    encode_payload,
+    encoding_stats,
+    json_value,
+    negotiate_encoding,
+    negotiate_media_type,
+)
+from .result_cache import ResultCache, build_result_cache
+from .rollups import RollupRouter, refresh_rollups
+from .schema_snapshot import SchemaSnapshotService, probe_freshness
+from .sql_guard import SQLGuard, SQLRejected, build_sql_guard
 from passlib.context import CryptContext
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.engine import Engine
+try:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+except ImportError:  # greenlet missing; the async path falls back to threads
+    AsyncEngine = None  # type: ignore
 
 app = FastAPI()
 
@@ -33,8 +84,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Per-request latency histogram, and a Server-Timing header with the time spent in each
+    pipeline stage (prompt, llm, plan, db_execute, db_fetch, serialize, ...). Streamed
+    responses send their headers first, so theirs only cover the stages before the body.
+    """
+    started = time.perf_counter()
+    timings = start_request_timings()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-prod")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
@@ -47,6 +121,10 @@ class QueryRequest(BaseModel):
     question: str
 
 
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+
+
 class RegisterRequest(BaseModel):
     username: str
     password: str
@@ -55,6 +133,8 @@ class RegisterRequest(BaseModel):
 class LoginRequest(BaseModel):
     username: str
     password: str
+    # Binds the token to one data source; without it the token may pick any per request
+    source: Optional[str] = None
 
 
 class TokenResponse(BaseModel):
@@ -96,7 +176,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_username(authorization: Optional[str] = Header(default=None, alias="Authorization")) -> str:
+def get_token_claims(authorization: Optional[str] = Header(default=None, alias="Authorization")) -> dict:
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
     scheme, _, token = authorization.partition(" ")
@@ -104,43 +184,270 @@ def get_current_username(authorization: Optional[str] = Header(default=None, ali
         raise HTTPException(status_code=401, detail="Invalid authorization scheme")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    if not username:
+    if not payload.get("sub"):
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    return username
+    return payload
+
+
+def get_current_username(claims: dict = Depends(get_token_claims)) -> str:
+    return claims["sub"]
+
+
+async def select_data_source(
+    source: Optional[str] = None,
+    x_data_source: Optional[str] = Header(default=None, alias="X-Data-Source"),
+    claims: dict = Depends(get_token_claims),
+) -> str:
+    """
+    Picks the data source for this request: the token's "source" claim when it has one
+    (a different ?source= or X-Data-Source is refused), else the requested one, else the
+    default. Async so the choice lands in the request's context, which the threadpool,
+    background tasks and streaming responses of the request all inherit. The source's
+    current semantic snapshot is pinned there too, so a reload mid-request is not seen.
+    """
+    requested = source or x_data_source
+    bound = claims.get("source")
+    if bound and requested and requested != bound:
+        raise HTTPException(status_code=403, detail=f"Token is bound to data source {bound!r}")
+    try:
+        name = get_data_sources().resolve(bound or requested)
+    except UnknownDataSource:
+        raise HTTPException(status_code=404, detail=f"Unknown data source {bound or requested!r}")
+    current_source.set(name)
+    pin_semantic_snapshot(name)
+    return name
+
+
+def get_engine(source: Optional[str] = None) -> Engine:
+    return get_data_sources().engine(source)
+
 
+def get_async_engine(source: Optional[str] = None) -> Optional["AsyncEngine"]:
+    return get_data_sources().async_engine(source)
 
-_engine: Optional[Engine] = None
 
+def _for_source(store: dict, build, source: Optional[str] = None):
+    """Per-data-source lazy singleton: build(name) runs once per source."""
+    name = get_data_sources().resolve(source)
+    if name not in store:
+        store[name] = build(name)
+    return store[name]
 
-def get_engine() -> Engine:
-    global _engine
-    if _engine is not None:
-        return _engine
 
-    db_url = os.getenv("DB_URL")
-    if not db_url:
-        dbname = os.getenv("PGDATABASE", "your_db_name")
-        user = os.getenv("PGUSER", "your_user")
-        password = os.getenv("PGPASSWORD", "your_password")
-        host = os.getenv("PGHOST", "localhost")
-        port = os.getenv("PGPORT", "5432")
-        db_url = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
+# Reusing SQL across warehouses would be wrong, so each source has its own index
+_similarity_caches: dict = {}
 
-    _engine = create_engine(db_url, pool_pre_ping=True)
-    return _engine
+
+def get_similarity_cache(source: Optional[str] = None) -> Optional[SimilarityCache]:
+    return _for_source(_similarity_caches, lambda name: build_similarity_cache(lambda: get_engine(name)), source)
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_built = False
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    global _result_cache, _result_cache_built
+    if not _result_cache_built:
+        _result_cache = build_result_cache()
+        _result_cache_built = True
+    return _result_cache
+
+
+_query_log: Optional[QueryLog] = None
+_query_log_built = False
+
+
+def get_query_log() -> Optional[QueryLog]:
+    global _query_log, _query_log_built
+    if not _query_log_built:
+        _query_log = build_query_log()
+        _query_log_built = True
+    return _query_log
+
+
+_sql_guard: Optional[SQLGuard] = None
+_sql_guard_built = False
+
+
+def get_sql_guard() -> Optional[SQLGuard]:
+    global _sql_guard, _sql_guard_built
+    if not _sql_guard_built:
+        _sql_guard = build_sql_guard()
+        _sql_guard_built = True
+    return _sql_guard
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_users_db()
+    if WARMUP_ENABLED:
+        # In the background so the server accepts connections (and answers /ready) meanwhile
+        _warmup["task"] = asyncio.ensure_future(warm_up())
+    else:
+        _warmup["ready"] = True
+    if len(get_data_sources().names()) > 1:
+        _pool_evictor["task"] = asyncio.ensure_future(evict_idle_pools())
+    if SEMANTIC_WATCH_ENABLED:
+        _semantic_watcher["task"] = asyncio.ensure_future(watch_semantic_layers())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in (_warmup.get("task"), _pool_evictor.get("task"), _semantic_watcher.get("task")):
+        if task is not None and not task.done():
+            task.cancel()
+    await get_data_sources().dispose_all()
+
+
+DATA_SOURCE_EVICT_INTERVAL = float(os.getenv("DATA_SOURCE_EVICT_INTERVAL", "60"))
+_pool_evictor: dict = {"task": None}
+
+
+async def evict_idle_pools() -> None:
+    """Closes the pools of data sources nobody has queried lately, so memory tracks active tenants."""
+    while True:
+        await asyncio.sleep(DATA_SOURCE_EVICT_INTERVAL)
+        try:
+            await get_data_sources().evict_idle()
+        except Exception:
+            pass
+
+
+SEMANTIC_WATCH_ENABLED = os.getenv("SEMANTIC_WATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_WATCH_INTERVAL = float(os.getenv("SEMANTIC_WATCH_INTERVAL", "2"))
+_semantic_watcher: dict = {"task": None}
+
+
+async def watch_semantic_layers() -> None:
+    """Polls the semantic layer files of loaded sources and swaps in a new snapshot on change."""
+    while True:
+        await asyncio.sleep(SEMANTIC_WATCH_INTERVAL)
+        try:
+            for name in await run_in_threadpool(reload_changed_semantic_layers):
+                _clear_similarity_cache(name)
+        except Exception:
+            pass
+
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Connections opened (then returned to the pool) during warm-up; the default pool holds 5
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+_warmup: dict = {"ready": False, "task": None, "steps": {}, "seconds": None}
+
+
+def _warm_db_pool() -> None:
+    engine = get_engine()
+    connections = []
+    try:
+        for _ in range(max(1, WARMUP_DB_CONNECTIONS)):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+async def _warm_async_pool() -> None:
+    engine = get_async_engine()
+    if engine is None:
+        return
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def warm_up() -> None:
+    """
+    Runs the one-time work of the first /query ahead of it: the DB pools, the schema
+    snapshot, provider imports and chains, the similarity index and the rollup catalog.
+    A failing step is recorded and skipped; the request that needs it retries.
+    """
+    started = time.perf_counter()
+
+    async def step(name: str, fn, *args) -> None:
+        step_started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                await fn(*args)
+            else:
+                await run_in_threadpool(fn, *args)
+            _warmup["steps"][name] = {"seconds": round(time.perf_counter() - step_started, 4)}
+        except Exception as e:
+            _warmup["steps"][name] = {"seconds": round(time.perf_counter() - step_started, 4), "error": str(e)}
+
+    await step("db_pool", _warm_db_pool)
+    await step("async_db_pool", _warm_async_pool)
+    await step("schema", get_schema_snapshots().get)
+    generation_started = time.perf_counter()
+    _warmup["steps"]["generation"] = {
+        "seconds": None,
+        "steps": await run_in_threadpool(warm_up_generation),
+    }
+    _warmup["steps"]["generation"]["seconds"] = round(time.perf_counter() - generation_started, 4)
+    await step("similarity_cache", get_similarity_cache)
+    if ROLLUP_ROUTING_ENABLED:
+        await step("rollups", get_rollup_router().catalog)
+    _warmup["seconds"] = round(time.perf_counter() - started, 4)
+    _warmup["ready"] = True
+
+
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 503 until the startup warm-up has finished, with per-step timings."""
+    body = {
+        "ready": _warmup["ready"],
+        "warmup_seconds": _warmup["seconds"],
+        "steps": _warmup["steps"],
+    }
+    return JSONResponse(body, status_code=200 if _warmup["ready"] else 503)
+
+
+def collect_runtime_metrics() -> list:
+    """Cache hit rates and connection pool usage, read from their own stats at scrape time."""
+    caches = [
+        ({"cache": "generation", "source": name}, stats)
+        for name, stats in generation_cache_stats_by_source().items()
+    ]
+    caches += [
+        ({"cache": "similarity", "source": name}, cache.stats())
+        for name, cache in list(_similarity_caches.items()) if cache is not None
+    ]
+    results = get_result_cache()
+    if results is not None:
+        caches.append(({"cache": "result", "source": ""}, results.stats()))
+    caches.append(({"cache": "suggestion", "source": ""}, get_suggestion_cache_stats()))
+
+    pools = get_data_sources().stats()["open_pools"]
+    pool_samples = lambda key: [({"source": name}, pool[key]) for name, pool in pools.items() if pool.get(key) is not None]
+    return [
+        ("text_to_sql_cache_hits_total", "counter", "Cache hits.", [(labels, stats["hits"]) for labels, stats in caches]),
+        ("text_to_sql_cache_misses_total", "counter", "Cache misses.", [(labels, stats["misses"]) for labels, stats in caches]),
+        ("text_to_sql_cache_hit_ratio", "gauge", "Cache hits / lookups since start.", [
+            (labels, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0.0)
+            for labels, stats in caches
+        ]),
+        ("text_to_sql_db_pool_checked_out", "gauge", "Connections in use.", pool_samples("checked_out")),
+        ("text_to_sql_db_pool_size", "gauge", "Configured pool size.", pool_samples("size")),
+        ("text_to_sql_db_pool_overflow", "gauge", "Connections opened beyond the pool size.", pool_samples("overflow")),
+        ("text_to_sql_db_pool_idle_seconds", "gauge", "Seconds since the pool was last used.", pool_samples("idle_seconds")),
+    ]
+
+
+metrics_registry.add_collector(collect_runtime_metrics)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of the stage/request histograms, token counts, caches and pools."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 
 # Health check
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "LLM SQL Backend is live"}
 
 
@@ -179,38 +486,49 @@ def login_user(payload: LoginRequest):
     if not row or not verify_password(payload.password, row[0]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token({"sub": username})
+    claims = {"sub": username}
+    if payload.source:
+        if payload.source not in get_data_sources().names():
+            raise HTTPException(status_code=404, detail=f"Unknown data source {payload.source!r}")
+        claims["source"] = payload.source
+    token = create_access_token(claims)
     return TokenResponse(access_token=token)
 
 
 # Schema introspection & semantic layer endpoints
-@app.get("/schema", dependencies=[Depends(get_current_username)])
-def get_schema():
-    # Introspect via SQLAlchemy inspector
+SCHEMA_SNAPSHOT_TTL = float(os.getenv("SCHEMA_SNAPSHOT_TTL", "300"))
+_schema_snapshots: dict = {}
+
+
+def get_schema_snapshots(source: Optional[str] = None) -> SchemaSnapshotService:
+    # Declared FKs let the agent keep join paths when pruning the prompt schema
+    return _for_source(
+        _schema_snapshots,
+        lambda name: SchemaSnapshotService(
+            lambda: get_engine(name),
+            ttl=SCHEMA_SNAPSHOT_TTL,
+            on_change=lambda schema: set_db_schema(schema, name),
+        ),
+        source,
+    )
+
+
+@app.get("/schema", dependencies=[Depends(select_data_source)])
+def get_schema(refresh: bool = False):
     try:
-        engine = get_engine()
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        tables = {}
-        for table_name in inspector.get_table_names():
-            columns = [
-                {"name": col["name"], "type": str(col["type"]) }
-                for col in inspector.get_columns(table_name)
-            ]
-            pk_cols = inspector.get_pk_constraint(table_name).get("constrained_columns", [])
-            fks = []
-            for fk in inspector.get_foreign_keys(table_name):
-                fks.append({
-                    "constrained_columns": fk.get("constrained_columns", []),
-                    "referred_table": fk.get("referred_table"),
-                    "referred_columns": fk.get("referred_columns", []),
-                })
-            tables[table_name] = {
-                "columns": columns,
-                "primary_key": pk_cols,
-                "foreign_keys": fks,
-            }
-        return {"tables": tables}
+        snapshots = get_schema_snapshots()
+        schema = snapshots.refresh() if refresh else snapshots.get()
+        return {**schema, "version": snapshots.version}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/schema/refresh", dependencies=[Depends(select_data_source)])
+def refresh_schema():
+    try:
+        snapshots = get_schema_snapshots()
+        snapshots.refresh()
+        return {"success": True, "version": snapshots.version, "tables": len(snapshots.get()["tables"])}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -219,33 +537,40 @@ class SemanticUpdateRequest(BaseModel):
     semantic_layer: dict
 
 
-@app.post("/semantic/suggest", dependencies=[Depends(get_current_username)])
-def semantic_suggest(schema: dict):
+@app.post("/semantic/suggest", dependencies=[Depends(select_data_source)])
+async def semantic_suggest(schema: dict):
     try:
-        suggested = suggest_semantic_layer_from_schema(schema)
-        return {"suggested": suggested}
+        suggested, report = await asuggest_semantic_layer_from_schema(schema)
+        return {"suggested": suggested, "report": report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/semantic", dependencies=[Depends(get_current_username)])
+@app.get("/semantic", dependencies=[Depends(select_data_source)])
 def semantic_get():
     return get_semantic_layer()
 
 
-@app.post("/semantic", dependencies=[Depends(get_current_username)])
+@app.get("/semantic/version", dependencies=[Depends(select_data_source)])
+def semantic_version():
+    return get_semantic_snapshot().describe()
+
+
+@app.post("/semantic", dependencies=[Depends(select_data_source)])
 def semantic_set(payload: SemanticUpdateRequest):
-    set_semantic_layer(payload.semantic_layer)
-    return {"success": True}
+    snapshot = set_semantic_layer(payload.semantic_layer)
+    _clear_similarity_cache()
+    return {"success": True, "version": snapshot.version}
 
 
-@app.post("/semantic/reload", dependencies=[Depends(get_current_username)])
+@app.post("/semantic/reload", dependencies=[Depends(select_data_source)])
 def semantic_reload():
     layer = reload_semantic_layer()
+    _clear_similarity_cache()
     return {"success": True, "semantic_layer": layer}
 
 
-@app.post("/semantic/save", dependencies=[Depends(get_current_username)])
+@app.post("/semantic/save", dependencies=[Depends(select_data_source)])
 def semantic_save():
     try:
         path = save_semantic_layer_to_disk()
@@ -254,71 +579,656 @@ def semantic_save():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/freshness", dependencies=[Depends(get_current_username)])
-def freshness():
+def _clear_similarity_cache(source: Optional[str] = None) -> None:
+    cache = get_similarity_cache(source)
+    if cache is not None:
+        cache.clear()
+
+
+@app.get("/cache/stats", dependencies=[Depends(select_data_source)])
+def cache_stats():
+    similarity = get_similarity_cache()
+    results = get_result_cache()
+    return {
+        "generation": get_generation_cache_stats(),
+        "semantic_snapshot": get_semantic_snapshot().describe(),
+        "suggestions": get_suggestion_cache_stats(),
+        "similarity": similarity.stats() if similarity is not None else None,
+        "result": results.stats() if results is not None else None,
+        "rollups": get_rollup_router().stats(),
+        "guard": get_sql_guard().stats() if get_sql_guard() is not None else None,
+        "encoding": encoding_stats(),
+    }
+
+
+@app.get("/sources", dependencies=[Depends(get_current_username)])
+def list_data_sources():
+    registry = get_data_sources()
+    return {
+        "sources": [registry.get(name).describe() for name in registry.names()],
+        "pools": registry.stats(),
+    }
+
+
+FRESHNESS_PROBE_WORKERS = int(os.getenv("FRESHNESS_PROBE_WORKERS", "4"))
+
+
+def compute_freshness(engine: Engine) -> list:
     """Compute simple freshness per table using max timestamp-like column if present."""
-    engine = get_engine()
-    from sqlalchemy import inspect
-    inspector = inspect(engine)
-    tables = inspector.get_table_names()
-    freshness_info = []
-    timestamp_candidates = {"updated_at", "modified_at", "created_at", "ingested_at", "_load_ts", "_ingested_ts", "_updated_at", "timestamp", "ts"}
-    with engine.connect() as conn:
-        for table in tables:
-            cols = [c["name"].lower() for c in inspector.get_columns(table)]
-            chosen = None
-            for c in cols:
-                if c in timestamp_candidates:
-                    chosen = c
-                    break
-            last_loaded = None
-            if chosen:
-                try:
-                    q = text(f"SELECT MAX({chosen}) AS last_ts FROM {table}")
-                    res = conn.execute(q).fetchone()
-                    last_loaded = res[0] if res else None
-                except Exception:
-                    last_loaded = None
-            freshness_info.append({
-                "table": table,
-                "timestamp_column": chosen,
-                "last_loaded": str(last_loaded) if last_loaded is not None else None,
-            })
+    return probe_freshness(engine, get_schema_snapshots().get(), max_workers=FRESHNESS_PROBE_WORKERS)
+
+
+RESULT_CACHE_FRESHNESS_TTL = float(os.getenv("RESULT_CACHE_FRESHNESS_TTL", "30"))
+# Data source -> (table versions, monotonic time they were probed)
+_table_versions: dict = {}
+
+
+def _remember_table_versions(freshness_info: list) -> dict:
+    versions = {f["table"].lower(): f["last_loaded"] for f in freshness_info}
+    _table_versions[get_data_sources().resolve()] = (versions, time.monotonic())
+    return versions
+
+
+def get_table_versions() -> dict:
+    """Per-table last-load timestamps, re-probed at most every RESULT_CACHE_FRESHNESS_TTL seconds."""
+    cached = _table_versions.get(get_data_sources().resolve())
+    if cached is not None and time.monotonic() - cached[1] < RESULT_CACHE_FRESHNESS_TTL:
+        return cached[0]
+    return _remember_table_versions(compute_freshness(get_engine()))
+
+
+@app.get("/freshness", dependencies=[Depends(select_data_source)])
+def freshness():
+    freshness_info = compute_freshness(get_engine())
+    _remember_table_versions(freshness_info)
     return {"freshness": freshness_info}
 
-# Main endpoint
-@app.post("/query")
-def query_db(request: QueryRequest, username: str = Depends(get_current_username)):
+
+ROLLUP_ROUTING_ENABLED = os.getenv("ROLLUP_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+ROLLUP_CATALOG_TTL = float(os.getenv("ROLLUP_CATALOG_TTL", "60"))
+_rollup_routers: dict = {}
+
+
+def get_rollup_router(source: Optional[str] = None) -> RollupRouter:
+    return _for_source(
+        _rollup_routers,
+        lambda name: RollupRouter(
+            lambda: get_engine(name),
+            lambda: get_semantic_layer(name),
+            get_schema_snapshots(name).get,
+            catalog_ttl=ROLLUP_CATALOG_TTL,
+        ),
+        source,
+    )
+
+
+def route_to_rollup(sql: str) -> tuple:
+    """Returns (sql_to_run, rollup_name): the smallest fresh rollup covering sql, else sql itself."""
+    if not ROLLUP_ROUTING_ENABLED:
+        return sql, None
+    try:
+        routed = get_rollup_router().rewrite(sql, get_table_versions())
+    except Exception:
+        # Routing is an optimisation; the original SQL is always a valid answer
+        return sql, None
+    if routed is None:
+        return sql, None
+    return routed["sql"], routed["rollup"]
+
+
+@app.get("/rollups", dependencies=[Depends(select_data_source)])
+def rollups_status():
     try:
-        question = request.question
+        router = get_rollup_router()
+        router.catalog()
+        return router.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/rollups/refresh", dependencies=[Depends(select_data_source)])
+def rollups_refresh(full: bool = False):
+    try:
+        reports = refresh_rollups(get_engine(), get_semantic_layer(), full=full, db_schema=get_schema_snapshots().refresh())
+        get_rollup_router().reload()
+        _remember_table_versions(compute_freshness(get_engine()))
+        return {"success": True, "rollups": reports}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def resolve_sql(question: str) -> tuple:
+    """Returns (result, layer_version): similarity cache first, then generate_sql_response."""
+    layer_version = get_semantic_layer_version()
+    similarity = get_similarity_cache()
+    match = similarity.lookup(question, layer_version) if similarity is not None else None
+    if match is not None:
+        result = {
+            "type": "query_result",
+            "sql": match["sql"],
+            "cached": True,
+            "path": "similarity",
+            "similar_question": match["question"],
+            "similarity": match["similarity"],
+        }
+    else:
         result = generate_sql_response(question)
+    return result, layer_version
 
-        if result["type"] == "error":
-            return {
-                "success": True,
-                "response": result
-            }
 
-        sql = result["sql"]
+def remember_successful_sql(question: str, result: dict, layer_version: str) -> None:
+    # The SQL as generated, without the guard's LIMIT: /query/stream reuses it under a higher cap
+    sql = result.get("generated_sql", result["sql"])
+    # Only LLM-written SQL that actually executed is worth reusing
+    if result.get("path") in ("llm", "repair"):
+        remember_generated_sql(question, sql)
+    similarity = get_similarity_cache()
+    if similarity is not None and result.get("path") in ("llm", "cache", "repair"):
+        similarity.remember(question, sql, layer_version)
 
-        engine = get_engine()
+
+def record_executed_sql(result: dict, rollup: Optional[str], row_count: int, seconds: float, result_cached: bool) -> None:
+    """Logs the generated SQL (not the rollup rewrite) so the index advisor sees base-table access."""
+    query_log = get_query_log()
+    if query_log is None:
+        return
+    try:
+        query_log.record(
+            result["sql"],
+            source=get_data_sources().resolve(),
+            path=result.get("path"),
+            rollup=rollup,
+            rows=row_count,
+            ms=round(seconds * 1000, 2),
+            result_cached=result_cached,
+        )
+    except OSError:
+        pass
+
+
+def _result_meta(result: dict) -> dict:
+    return {
+        "sql": result["sql"],
+        "cached": result.get("cached", False),
+        "path": result.get("path"),
+        "similar_question": result.get("similar_question"),
+        "prompt": result.get("prompt"),
+        "plan": result.get("plan"),
+        "candidates": result.get("candidates"),
+        "repaired_from": result.get("repaired_from"),
+    }
+
+
+def _session_statements(engine) -> list:
+    guard = get_sql_guard()
+    return guard.session_statements(engine.dialect.name) if guard is not None else []
+
+
+def explain_sql(sql: str) -> Optional[dict]:
+    """The planner's cost and row estimate, on dialects whose EXPLAIN reports one."""
+    engine = get_engine()
+    statement = SQLGuard.explain_statement(engine.dialect.name, sql)
+    validation = SQLGuard.validate_statement(engine.dialect.name, sql) if statement is None else None
+    if statement is None and validation is None:
+        return None
+    try:
         with engine.connect() as conn:
+            if statement is None:
+                conn.execute(text(validation)).fetchall()
+                return None
+            plan = conn.execute(text(statement)).scalar()
+    except Exception as e:
+        # EXPLAIN only plans, so failing here means the statement itself is broken
+        raise SQLRejected(f"Query failed to plan: {e}", sql)
+    return SQLGuard.parse_estimate(plan)
+
+
+def _columns_by_table() -> dict:
+    try:
+        tables = get_schema_snapshots().get().get("tables", {})
+    except Exception:
+        return {}
+    return {t.lower(): {c["name"].lower() for c in tdef.get("columns", [])} for t, tdef in tables.items()}
+
+
+def prepare_execution(result: dict, max_rows: Optional[int] = None) -> tuple:
+    """
+    Guards result["sql"] in place (read-only, joined, LIMITed), keeping the unguarded SQL in
+    result["generated_sql"], routes it to a rollup and checks the plan of what will actually
+    run against the cost budget.
+    Returns (sql_to_run, rollup); raises SQLRejected with the plan estimate when refused.
+    """
+    with timed("plan"):
+        guard = get_sql_guard()
+        result.setdefault("generated_sql", result["sql"])
+        if guard is not None:
+            result["sql"] = guard.prepare(result["sql"], get_engine().dialect.name, _columns_by_table(), max_rows)
+        run_sql, rollup = route_to_rollup(result["sql"])
+        if guard is not None:
+            estimate = explain_sql(run_sql)
+            guard.check_estimate(run_sql, estimate)
+            result["plan"] = estimate
+    return run_sql, rollup
+
+
+def _rejection(e: SQLRejected) -> dict:
+    return {"type": "error", "error": e.reason, "sql": e.sql, "plan": e.estimate}
+
+
+def execute_sql(sql: str) -> tuple:
+    engine = get_engine()
+    with engine.connect() as conn:
+        with timed("db_execute"):
+            for statement in _session_statements(engine):
+                conn.execute(text(statement))
             result_proxy = conn.execute(text(sql))
+        with timed("db_fetch"):
             colnames = list(result_proxy.keys())
             rows = [list(row) for row in result_proxy.fetchall()]
+    return colnames, rows
+
+
+async def _aexecute_uncached(sql: str) -> tuple:
+    engine = get_async_engine()
+    if engine is None:
+        return await run_in_threadpool(execute_sql, sql)
+    async with engine.connect() as conn:
+        with timed("db_execute"):
+            for statement in _session_statements(engine):
+                await conn.execute(text(statement))
+            result_proxy = await conn.execute(text(sql))
+        with timed("db_fetch"):
+            colnames = list(result_proxy.keys())
+            rows = [list(row) for row in result_proxy.fetchall()]
+    return colnames, rows
+
+
+async def aexecute_sql(sql: str, run_sql: Optional[str] = None) -> tuple:
+    """
+    Returns (columns, rows, from_cache), serving unchanged results from the result cache.
+    ``run_sql`` (e.g. a rollup rewrite) is what executes; results stay keyed on ``sql`` so
+    they are invalidated by the base tables it reads.
+    """
+    run_sql = run_sql or sql
+    cache = get_result_cache()
+    if cache is None:
+        return (*await _aexecute_uncached(run_sql), False)
+    try:
+        table_versions = await run_in_threadpool(get_table_versions)
+    except Exception:
+        # Without freshness we cannot tell whether a cached result is stale
+        return (*await _aexecute_uncached(run_sql), False)
+    source = get_data_sources().resolve()
+    with timed("result_cache"):
+        cached = cache.get(sql, table_versions, namespace=source)
+    if cached is not None:
+        return cached[0], cached[1], True
+    colnames, rows = await _aexecute_uncached(run_sql)
+    cache.put(sql, colnames, rows, table_versions, namespace=source)
+    return colnames, rows, False
+
+
+async def aresolve_candidates(question: str) -> tuple:
+    """Returns (candidates, layer_version): a similarity-cache hit, else agenerate_sql_candidates."""
+    layer_version = get_semantic_layer_version()
+    similarity = get_similarity_cache()
+    match = None
+    if similarity is not None:
+        with timed("similarity"):
+            match = await run_in_threadpool(similarity.lookup, question, layer_version)
+    if match is not None:
+        candidates = [{
+            "type": "query_result",
+            "sql": match["sql"],
+            "cached": True,
+            "path": "similarity",
+            "similar_question": match["question"],
+            "similarity": match["similarity"],
+        }]
+    else:
+        candidates = await agenerate_sql_candidates(question)
+    return candidates, layer_version
+
+
+# Rounds in which a database error is fed back to the LLM to fix the SQL; 0 turns repair off
+SQL_REPAIR_ATTEMPTS = int(os.getenv("SQL_REPAIR_ATTEMPTS", "1"))
+
+
+async def _prepare_candidate(result: dict) -> tuple:
+    try:
+        run_sql, rollup = await run_in_threadpool(prepare_execution, result)
+        return run_sql, rollup, None
+    except SQLRejected as e:
+        return None, None, e
+
+
+async def choose_candidate(question: str, candidates: list, repairs_left: int) -> tuple:
+    """
+    Guards and EXPLAINs every candidate concurrently and keeps the cheapest that plans
+    (generation order breaks ties and stands in on dialects without a cost estimate).
+    If none plans, one repair round is spent on the first broken one; over-budget plans are
+    not repaired. Returns (result, run_sql, rollup, repairs_left); raises SQLRejected.
+    """
+    checked = await asyncio.gather(*(_prepare_candidate(c) for c in candidates))
+    valid = [(i, c, run_sql, rollup) for i, (c, (run_sql, rollup, rejection)) in enumerate(zip(candidates, checked)) if rejection is None]
+    if valid:
+        _, result, run_sql, rollup = min(
+            valid,
+            key=lambda v: ((v[1].get("plan") or {}).get("cost", math.inf), v[0]),
+        )
+        if len(candidates) > 1:
+            result["candidates"] = [
+                {
+                    "sql": c["sql"],
+                    "temperature": c.get("temperature"),
+                    "cost": (c.get("plan") or {}).get("cost"),
+                    "error": rejection.reason if rejection is not None else None,
+                }
+                for c, (_, _, rejection) in zip(candidates, checked)
+            ]
+        return result, run_sql, rollup, repairs_left
+
+    rejections = [rejection for _, _, rejection in checked]
+    broken = next((r for r in rejections if r.estimate is None), None)
+    if broken is None or repairs_left < 1:
+        raise rejections[0]
+    repaired = await arepair_sql_response(question, broken.sql or candidates[0]["sql"], broken.reason)
+    if repaired["type"] == "error":
+        raise broken
+    run_sql, rollup = await run_in_threadpool(prepare_execution, repaired)
+    return repaired, run_sql, rollup, repairs_left - 1
+
+
+async def answer_question(question: str, db_semaphore: Optional[asyncio.Semaphore] = None) -> dict:
+    """
+    Resolves, validates and executes the SQL for a question, returning the response payload.
+    A database error at execution gets a repair round too if none was spent planning.
+    """
+    candidates, layer_version = await aresolve_candidates(question)
+    if candidates[0]["type"] == "error":
+        return candidates[0]
+
+    try:
+        result, run_sql, rollup, repairs_left = await choose_candidate(question, candidates, SQL_REPAIR_ATTEMPTS)
+    except SQLRejected as e:
+        return _rejection(e)
+
+    while True:
+        started = time.perf_counter()
+        try:
+            async with db_semaphore or nullcontext():
+                colnames, rows, result_cached = await aexecute_sql(result["sql"], run_sql)
+            break
+        except Exception as e:
+            if repairs_left < 1:
+                raise
+            repairs_left -= 1
+            repaired = await arepair_sql_response(question, result["sql"], str(e))
+            if repaired["type"] == "error":
+                raise
+            try:
+                run_sql, rollup = await run_in_threadpool(prepare_execution, repaired)
+            except SQLRejected as rejected:
+                return _rejection(rejected)
+            result = repaired
+    elapsed = time.perf_counter() - started
+
+    await run_in_threadpool(remember_successful_sql, question, result, layer_version)
+    await run_in_threadpool(record_executed_sql, result, rollup, len(rows), elapsed, result_cached)
+    QUERY_PATHS.inc(path=result.get("path"), source=get_data_sources().resolve())
+
+    return {
+        "type": "query_result",
+        **_result_meta(result),
+        "rollup": rollup,
+        "result_cached": result_cached,
+        "columns": colnames,
+        "column_types": column_types(colnames, rows),
+        "rows": rows
+    }
+
 
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def run_until_disconnect(request: Request, coro):
+    """Awaits coro, cancelling it (and any in-flight LLM call or DB statement) if the client goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+
+async def _answer_question(question: str) -> dict:
+    return {
+        "success": True,
+        "response": await answer_question(question)
+    }
+
+
+def encoded_response(payload: dict, http_request: Request, media_type: str = JSON_MEDIA_TYPE) -> Response:
+    """payload in the negotiated format, compressed per Accept-Encoding."""
+    with timed("serialize"):
+        body, media_type = encode_payload(payload, media_type)
+    encoding = negotiate_encoding(http_request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        with timed("compress"):
+            body, content_encoding = compress(body, encoding)
+        if content_encoding is not None:
+            headers["Content-Encoding"] = content_encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# Main endpoint
+@app.post("/query")
+async def query_db(request: QueryRequest, http_request: Request, username: str = Depends(get_current_username), source: str = Depends(select_data_source)):
+    """
+    The answer as JSON rows by default; Accept selects columnar JSON or Arrow IPC (see
+    response_encoding.py) and Accept-Encoding gzip or zstd.
+    """
+    try:
+        media_type = negotiate_media_type(http_request.headers.get("accept"))
+        payload = await run_until_disconnect(http_request, _answer_question(request.question))
+        return encoded_response(payload, http_request, media_type)
+    except ClientDisconnected:
         return {
-            "success": True,
-            "response": {
-                "type": "query_result",
-                "sql": sql,
-                "columns": colnames,
-                "rows": rows
-            }
+            "success": False,
+            "error": "Client disconnected"
         }
     except Exception as e:
         return {
             "success": False,
             "error": str(e)
         }
-    
\ No newline at end of file
+
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+# Statements run concurrently per batch; keep at or below the engine pool size (5 + overflow 10)
+BATCH_DB_CONCURRENCY = int(os.getenv("BATCH_DB_CONCURRENCY", "5"))
+
+
+@app.post("/query/batch")
+async def query_db_batch(request: BatchQueryRequest, http_request: Request, username: str = Depends(get_current_username), source: str = Depends(select_data_source)):
+    """
+    Answers many questions at once. Questions that normalize to the same text are generated
+    and executed once; LLM calls are capped per provider and statements share the pool.
+    """
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    unique: dict = {}
+    for question in request.questions:
+        unique.setdefault(normalize_question(question), question)
+
+    db_semaphore = asyncio.Semaphore(max(1, BATCH_DB_CONCURRENCY))
+
+    async def answer(question: str) -> dict:
+        try:
+            response = await answer_question(question, db_semaphore)
+            if response["type"] == "error":
+                return {"success": False, **response}
+            return {"success": True, "response": response}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    async def answer_all() -> list:
+        return await asyncio.gather(*(answer(q) for q in unique.values()))
+
+    try:
+        answers = await run_until_disconnect(http_request, answer_all())
+    except ClientDisconnected:
+        return {"success": False, "error": "Client disconnected"}
+
+    by_key = dict(zip(unique.keys(), answers))
+    return encoded_response({
+        "success": True,
+        "unique_questions": len(unique),
+        "results": [
+            {"question": question, **by_key[normalize_question(question)]}
+            for question in request.questions
+        ],
+    }, http_request)
+
+
+QUERY_STREAM_BATCH_ROWS = int(os.getenv("QUERY_STREAM_BATCH_ROWS", "1000"))
+# Streaming exists for large results, so its LIMIT is far above SQL_GUARD_MAX_ROWS
+QUERY_STREAM_MAX_ROWS = int(os.getenv("QUERY_STREAM_MAX_ROWS", "1000000"))
+
+
+def query_row_events(question: str, result: dict, layer_version: str) -> Iterator[dict]:
+    """
+    Yields one "meta" event with the SQL and columns, then "rows" batches read through a
+    server-side cursor (the first also carrying column_types), a "truncated" event when
+    QUERY_STREAM_MAX_ROWS cut the result short, then "end" (or "error").
+    Shared by /query/stream and /query/events.
+    """
+    row_count = 0
+    try:
+        sql, rollup = prepare_execution(result, QUERY_STREAM_MAX_ROWS)
+        started = time.perf_counter()
+        engine = get_engine()
+        with engine.connect() as conn:
+            with timed("db_execute"):
+                for statement in _session_statements(engine):
+                    conn.execute(text(statement))
+                result_proxy = conn.execution_options(
+                    stream_results=True, yield_per=QUERY_STREAM_BATCH_ROWS
+                ).execute(text(sql))
+            columns = list(result_proxy.keys())
+            yield {"type": "meta", **_result_meta(result), "rollup": rollup, "columns": columns}
+            for partition in result_proxy.partitions(QUERY_STREAM_BATCH_ROWS):
+                rows = [list(row) for row in partition]
+                event = {"type": "rows", "rows": rows}
+                if row_count == 0:
+                    # Typed from the first batch, like /query's column_types
+                    event["column_types"] = column_types(columns, rows)
+                row_count += len(rows)
+                yield event
+        if row_count >= QUERY_STREAM_MAX_ROWS:
+            yield {"type": "truncated", "row_count": row_count, "max_rows": QUERY_STREAM_MAX_ROWS}
+        remember_successful_sql(question, result, layer_version)
+        record_executed_sql(result, rollup, row_count, time.perf_counter() - started, False)
+        # Headers went out before execution, so the stage timings travel with the last event
+        yield {"type": "end", "row_count": row_count, "timings": current_timings()}
+    except SQLRejected as e:
+        yield _rejection(e)
+    except Exception as e:
+        yield {"type": "error", "error": str(e), "row_count": row_count}
+
+
+def stream_query_rows(question: str, result: dict, layer_version: str):
+    """NDJSON lines of query_row_events."""
+    for event in query_row_events(question, result, layer_version):
+        yield json.dumps(event, default=json_value) + "\n"
+
+
+@app.post("/query/stream")
+def query_db_stream(request: QueryRequest, username: str = Depends(get_current_username), source: str = Depends(select_data_source)):
+    """Same as /query, but streams rows as NDJSON instead of buffering the whole result."""
+    question = request.question
+    try:
+        result, layer_version = resolve_sql(question)
+    except Exception as e:
+        result, layer_version = {"type": "error", "error": str(e)}, None
+    if result["type"] == "error":
+        line = json.dumps({"type": "error", "error": result["error"]}) + "\n"
+        return StreamingResponse(iter([line]), media_type="application/x-ndjson")
+    return StreamingResponse(
+        stream_query_rows(question, result, layer_version),
+        media_type="application/x-ndjson",
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=json_value)}\n\n"
+
+
+async def query_event_stream(question: str):
+    """
+    Server-Sent Events for one question: "stage" events as the pipeline advances, "token"
+    events while the LLM writes the SQL, a "sql" event once it is complete, then the
+    "meta"/"rows"/"end" events of query_row_events. Execution starts as soon as the SQL is known.
+    """
+    # Sent before any work so the client sees a first byte immediately
+    yield _sse("stage", {"stage": "received"})
+    try:
+        layer_version = get_semantic_layer_version()
+        similarity = get_similarity_cache()
+        match = None
+        if similarity is not None:
+            with timed("similarity"):
+                match = await run_in_threadpool(similarity.lookup, question, layer_version)
+        if match is not None:
+            result = {
+                "type": "query_result",
+                "sql": match["sql"],
+                "cached": True,
+                "path": "similarity",
+                "similar_question": match["question"],
+                "similarity": match["similarity"],
+            }
+        else:
+            result = None
+            async for kind, value in astream_sql_response(question):
+                if kind == "stage":
+                    yield _sse("stage", {"stage": value})
+                elif kind == "token":
+                    yield _sse("token", {"text": value})
+                else:
+                    result = value
+    except Exception as e:
+        result = {"type": "error", "error": str(e)}
+    if result is None or result["type"] == "error":
+        yield _sse("error", {"type": "error", "error": (result or {}).get("error", "Failed to generate SQL.")})
+        return
+
+    yield _sse("sql", _result_meta(result))
+    yield _sse("stage", {"stage": "executing"})
+    async for event in iterate_in_threadpool(query_row_events(question, result, layer_version)):
+        yield _sse(event["type"], event)
+
+
+@app.post("/query/events")
+def query_db_events(request: QueryRequest, username: str = Depends(get_current_username), source: str = Depends(select_data_source)):
+    """Same as /query/stream, as Server-Sent Events that also report progress and LLM tokens."""
+    return StreamingResponse(
+        query_event_stream(request.question),
+        media_type="text/event-stream",
+        # Proxies (nginx) must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,274 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .question_index import tokenize
+from .schema_retrieval import build_join_graph, shortest_join_path
+
+# Words that may appear around "metric by dimension" questions without changing their meaning
+_FILLER = {
+    "total", "sum", "overall", "breakdown", "broken", "down", "grouped", "split",
+    "across", "during", "between", "value", "number",
+}
+
+_QUOTED_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+_QUARTER_RE = re.compile(r"\bQ([1-4])\b", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b((?:19|20)\d{2})\b")
+_TOPN_RE = re.compile(r"\b(top|bottom|highest|lowest)\s+(\d+)\b", re.IGNORECASE)
+# Business keys such as DLR0001, BR0011 or BMW-M1: uppercase letters mixed with digits
+_CODE_RE = re.compile(r"\b(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])[A-Z0-9]+(?:-[A-Z0-9]+)*\b")
+_PLACEHOLDER_RE = re.compile(r"^lit(\d+)x$")
+
+
+class CompileError(Exception):
+    """The question is outside what the rule-based compiler can answer unambiguously."""
+
+
+class MetricIndex:
+    """Inverted index from synonym phrases to metrics and columns of one semantic layer."""
+
+    def __init__(self, semantic_layer: dict, db_schema: Optional[dict] = None, graph: Optional[dict] = None):
+        self.tables = semantic_layer.get("tables", {})
+        self.graph = graph if graph is not None else build_join_graph(semantic_layer, db_schema)
+        self.phrases: Dict[Tuple[str, ...], List[tuple]] = {}
+        self.measures: Dict[Tuple[str, str], str] = {}
+        self.max_phrase_len = 1
+
+        for table, config in self.tables.items():
+            columns = config.get("columns", {})
+            for metric, expr in config.get("metrics", {}).items():
+                self._add(metric, ("metric", table, metric))
+                for column in columns:
+                    if re.search(rf"\b{re.escape(column)}\b", expr):
+                        key = (table, column)
+                        # A plain SUM(col) metric is what "revenue" or "units sold" means
+                        if re.fullmatch(rf"\s*SUM\(\s*{re.escape(column)}\s*\)\s*", expr, re.IGNORECASE):
+                            self.measures[key] = metric
+                        else:
+                            self.measures.setdefault(key, "")
+            for column, synonyms in columns.items():
+                for phrase in [column] + list(synonyms or []):
+                    self._add(phrase, ("column", table, column))
+
+    def _add(self, phrase: str, target: tuple) -> None:
+        tokens = tuple(tokenize(phrase.replace("_", " ")))
+        if not tokens:
+            return
+        targets = self.phrases.setdefault(tokens, [])
+        if target not in targets:
+            targets.append(target)
+        self.max_phrase_len = max(self.max_phrase_len, len(tokens))
+
+    def is_measure(self, table: str, column: str) -> bool:
+        return (table, column) in self.measures
+
+    def metric_for(self, table: str, column: str) -> Tuple[str, str]:
+        metric = self.measures.get((table, column))
+        if metric:
+            return metric, self.tables[table]["metrics"][metric]
+        return f"total_{column.lower()}", f"SUM({column})"
+
+    def column_by_word(self, word: str) -> Tuple[str, str]:
+        """Resolves the column a literal like 2018 or Q3 filters on ("year", "quarter")."""
+        targets = [t for t in self.phrases.get((word,), []) if t[0] == "column"]
+        owners = {(t[1], t[2]) for t in targets}
+        if len(owners) != 1:
+            raise CompileError(f"no unique '{word}' column")
+        return owners.pop()
+
+
+def _extract_literals(question: str) -> Tuple[str, List[tuple], Optional[tuple]]:
+    """Replaces literals with placeholder words so tokenizing keeps their position."""
+    literals: List[tuple] = []
+
+    def stash(kind: str, value) -> str:
+        literals.append((kind, value))
+        return f" lit{len(literals) - 1}x "
+
+    order = None
+    topn = _TOPN_RE.search(question)
+    if topn:
+        direction = "DESC" if topn.group(1).lower() in ("top", "highest") else "ASC"
+        order = (direction, int(topn.group(2)))
+        question = question[:topn.start()] + " " + question[topn.end():]
+
+    question = _QUOTED_RE.sub(lambda m: stash("value", m.group(1) if m.group(1) is not None else m.group(2)), question)
+    question = _QUARTER_RE.sub(lambda m: stash("quarter", f"Q{m.group(1)}"), question)
+    question = _YEAR_RE.sub(lambda m: stash("year", int(m.group(1))), question)
+    question = _CODE_RE.sub(lambda m: stash("code", m.group(0)), question)
+    return question, literals, order
+
+
+def _resolve_phrase(index: MetricIndex, targets: List[tuple]) -> tuple:
+    metrics = {t for t in targets if t[0] == "metric"}
+    if metrics:
+        if len(metrics) > 1:
+            raise CompileError("phrase matches several metrics")
+        return metrics.pop()
+
+    columns = list(dict.fromkeys((t[1], t[2]) for t in targets))
+    if len(columns) > 1:
+        # "date" matches both revenue.Date_ID and date.Date: prefer the dimension's own
+        # column over the fact key that joins to it
+        columns = [
+            (table, column) for table, column in columns
+            if not (column.lower().endswith("_id") and any(
+                other != table and other in index.graph.get(table, {}) for other, _ in columns
+            ))
+        ]
+    if len(set(columns)) != 1:
+        raise CompileError("phrase matches several columns: " + ", ".join(f"{t}.{c}" for t, c in columns))
+    table, column = columns[0]
+    if index.is_measure(table, column):
+        return ("measure", table, column)
+    return ("column", table, column)
+
+
+def _parse(index: MetricIndex, question: str) -> dict:
+    text, literals, order = _extract_literals(question)
+    tokens = tokenize(text)
+    items: List[tuple] = []
+    i = 0
+    while i < len(tokens):
+        placeholder = _PLACEHOLDER_RE.match(tokens[i])
+        if placeholder:
+            items.append(("literal",) + literals[int(placeholder.group(1))])
+            i += 1
+            continue
+        for size in range(min(index.max_phrase_len, len(tokens) - i), 0, -1):
+            targets = index.phrases.get(tuple(tokens[i:i + size]))
+            if targets:
+                items.append(_resolve_phrase(index, targets))
+                i += size
+                break
+        else:
+            if tokens[i] not in _FILLER:
+                raise CompileError(f"unrecognised word '{tokens[i]}'")
+            i += 1
+
+    metrics: List[Tuple[str, str]] = []
+    group_by: List[Tuple[str, str]] = []
+    filters: List[Tuple[str, str, object]] = []
+    for pos, item in enumerate(items):
+        kind = item[0]
+        if kind == "metric":
+            metrics.append((item[1], item[2]))
+        elif kind == "measure":
+            metric, _ = index.metric_for(item[1], item[2])
+            metrics.append((item[1], metric))
+        elif kind == "literal":
+            lit_kind, value = item[1], item[2]
+            if lit_kind in ("year", "quarter"):
+                table, column = index.column_by_word(lit_kind)
+                filters.append((table, column, value))
+                continue
+            prev = items[pos - 1] if pos else None
+            if prev is None or prev[0] != "column":
+                raise CompileError("literal value without a column to filter on")
+            table, column = prev[1], prev[2]
+            if lit_kind == "code" and not column.lower().endswith("_id"):
+                # Codes like DLR0001 are keys; comparing them to a name column is a guess
+                raise CompileError("code literal on a non-key column")
+            if lit_kind == "value" and column.lower().endswith("_id"):
+                # 'AC Cars Motors' is a name, and a key never equals it
+                raise CompileError("quoted value on a key column")
+            filters.append((table, column, value))
+        elif kind == "column":
+            nxt = items[pos + 1] if pos + 1 < len(items) else None
+            if nxt is not None and nxt[0] == "literal" and nxt[1] in ("value", "code"):
+                continue  # consumed as the filter column
+            if (item[1], item[2]) not in group_by:
+                group_by.append((item[1], item[2]))
+
+    filtered = [(t, c) for t, c, _ in filters]
+    if len(set(filtered)) != len(filtered):
+        # "between 2017 and 2019" or "in 2017 and 2018": equality on both is always empty,
+        # and whether a range or a list is meant is the LLM's call
+        raise CompileError("several values for one filter column")
+
+    metrics = list(dict.fromkeys(metrics))
+    if not metrics:
+        raise CompileError("no metric in question")
+    if len({t for t, _ in metrics}) != 1:
+        raise CompileError("metrics span several tables")
+    return {"metrics": metrics, "group_by": group_by, "filters": filters, "order": order}
+
+
+def _alias_for(table: str, used: set) -> str:
+    for size in range(1, len(table) + 1):
+        alias = table[:size].lower()
+        if alias not in used:
+            used.add(alias)
+            return alias
+    alias = f"{table.lower()}_{len(used)}"
+    used.add(alias)
+    return alias
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def compile_question(index: MetricIndex, question: str) -> dict:
+    """
+    Compiles "metric X by dimension Y filtered by Z" questions straight to SQL.
+    Raises CompileError when the question is ambiguous or out of scope; callers fall back to the LLM.
+    """
+    parsed = _parse(index, question)
+    fact = parsed["metrics"][0][0]
+    used_aliases: set = set()
+    aliases = {fact: _alias_for(fact, used_aliases)}
+    joins: List[str] = []
+
+    def ensure_joined(table: str) -> None:
+        if table in aliases:
+            return
+        path = shortest_join_path(index.graph, set(aliases), table)
+        if path[0] not in aliases:
+            raise CompileError(f"no join path from {fact} to {table}")
+        for left, right in zip(path, path[1:]):
+            if right in aliases:
+                continue
+            left_col, right_col = index.graph[left][right]
+            aliases[right] = _alias_for(right, used_aliases)
+            joins.append(
+                f"JOIN {right} {aliases[right]} ON {aliases[left]}.{left_col} = {aliases[right]}.{right_col}"
+            )
+
+    for table, _ in parsed["group_by"] + [(t, c) for t, c, _ in parsed["filters"]]:
+        ensure_joined(table)
+
+    fact_columns = list(index.tables[fact].get("columns", {}).keys())
+    select = [f"{aliases[t]}.{c}" for t, c in parsed["group_by"]]
+    metric_names = []
+    for table, metric in parsed["metrics"]:
+        expr = index.tables[table].get("metrics", {}).get(metric)
+        if expr is None:
+            column = metric[len("total_"):]
+            column = next(c for c in fact_columns if c.lower() == column)
+            expr = f"SUM({column})"
+        for column in sorted(fact_columns, key=len, reverse=True):
+            expr = re.sub(rf"(?<![\w.]){re.escape(column)}\b", f"{aliases[fact]}.{column}", expr)
+        select.append(f"{expr} AS {metric}")
+        metric_names.append(metric)
+
+    lines = [f"SELECT {', '.join(select)}", f"FROM {fact} {aliases[fact]}"] + joins
+    if parsed["filters"]:
+        conditions = [f"{aliases[t]}.{c} = {_sql_literal(v)}" for t, c, v in parsed["filters"]]
+        lines.append("WHERE " + " AND ".join(conditions))
+    if parsed["group_by"]:
+        lines.append("GROUP BY " + ", ".join(f"{aliases[t]}.{c}" for t, c in parsed["group_by"]))
+    if parsed["order"]:
+        direction, limit = parsed["order"]
+        lines.append(f"ORDER BY {metric_names[0]} {direction}")
+        lines.append(f"LIMIT {limit}")
+    elif parsed["group_by"]:
+        lines.append("ORDER BY " + ", ".join(f"{aliases[t]}.{c}" for t, c in parsed["group_by"]))
+
+    return {
+        "sql": "\n".join(lines),
+        "metrics": metric_names,
+        "dimensions": [f"{t}.{c}" for t, c in parsed["group_by"]],
+        "filters": [f"{t}.{c}" for t, c, _ in parsed["filters"]],
+    }
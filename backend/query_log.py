@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+
+class QueryLog:
+    """
+    Append-only JSON-lines log of the SQL /query executed, read back by index_advisor.py.
+    The file rotates to ``<path>.1`` once it grows past ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, sql: str, **fields) -> None:
+        line = json.dumps({"ts": time.time(), "sql": sql, **fields}, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            except OSError:
+                pass  # not created yet
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+def read_query_log(path: str) -> Iterator[dict]:
+    """Entries from the rotated file first, then the live one; unreadable lines are skipped."""
+    for candidate in (path + ".1", path):
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("sql"):
+                    yield entry
+
+
+def build_query_log() -> Optional[QueryLog]:
+    if os.getenv("QUERY_LOG_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return QueryLog(
+        os.getenv("QUERY_LOG_PATH", "backend/query_log.jsonl"),
+        max_bytes=int(os.getenv("QUERY_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+    )
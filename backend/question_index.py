@@ -0,0 +1,292 @@
+import os
+import re
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Words that carry no meaning for picking SQL; dropping them lets
+# "what was 2018's total revenue" and "total revenue in 2018" collide.
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "per", "and", "or",
+    "what", "which", "who", "whats", "was", "were", "is", "are", "be", "been",
+    "show", "me", "give", "list", "get", "find", "tell", "please", "can", "you",
+    "i", "we", "our", "my", "all", "each", "every", "how", "much", "many", "s",
+    "do", "does", "did", "with", "from", "at", "as", "that", "this", "there",
+}
+
+# Stopwords that still decide which SQL is right: "from lowest to highest" is not
+# "from highest to lowest". Kept when embedding questions for the similarity cache.
+_DIRECTION_WORDS = frozenset({"to", "from", "in", "by", "and", "or"})
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+
+def tokenize(question: str, keep: frozenset = frozenset()) -> List[str]:
+    tokens = []
+    for tok in _TOKEN_RE.findall((question or "").lower()):
+        if tok in _STOPWORDS and tok not in keep:
+            continue
+        # Crude plural folding: dealers -> dealer, sales stays sales
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss") and not tok.isdigit():
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def question_literals(question: str) -> tuple:
+    """
+    Numbers and quoted values, in question order, must match exactly: 2018 and 2019 embed
+    almost identically, and "in 2018 but not in 2019" is not "in 2019 but not in 2018".
+    """
+    return tuple(lit.strip("'\"").lower() for lit in _LITERAL_RE.findall(question or ""))
+
+
+class HashingEmbedder:
+    """
+    Offline embedding using the hashing trick: words plus word bigrams, so "lowest to highest"
+    and "highest to lowest" land apart. No model, no network.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, question: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        tokens = tokenize(question, keep=_DIRECTION_WORDS)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            vec[zlib.crc32(feature.encode("utf-8")) % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+class LangChainEmbedder:
+    """Wraps a LangChain Embeddings object (OpenAI, Ollama, ...)."""
+
+    def __init__(self, embeddings, dim: int):
+        self.embeddings = embeddings
+        self.dim = dim
+
+    def embed(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+def get_embedder():
+    kind = os.getenv("SIMILARITY_EMBEDDINGS", "hashing").lower()
+    if kind == "hashing":
+        return HashingEmbedder(dim=int(os.getenv("SIMILARITY_EMBEDDING_DIM", "512")))
+    if kind == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        model = os.getenv("SIMILARITY_EMBEDDING_MODEL", "text-embedding-3-small")
+        return LangChainEmbedder(OpenAIEmbeddings(model=model), dim=int(os.getenv("SIMILARITY_EMBEDDING_DIM", "1536")))
+    if kind == "ollama":
+        from langchain_community.embeddings import OllamaEmbeddings
+        kwargs = {"model": os.getenv("SIMILARITY_EMBEDDING_MODEL", "nomic-embed-text")}
+        if os.getenv("OLLAMA_BASE_URL"):
+            kwargs["base_url"] = os.getenv("OLLAMA_BASE_URL")
+        return LangChainEmbedder(OllamaEmbeddings(**kwargs), dim=int(os.getenv("SIMILARITY_EMBEDDING_DIM", "768")))
+    raise RuntimeError(f"Unsupported similarity embeddings: {kind}")
+
+
+class NumpyQuestionIndex:
+    """In-process index of question -> SQL pairs for a single semantic-layer version."""
+
+    def __init__(self, dim: int, max_entries: int = 1000):
+        self.dim = dim
+        self.max_entries = max(1, int(max_entries))
+        self.version: Optional[str] = None
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._entries: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _reset(self, version: Optional[str]) -> None:
+        self.version = version
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._entries = []
+
+    def search(self, version: str, vector: np.ndarray, literals: tuple, threshold: float) -> Optional[dict]:
+        with self._lock:
+            if version != self.version or not self._entries:
+                return None
+            scores = self._vectors @ vector
+            for idx in np.argsort(-scores):
+                score = float(scores[idx])
+                if score < threshold:
+                    break
+                entry = self._entries[idx]
+                if entry["literals"] == literals:
+                    entry["last_used"] = time.monotonic()
+                    return {"question": entry["question"], "sql": entry["sql"], "similarity": score}
+            return None
+
+    def add(self, version: str, question: str, sql: str, vector: np.ndarray, literals: tuple) -> None:
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            for idx, entry in enumerate(self._entries):
+                if entry["question"] == question:
+                    entry.update(sql=sql, last_used=time.monotonic())
+                    return
+            if len(self._entries) >= self.max_entries:
+                # Evict the least recently used pair
+                victim = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                del self._entries[victim]
+                self._vectors = np.delete(self._vectors, victim, axis=0)
+            self._entries.append({"question": question, "sql": sql, "literals": literals, "last_used": time.monotonic()})
+            self._vectors = np.vstack([self._vectors, vector.reshape(1, -1)])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset(None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PgVectorQuestionIndex:
+    """Same interface as NumpyQuestionIndex, stored in Postgres with the pgvector extension."""
+
+    def __init__(self, engine: Engine, dim: int, max_entries: int = 10000, table: str = "question_sql_cache"):
+        self.engine = engine
+        self.dim = dim
+        self.max_entries = max(1, int(max_entries))
+        self.table = table
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id BIGSERIAL PRIMARY KEY,
+                    layer_version TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    literals TEXT NOT NULL,
+                    embedding vector({dim}) NOT NULL,
+                    last_used TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    UNIQUE (layer_version, question)
+                )
+                """
+            ))
+
+    @staticmethod
+    def _vector_literal(vector: np.ndarray) -> str:
+        return "[" + ",".join(f"{x:.6f}" for x in vector.tolist()) + "]"
+
+    def search(self, version: str, vector: np.ndarray, literals: tuple, threshold: float) -> Optional[dict]:
+        q = text(
+            f"""
+            SELECT id, question, sql, 1 - (embedding <=> CAST(:vec AS vector)) AS similarity
+            FROM {self.table}
+            WHERE layer_version = :version AND literals = :literals
+            ORDER BY embedding <=> CAST(:vec AS vector)
+            LIMIT 1
+            """
+        )
+        with self.engine.begin() as conn:
+            row = conn.execute(q, {
+                "vec": self._vector_literal(vector),
+                "version": version,
+                "literals": "|".join(literals),
+            }).fetchone()
+            if row is None or float(row.similarity) < threshold:
+                return None
+            conn.execute(text(f"UPDATE {self.table} SET last_used = now() WHERE id = :id"), {"id": row.id})
+        return {"question": row.question, "sql": row.sql, "similarity": float(row.similarity)}
+
+    def add(self, version: str, question: str, sql: str, vector: np.ndarray, literals: tuple) -> None:
+        with self.engine.begin() as conn:
+            # Rows from older semantic-layer versions can never match again
+            conn.execute(text(f"DELETE FROM {self.table} WHERE layer_version <> :version"), {"version": version})
+            conn.execute(text(
+                f"""
+                INSERT INTO {self.table} (layer_version, question, sql, literals, embedding)
+                VALUES (:version, :question, :sql, :literals, CAST(:vec AS vector))
+                ON CONFLICT (layer_version, question)
+                DO UPDATE SET sql = EXCLUDED.sql, last_used = now()
+                """
+            ), {
+                "version": version,
+                "question": question,
+                "sql": sql,
+                "literals": "|".join(literals),
+                "vec": self._vector_literal(vector),
+            })
+            conn.execute(text(
+                f"""
+                DELETE FROM {self.table} WHERE id IN (
+                    SELECT id FROM {self.table} ORDER BY last_used DESC OFFSET :keep
+                )
+                """
+            ), {"keep": self.max_entries})
+
+    def clear(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {self.table}"))
+
+    def __len__(self) -> int:
+        with self.engine.connect() as conn:
+            return int(conn.execute(text(f"SELECT COUNT(*) FROM {self.table}")).scalar() or 0)
+
+
+class SimilarityCache:
+    """Reuses SQL from earlier successful questions whose embedding is close enough."""
+
+    def __init__(self, embedder, index, threshold: float = 0.92):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, question: str, version: str) -> Optional[dict]:
+        match = self.index.search(version, self.embedder.embed(question), question_literals(question), self.threshold)
+        if match is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return match
+
+    def remember(self, question: str, sql: str, version: str) -> None:
+        self.index.add(version, question.strip(), sql, self.embedder.embed(question), question_literals(question))
+
+    def clear(self) -> None:
+        self.index.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.index).__name__,
+            "size": len(self.index),
+            "max_entries": self.index.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+def build_similarity_cache(engine_factory=None) -> Optional[SimilarityCache]:
+    """Builds the cache from env settings; returns None when SIMILARITY_CACHE_ENABLED is off."""
+    if os.getenv("SIMILARITY_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    embedder = get_embedder()
+    threshold = float(os.getenv("SIMILARITY_CACHE_THRESHOLD", "0.92"))
+    max_entries = int(os.getenv("SIMILARITY_CACHE_MAX_ENTRIES", "1000"))
+    backend = os.getenv("SIMILARITY_CACHE_BACKEND", "numpy").lower()
+    if backend == "pgvector":
+        if engine_factory is None:
+            raise RuntimeError("pgvector similarity cache needs a database engine")
+        index = PgVectorQuestionIndex(engine_factory(), dim=embedder.dim, max_entries=max_entries)
+    elif backend == "numpy":
+        index = NumpyQuestionIndex(dim=embedder.dim, max_entries=max_entries)
+    else:
+        raise RuntimeError(f"Unsupported similarity cache backend: {backend}")
+    return SimilarityCache(embedder, index, threshold=threshold)
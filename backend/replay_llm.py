@@ -0,0 +1,105 @@
+"""
+Deterministic stand-in for the LLM (LLM_PROVIDER=replay): answers each generation prompt
+with the canned SQL of the question it contains, after LLM_REPLAY_LATENCY_MS. Used by the
+load test (backend/load_test.py) and anywhere the pipeline has to run without a network.
+
+LLM_REPLAY_PATH points at a JSON object of {question: sql}; the default pairs match the
+star schema (backend/semantic_config.json).
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+# Mostly questions the metric compiler cannot answer, so they reach the LLM
+DEFAULT_REPLAY_PAIRS: Dict[str, str] = {
+    "how many dealers are there": "SELECT COUNT(*) AS dealers FROM dealer",
+    "top 10 dealers by revenue": (
+        "SELECT d.dealer_nm, SUM(r.revenue) AS total_revenue FROM revenue r "
+        "JOIN dealer d ON r.dealer_id = d.dealer_id GROUP BY d.dealer_nm ORDER BY total_revenue DESC LIMIT 10"
+    ),
+    "units sold by model in 2019": (
+        "SELECT p.model_name, SUM(r.units_sold) AS units FROM revenue r "
+        "JOIN product p ON r.model_id = p.model_id JOIN date dt ON r.date_id = dt.date_id "
+        "WHERE dt.year = 2019 GROUP BY p.model_name ORDER BY units DESC"
+    ),
+    "revenue by country": (
+        "SELECT c.country_name, SUM(r.revenue) AS total_revenue FROM revenue r "
+        "JOIN dealer d ON r.dealer_id = d.dealer_id JOIN country c ON d.country_id = c.country_id "
+        "GROUP BY c.country_name ORDER BY total_revenue DESC"
+    ),
+    "average revenue per unit by quarter": (
+        "SELECT dt.year, dt.quarter, SUM(r.revenue) / NULLIF(SUM(r.units_sold), 0) AS revenue_per_unit "
+        "FROM revenue r JOIN date dt ON r.date_id = dt.date_id GROUP BY dt.year, dt.quarter ORDER BY dt.year, dt.quarter"
+    ),
+    "which branches sold the most units": (
+        "SELECT b.branch_nm, SUM(r.units_sold) AS units FROM revenue r "
+        "JOIN branch b ON r.branch_id = b.branch_id GROUP BY b.branch_nm ORDER BY units DESC LIMIT 20"
+    ),
+    "monthly revenue trend for 2018": (
+        "SELECT dt.month, SUM(r.revenue) AS total_revenue FROM revenue r "
+        "JOIN date dt ON r.date_id = dt.date_id WHERE dt.year = 2018 GROUP BY dt.month ORDER BY dt.month"
+    ),
+    "list the products": "SELECT product_id, product_name, model_id, model_name FROM product ORDER BY model_id",
+}
+DEFAULT_FALLBACK_SQL = "SELECT COUNT(*) AS fact_rows FROM revenue"
+
+_QUESTION_RE = re.compile(r"^Question:\s*(.*)$", re.M)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower().rstrip("?!. ")
+
+
+def load_replay_pairs(path: Optional[str] = None) -> Dict[str, str]:
+    path = path or os.getenv("LLM_REPLAY_PATH")
+    if not path:
+        return dict(DEFAULT_REPLAY_PAIRS)
+    with open(path) as f:
+        return json.load(f)
+
+
+class ReplayLLM(LLM):
+    """Replays canned SQL by question; questions only need to contain a canned one ("... (run 7)")."""
+
+    pairs: Dict[str, str] = {}
+    latency_ms: float = 0.0
+    fallback_sql: str = DEFAULT_FALLBACK_SQL
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def reply(self, prompt: str) -> str:
+        match = _QUESTION_RE.search(prompt)
+        if match is None:
+            # Not a generation or repair prompt, e.g. the warm-up ping
+            return "OK"
+        question = _normalize(match.group(1))
+        known = [q for q in self.pairs if _normalize(q) in question]
+        if not known:
+            return self.fallback_sql
+        return self.pairs[max(known, key=len)]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        return self.reply(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self.reply(prompt)
+
+
+def build_replay_llm(callbacks: Optional[list] = None) -> ReplayLLM:
+    return ReplayLLM(
+        pairs=load_replay_pairs(),
+        latency_ms=float(os.getenv("LLM_REPLAY_LATENCY_MS", "0")),
+        fallback_sql=os.getenv("LLM_REPLAY_FALLBACK_SQL", DEFAULT_FALLBACK_SQL),
+        callbacks=callbacks,
+    )
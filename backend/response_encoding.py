@@ -0,0 +1,234 @@
+"""
+Negotiated encodings for query results.
+
+The Accept header picks the format of /query's body:
+
+    application/json                          rows as lists (the default)
+    application/vnd.text-to-sql.columnar+json one array per column, far smaller for wide results
+    application/vnd.apache.arrow.stream       Arrow IPC stream, for programmatic clients (needs pyarrow)
+
+Every query result carries ``column_types`` (integer, number, string, boolean, date,
+datetime, null) so clients can render and convert values without guessing. JSON is
+written with orjson when it is installed, which handles dates and is several times faster
+on Decimal-heavy results. Accept-Encoding then selects gzip or zstd (with zstandard
+installed) for bodies above RESPONSE_COMPRESS_MIN_BYTES.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # falls back to the json module
+    orjson = None  # type: ignore
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow responses are not offered
+    pa = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # only gzip is offered
+    zstandard = None  # type: ignore
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.text-to-sql.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Below this the compressed body is barely smaller and costs a round of CPU
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_ZSTD_LEVEL = int(os.getenv("RESPONSE_ZSTD_LEVEL", "3"))
+
+
+def available_media_types() -> List[str]:
+    types = [JSON_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE]
+    if pa is not None:
+        types.append(ARROW_MEDIA_TYPE)
+    return types
+
+
+def _parse_accept(header: str) -> List[Tuple[str, float]]:
+    """[(media range, q)] of an Accept or Accept-Encoding header, in header order."""
+    entries = []
+    for part in header.split(","):
+        value, *params = [p.strip() for p in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        entries.append((value.lower(), q))
+    return entries
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """
+    The best available format for the Accept header. JSON when nothing it lists is
+    available (Arrow without pyarrow, text/html, ...): existing clients keep working, and
+    the Content-Type tells them what they got.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    available = available_media_types()
+    best, best_rank = None, (0.0, -1)
+    for media_range, q in _parse_accept(accept):
+        if media_range in available:
+            candidate, specificity = media_range, 2
+        elif media_range in ("*/*", "application/*"):
+            candidate, specificity = JSON_MEDIA_TYPE, 0 if media_range == "*/*" else 1
+        else:
+            continue
+        # Higher q wins, then the more specific range, then header order
+        if q > 0 and (q, specificity) > best_rank:
+            best, best_rank = candidate, (q, specificity)
+    return best or JSON_MEDIA_TYPE
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """zstd or gzip, whichever the client prefers among those available; None for identity."""
+    if not RESPONSE_COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    offered = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    quality = {}
+    for coding, q in _parse_accept(accept_encoding):
+        for candidate in (offered if coding == "*" else [coding] if coding in offered else []):
+            # An explicit entry overrides the wildcard
+            if coding != "*" or candidate not in quality:
+                quality[candidate] = q
+    # Ties go to the server's order: zstd is faster at a better ratio
+    ranked = sorted((c for c in offered if quality.get(c, 0) > 0), key=lambda c: -quality[c])
+    return ranked[0] if ranked else None
+
+
+def json_value(value):
+    """What a non-JSON database value becomes in a JSON body."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def column_type(values) -> str:
+    """The type of a result column, from its first non-null value."""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "boolean"
+        if isinstance(value, int):
+            return "integer"
+        if isinstance(value, (float, Decimal)):
+            return "number"
+        if isinstance(value, datetime):
+            return "datetime"
+        if isinstance(value, date):
+            return "date"
+        return "string"
+    return "null"
+
+
+def column_types(columns: List[str], rows: list) -> List[dict]:
+    return [{"name": name, "type": column_type(row[i] for row in rows)} for i, name in enumerate(columns)]
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        # Dates and datetimes natively; Decimal and the rest through json_value
+        return orjson.dumps(payload, default=json_value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=json_value, ensure_ascii=False).encode("utf-8")
+
+
+def to_columnar(response: dict) -> dict:
+    """A query result with ``data`` (one list per column) in place of ``rows``."""
+    rows = response.get("rows") or []
+    columnar = {key: value for key, value in response.items() if key != "rows"}
+    columnar["row_count"] = len(rows)
+    columnar["data"] = [list(column) for column in zip(*rows)] if rows else [[] for _ in response.get("columns", [])]
+    return columnar
+
+
+_ARROW_TYPES = {
+    "integer": "int64",
+    "number": "float64",
+    "boolean": "bool_",
+    "date": "date32",
+    "string": "string",
+    "null": "null",
+}
+
+
+def _arrow_array(values: list, kind: str):
+    if kind == "datetime":
+        arrow_type = pa.timestamp("us")
+    else:
+        arrow_type = getattr(pa, _ARROW_TYPES[kind])()
+    try:
+        if kind == "number":
+            values = [float(v) if v is not None else None for v in values]
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, TypeError, ValueError):
+        # A column whose later values do not fit its first one's type
+        return pa.array([json_value(v) if v is not None else None for v in values], type=pa.string())
+
+
+def to_arrow_ipc(response: dict) -> bytes:
+    """
+    The result as an Arrow IPC stream. Everything but the rows (sql, path, column types,
+    ...) travels as JSON in the schema metadata under b"text_to_sql".
+    """
+    rows = response.get("rows") or []
+    types = response.get("column_types") or column_types(response["columns"], rows)
+    arrays = [_arrow_array([row[i] for row in rows], t["type"]) for i, t in enumerate(types)]
+    meta = {key: value for key, value in response.items() if key != "rows"}
+    table = pa.Table.from_arrays(arrays, names=[t["name"] for t in types], metadata={b"text_to_sql": dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_payload(payload: dict, media_type: str) -> Tuple[bytes, str]:
+    """
+    (body, media type) of a /query payload. Only a query result changes shape; errors stay
+    JSON whatever was asked for, so clients check the Content-Type.
+    """
+    response = payload.get("response")
+    is_result = isinstance(response, dict) and response.get("type") == "query_result"
+    if media_type == ARROW_MEDIA_TYPE and is_result:
+        return to_arrow_ipc(response), ARROW_MEDIA_TYPE
+    if media_type == COLUMNAR_MEDIA_TYPE and is_result:
+        return dumps({**payload, "response": to_columnar(response)}), COLUMNAR_MEDIA_TYPE
+    return dumps(payload), JSON_MEDIA_TYPE
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """(body, Content-Encoding); small bodies go out uncompressed."""
+    if encoding is None or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=RESPONSE_ZSTD_LEVEL).compress(body), "zstd"
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL), "gzip"
+
+
+def encoding_stats() -> dict:
+    return {
+        "media_types": available_media_types(),
+        "json_serializer": "orjson" if orjson is not None else "json",
+        "compression": (["zstd", "gzip"] if zstandard is not None else ["gzip"]) if RESPONSE_COMPRESSION_ENABLED else [],
+        "compress_min_bytes": RESPONSE_COMPRESS_MIN_BYTES,
+    }
+
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except Exception:  # pragma: no cover - pyarrow is optional
+    pa = None  # type: ignore
+    feather = None  # type: ignore
+
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace and trailing semicolons outside string literals; literals keep their case."""
+    parts = _QUOTED_RE.split(sql.strip().rstrip(";").strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip()
+
+
+def referenced_tables(sql: str, known_tables: Iterable[str]) -> List[str]:
+    """Known table names mentioned anywhere in the SQL. Over-matching only costs extra invalidation."""
+    lowered = _QUOTED_RE.sub("''", sql).lower()
+    return sorted(t for t in known_tables if re.search(rf"\b{re.escape(t.lower())}\b", lowered))
+
+
+def estimate_result_bytes(columns: list, rows: list) -> int:
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(c) for c in columns)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(cell) for cell in row)
+    return size
+
+
+# Stands in for the tables of SQL that references none the freshness probe knows
+UNTRACKED = "*"
+
+
+class ResultCache:
+    """
+    Executed-result cache keyed on normalized SQL.
+
+    An entry remembers the last-load timestamp (from the /freshness logic) of every table its SQL
+    references and is served only while those timestamps are unchanged. Tables without a
+    timestamp column cannot be tracked, so results touching them expire after ``untracked_ttl``.
+    Memory is bounded by ``max_bytes`` with LRU eviction; evicted entries spill to ``spill_dir``
+    (Arrow IPC when pyarrow is installed, pickle otherwise) up to ``spill_max_bytes``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entry_bytes: int = 32 * 1024 * 1024,
+        untracked_ttl: float = 300,
+        spill_dir: Optional[str] = None,
+        spill_max_bytes: int = 2 * 1024 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.untracked_ttl = untracked_ttl
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._disk: "OrderedDict[str, dict]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _is_valid(self, entry: dict, table_versions: Dict[str, Optional[str]]) -> bool:
+        for table, version in entry["versions"].items():
+            if version is None:
+                if time.time() - entry["created"] > self.untracked_ttl:
+                    return False
+            elif table_versions.get(table) != version:
+                return False
+        return True
+
+    @staticmethod
+    def _key(normalized: str, namespace: str) -> str:
+        # The namespace (the data source) keeps equal SQL against different warehouses apart
+        return f"{namespace}\x1f{normalized}" if namespace else normalized
+
+    def get(self, sql: str, table_versions: Dict[str, Optional[str]], namespace: str = "") -> Optional[tuple]:
+        key = self._key(normalize_sql(sql), namespace)
+        with self._lock:
+            entry = self._memory.get(key)
+            from_disk = False
+            if entry is None:
+                entry = self._disk.get(key)
+                from_disk = entry is not None
+            if entry is None:
+                self.misses += 1
+                return None
+            if not self._is_valid(entry, table_versions):
+                self._drop(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if from_disk:
+                try:
+                    columns, rows = self._read_spill(entry["path"])
+                except Exception:
+                    self._drop(key)
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+            else:
+                self._memory.move_to_end(key)
+                columns, rows = entry["columns"], entry["rows"]
+            self.hits += 1
+            return columns, rows
+
+    def put(self, sql: str, columns: list, rows: list, table_versions: Dict[str, Optional[str]], namespace: str = "") -> None:
+        nbytes = estimate_result_bytes(columns, rows)
+        if nbytes > self.max_entry_bytes:
+            return
+        normalized = normalize_sql(sql)
+        key = self._key(normalized, namespace)
+        versions = {t: table_versions.get(t) for t in referenced_tables(normalized, table_versions)}
+        if not versions:
+            # Nothing we can track (views, table functions, tables missing from freshness):
+            # an untracked placeholder makes the entry expire after untracked_ttl
+            versions = {UNTRACKED: None}
+        entry = {
+            "columns": columns,
+            "rows": rows,
+            "versions": versions,
+            "created": time.time(),
+            "bytes": nbytes,
+        }
+        with self._lock:
+            self._drop(key)
+            self._memory[key] = entry
+            self._memory_bytes += nbytes
+            while self._memory_bytes > self.max_bytes and self._memory:
+                victim_key, victim = self._memory.popitem(last=False)
+                self._memory_bytes -= victim["bytes"]
+                self._spill(victim_key, victim)
+
+    def _drop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry["bytes"]
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry["bytes"]
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    def _spill(self, key: str, entry: dict) -> None:
+        if not self.spill_dir or entry["bytes"] > self.spill_max_bytes:
+            return
+        try:
+            path = self._write_spill(key, entry["columns"], entry["rows"])
+        except Exception:
+            return
+        self._disk[key] = {
+            "path": path,
+            "versions": entry["versions"],
+            "created": entry["created"],
+            "bytes": os.path.getsize(path),
+        }
+        self._disk_bytes += self._disk[key]["bytes"]
+        while self._disk_bytes > self.spill_max_bytes and self._disk:
+            victim_key = next(iter(self._disk))
+            self._drop(victim_key)
+
+    def _write_spill(self, key: str, columns: list, rows: list) -> str:
+        stem = os.path.join(self.spill_dir, hashlib.sha256(key.encode("utf-8")).hexdigest())
+        if pa is not None and len(set(columns)) == len(columns):
+            try:
+                table = pa.table({c: [row[i] for row in rows] for i, c in enumerate(columns)})
+                feather.write_feather(table, stem + ".arrow", compression="zstd")
+                return stem + ".arrow"
+            except Exception:
+                pass  # mixed-type columns; fall through to pickle
+        with open(stem + ".pkl", "wb") as f:
+            pickle.dump((columns, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return stem + ".pkl"
+
+    @staticmethod
+    def _read_spill(path: str) -> tuple:
+        if path.endswith(".arrow"):
+            table = feather.read_table(path)
+            columns = table.column_names
+            return columns, [list(row) for row in zip(*(table.column(c).to_pylist() for c in columns))]
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._memory) + list(self._disk):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "spill_dir": self.spill_dir,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+def build_result_cache() -> Optional[ResultCache]:
+    if os.getenv("RESULT_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return ResultCache(
+        max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        max_entry_bytes=int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(32 * 1024 * 1024))),
+        untracked_ttl=float(os.getenv("RESULT_CACHE_UNTRACKED_TTL", "300")),
+        spill_dir=os.getenv("RESULT_CACHE_SPILL_DIR") or None,
+        spill_max_bytes=int(os.getenv("RESULT_CACHE_SPILL_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+    )
@@ -0,0 +1,577 @@
+"""
+Pre-aggregated rollup tables derived from the semantic layer, and the rewriter that routes
+generated SQL to them.
+
+The semantic layer's "rollups" section names grains per fact table, e.g.
+``{"revenue": {"year_branch": ["date.year", "branch"]}}``: "table.column" adds one column, a bare
+table adds all of its columns. Each grain becomes a table ``rollup_<fact>__<grain>`` holding
+SUM() of every column the fact's metrics sum, grouped by the grain's columns and joined along
+the same paths the metric compiler uses.
+
+    python -m backend.rollups            # incremental refresh of every rollup
+    python -m backend.rollups --full     # rebuild them all
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except Exception:  # pragma: no cover - sqlglot is optional; without it nothing is rewritten
+    sqlglot = None  # type: ignore
+    exp = None  # type: ignore
+
+from .local_engine import create_local_engine, is_local_url
+from .schema_retrieval import build_join_graph, shortest_join_path
+from .schema_snapshot import fetch_schema, probe_freshness, timestamp_column
+
+ROLLUP_PREFIX = "rollup_"
+ROLLUP_STATE_TABLE = "rollup_state"
+# Beyond this share of a rollup's groups, recomputing everything is cheaper than patching
+ROLLUP_INCREMENTAL_MAX_FRACTION = float(os.getenv("ROLLUP_INCREMENTAL_MAX_FRACTION", "0.25"))
+
+_SUM_RE = re.compile(r"\bSUM\(\s*(\w+)\s*\)", re.IGNORECASE)
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite", "mysql": "mysql", "duckdb": "duckdb"}
+
+
+class RollupDefinition:
+    """One grain of one fact table: the dimension columns, join edges and summed measures."""
+
+    def __init__(self, fact: str, grain: str, dims: List[Tuple[str, str]], edges: List[tuple], measures: List[str]):
+        self.fact = fact
+        self.grain = grain
+        self.name = f"{ROLLUP_PREFIX}{fact.lower()}__{grain.lower()}"
+        self.dims = dims
+        self.edges = edges
+        self.measures = measures
+        self.tables = [fact] + [right for _, _, right, _ in edges]
+        self.dim_set = {(t.lower(), c.lower()) for t, c in dims}
+        self.edge_set = {frozenset({(l.lower(), lc.lower()), (r.lower(), rc.lower())}) for l, lc, r, rc in edges}
+        payload = json.dumps([fact, dims, edges, measures], sort_keys=True)
+        self.definition_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def column_for(table: str, column: str) -> str:
+        return f"{table}__{column}".lower()
+
+    def _aliases(self) -> Dict[str, str]:
+        return {table: f"t{i}" for i, table in enumerate(self.tables)}
+
+    def select_sql(self, where: str = "") -> str:
+        aliases = self._aliases()
+        dim_exprs = [f"{aliases[t]}.{c}" for t, c in self.dims]
+        select = [f"{expr} AS {self.column_for(t, c)}" for expr, (t, c) in zip(dim_exprs, self.dims)]
+        select += [f"SUM({aliases[self.fact]}.{m}) AS {m.lower()}" for m in self.measures]
+        lines = [f"SELECT {', '.join(select)}", f"FROM {self.fact} {aliases[self.fact]}"]
+        for left, left_col, right, right_col in self.edges:
+            lines.append(f"JOIN {right} {aliases[right]} ON {aliases[left]}.{left_col} = {aliases[right]}.{right_col}")
+        if where:
+            lines.append(f"WHERE {where}")
+        if dim_exprs:
+            lines.append("GROUP BY " + ", ".join(dim_exprs))
+        return "\n".join(lines)
+
+    def changed_keys_sql(self, timestamp_col: str) -> str:
+        aliases = self._aliases()
+        dim_exprs = [f"{aliases[t]}.{c}" for t, c in self.dims]
+        lines = [f"SELECT DISTINCT {', '.join(dim_exprs)}", f"FROM {self.fact} {aliases[self.fact]}"]
+        for left, left_col, right, right_col in self.edges:
+            lines.append(f"JOIN {right} {aliases[right]} ON {aliases[left]}.{left_col} = {aliases[right]}.{right_col}")
+        # A load stamps all of its rows with one timestamp, so everything up to the watermark is in
+        lines.append(f"WHERE {aliases[self.fact]}.{timestamp_col} > :watermark")
+        return "\n".join(lines)
+
+    def key_condition(self, nulls: Tuple[bool, ...], qualified: bool) -> str:
+        aliases = self._aliases()
+        conditions = []
+        for i, ((table, column), is_null) in enumerate(zip(self.dims, nulls)):
+            target = f"{aliases[table]}.{column}" if qualified else self.column_for(table, column)
+            conditions.append(f"{target} IS NULL" if is_null else f"{target} = :k{i}")
+        return " AND ".join(conditions)
+
+
+def additive_measures(table_config: dict) -> List[str]:
+    """Columns the table's metrics only ever use inside SUM(); their sums roll up exactly."""
+    columns = {c.lower(): c for c in table_config.get("columns", {})}
+    found = []
+    for expr in table_config.get("metrics", {}).values():
+        for name in _SUM_RE.findall(expr):
+            column = columns.get(name.lower())
+            if column and column not in found:
+                found.append(column)
+    return found
+
+
+def build_rollup_definitions(semantic_layer: dict, db_schema: Optional[dict] = None) -> List[RollupDefinition]:
+    tables = semantic_layer.get("tables", {})
+    by_lower = {t.lower(): t for t in tables}
+    graph = build_join_graph(semantic_layer, db_schema)
+    definitions = []
+    for fact_name, grains in semantic_layer.get("rollups", {}).items():
+        fact = by_lower.get(fact_name.lower())
+        if fact is None:
+            raise ValueError(f"rollups: unknown fact table {fact_name}")
+        measures = additive_measures(tables[fact])
+        if not measures:
+            raise ValueError(f"rollups: {fact} has no SUM() metrics to roll up")
+        for grain, entries in grains.items():
+            dims: List[Tuple[str, str]] = []
+            for entry in entries:
+                table_name, _, column_name = entry.partition(".")
+                table = by_lower.get(table_name.lower())
+                if table is None:
+                    raise ValueError(f"rollups: unknown table in {entry}")
+                columns = {c.lower(): c for c in tables[table].get("columns", {})}
+                if column_name and column_name.lower() not in columns:
+                    raise ValueError(f"rollups: unknown column {entry}")
+                wanted = [columns[column_name.lower()]] if column_name else list(columns.values())
+                dims += [(table, c) for c in wanted if (table, c) not in dims]
+
+            edges: List[tuple] = []
+            for table in dict.fromkeys(t for t, _ in dims):
+                if table == fact:
+                    continue
+                path = shortest_join_path(graph, {fact}, table)
+                if path[0] != fact:
+                    raise ValueError(f"rollups: no join path from {fact} to {table}")
+                for left, right in zip(path, path[1:]):
+                    left_col, right_col = graph[left][right]
+                    if (left, left_col, right, right_col) not in edges:
+                        edges.append((left, left_col, right, right_col))
+            definitions.append(RollupDefinition(fact, grain, dims, edges, measures))
+    return definitions
+
+
+def ensure_state_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} ("
+            "name VARCHAR(128) PRIMARY KEY, definition_hash VARCHAR(32), source_versions TEXT, "
+            "fact_rows BIGINT, row_count BIGINT, refreshed_at VARCHAR(64))"
+        ))
+
+
+def load_rollup_state(engine: Engine) -> Dict[str, dict]:
+    if ROLLUP_STATE_TABLE not in {t.lower() for t in inspect(engine).get_table_names()}:
+        return {}
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            f"SELECT name, definition_hash, source_versions, fact_rows, row_count, refreshed_at FROM {ROLLUP_STATE_TABLE}"
+        )).fetchall()
+    return {
+        row[0]: {
+            "definition_hash": row[1],
+            "source_versions": json.loads(row[2] or "{}"),
+            "fact_rows": row[3],
+            "row_count": row[4],
+            "refreshed_at": row[5],
+        }
+        for row in rows
+    }
+
+
+def _save_state(conn, definition: RollupDefinition, source_versions: dict, fact_rows: int, row_count: int) -> None:
+    conn.execute(text(f"DELETE FROM {ROLLUP_STATE_TABLE} WHERE name = :name"), {"name": definition.name})
+    conn.execute(
+        text(
+            f"INSERT INTO {ROLLUP_STATE_TABLE} (name, definition_hash, source_versions, fact_rows, row_count, refreshed_at) "
+            "VALUES (:name, :definition_hash, :source_versions, :fact_rows, :row_count, :refreshed_at)"
+        ),
+        {
+            "name": definition.name,
+            "definition_hash": definition.definition_hash,
+            "source_versions": json.dumps(source_versions, sort_keys=True),
+            "fact_rows": fact_rows,
+            "row_count": row_count,
+            "refreshed_at": datetime.utcnow().isoformat(),
+        },
+    )
+
+
+def _rebuild(engine: Engine, definition: RollupDefinition, source_versions: dict) -> int:
+    staging = f"{definition.name}__new"
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        conn.execute(text(f"CREATE TABLE {staging} AS {definition.select_sql()}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {definition.name}"))
+        conn.execute(text(f"ALTER TABLE {staging} RENAME TO {definition.name}"))
+        fact_rows = conn.execute(text(f"SELECT COUNT(*) FROM {definition.fact}")).scalar()
+        row_count = conn.execute(text(f"SELECT COUNT(*) FROM {definition.name}")).scalar()
+        _save_state(conn, definition, source_versions, fact_rows, row_count)
+    return row_count
+
+
+def _patch(engine: Engine, definition: RollupDefinition, previous: dict, source_versions: dict, timestamp_col: str) -> Optional[tuple]:
+    """Recomputes only the groups touched since the last refresh: (groups, rows), or None to rebuild."""
+    watermark = previous["source_versions"].get(definition.fact.lower())
+    columns = [definition.column_for(t, c) for t, c in definition.dims] + [m.lower() for m in definition.measures]
+    with engine.begin() as conn:
+        fact_rows = conn.execute(text(f"SELECT COUNT(*) FROM {definition.fact}")).scalar()
+        if fact_rows < (previous.get("fact_rows") or 0):
+            return None  # rows were deleted; timestamps cannot tell which groups shrank
+        keys = conn.execute(text(definition.changed_keys_sql(timestamp_col)), {"watermark": watermark}).fetchall()
+        if len(keys) > max(1, previous.get("row_count") or 0) * ROLLUP_INCREMENTAL_MAX_FRACTION:
+            return None
+
+        by_pattern: Dict[Tuple[bool, ...], List[dict]] = {}
+        for key in keys:
+            nulls = tuple(v is None for v in key)
+            params = {f"k{i}": v for i, v in enumerate(key) if v is not None}
+            by_pattern.setdefault(nulls, []).append(params)
+        for nulls, params in by_pattern.items():
+            conn.execute(text(f"DELETE FROM {definition.name} WHERE {definition.key_condition(nulls, qualified=False)}"), params)
+            insert = (
+                f"INSERT INTO {definition.name} ({', '.join(columns)}) "
+                + definition.select_sql(where=definition.key_condition(nulls, qualified=True))
+            )
+            conn.execute(text(insert), params)
+
+        row_count = conn.execute(text(f"SELECT COUNT(*) FROM {definition.name}")).scalar()
+        _save_state(conn, definition, source_versions, fact_rows, row_count)
+    return len(keys), row_count
+
+
+def refresh_rollups(
+    engine: Engine,
+    semantic_layer: dict,
+    full: bool = False,
+    names: Optional[List[str]] = None,
+    db_schema: Optional[dict] = None,
+) -> List[dict]:
+    """
+    Brings every rollup up to date with its source tables.
+
+    A rollup is patched incrementally when its fact table carries a load timestamp (see
+    schema_snapshot.TIMESTAMP_CANDIDATES), its dimension tables are unchanged and no fact
+    rows were deleted; otherwise it is rebuilt. A rollup over any table without a load
+    timestamp is always rebuilt: there is no way to tell whether that table changed.
+    """
+    schema = db_schema or fetch_schema(engine)
+    schema_tables = {t.lower(): tdef for t, tdef in schema.get("tables", {}).items()}
+    definitions = build_rollup_definitions(semantic_layer, schema)
+    ensure_state_table(engine)
+    state = load_rollup_state(engine)
+    # Versions are read before aggregating, so rows landing mid-refresh make the rollup look stale, not fresh
+    versions = {f["table"].lower(): f["last_loaded"] for f in probe_freshness(engine, schema)}
+
+    reports = []
+    for definition in definitions:
+        if names and definition.name not in names and definition.grain not in names:
+            continue
+        started = time.perf_counter()
+        source_versions = {t.lower(): versions.get(t.lower()) for t in definition.tables}
+        previous = state.get(definition.name)
+        timestamp_col = timestamp_column(schema_tables.get(definition.fact.lower(), {}))
+        report = {"rollup": definition.name, "mode": "full", "groups": 0, "rows": 0, "seconds": 0.0}
+
+        incremental = (
+            not full
+            and previous is not None
+            and definition.name in schema_tables
+            and previous["definition_hash"] == definition.definition_hash
+            and timestamp_col is not None
+            and all(v is not None for v in source_versions.values())
+            and previous["source_versions"].get(definition.fact.lower()) is not None
+            and all(previous["source_versions"].get(t.lower()) == source_versions[t.lower()] for t in definition.tables[1:])
+        )
+        if incremental and previous["source_versions"] == source_versions:
+            report.update(mode="unchanged", rows=previous["row_count"])
+        elif incremental:
+            patched = _patch(engine, definition, previous, source_versions, timestamp_col)
+            if patched is not None:
+                report.update(mode="incremental", groups=patched[0], rows=patched[1])
+        if report["mode"] == "full":
+            report["rows"] = _rebuild(engine, definition, source_versions)
+            report["groups"] = report["rows"]
+        report["seconds"] = time.perf_counter() - started
+        reports.append(report)
+    return reports
+
+
+class _NotRoutable(Exception):
+    pass
+
+
+class RollupRouter:
+    """
+    Rewrites aggregate SQL over a fact table to read the smallest rollup that covers it.
+
+    A query qualifies when it joins exactly the rollup's tables along the rollup's join
+    columns, aggregates only with SUM() over rolled-up measures, and every other column it
+    touches (SELECT, WHERE, GROUP BY, HAVING, ORDER BY) is one of the rollup's dimensions.
+    It must also aggregate (GROUP BY or a top-level SUM): a rollup has one row per group,
+    not one per fact row. Rollups whose source tables changed since their last refresh are
+    skipped, as are rollups over a table without a load timestamp, whose changes cannot be seen.
+    """
+
+    def __init__(self, engine_factory, layer_provider, schema_provider=None, catalog_ttl: float = 60):
+        self.engine_factory = engine_factory
+        self.layer_provider = layer_provider
+        self.schema_provider = schema_provider
+        self.catalog_ttl = catalog_ttl
+        self._catalog: Optional[List[tuple]] = None
+        self._catalog_layer: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.rewrites = 0
+        self.not_covered = 0
+        self.stale = 0
+        self.untracked = 0
+
+    def reload(self) -> None:
+        with self._lock:
+            self._catalog = None
+
+    def catalog(self) -> List[tuple]:
+        """[(definition, state)] for rollups that exist and match the current semantic layer."""
+        layer = self.layer_provider()
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.catalog_ttl
+            if self._catalog is None or expired or layer is not self._catalog_layer:
+                db_schema = self.schema_provider() if self.schema_provider else None
+                state = load_rollup_state(self.engine_factory())
+                self._catalog = [
+                    (definition, state[definition.name])
+                    for definition in build_rollup_definitions(layer, db_schema)
+                    if definition.name in state and state[definition.name]["definition_hash"] == definition.definition_hash
+                ]
+                self._catalog_layer = layer
+                self._loaded_at = time.monotonic()
+            return self._catalog
+
+    def rewrite(self, sql: str, table_versions: Dict[str, Optional[str]]) -> Optional[dict]:
+        """Returns {"sql", "rollup"} or None when no fresh rollup answers the query."""
+        if sqlglot is None:
+            return None
+        catalog = self.catalog()
+        if not catalog:
+            return None
+        dialect = _SQLGLOT_DIALECTS.get(self.engine_factory().dialect.name)
+        try:
+            tree = sqlglot.parse_one(sql, read=dialect)
+            shape = _analyze(tree, self.layer_provider().get("tables", {}))
+        except (_NotRoutable, sqlglot.errors.SqlglotError):
+            self.not_covered += 1
+            return None
+
+        best = None
+        stale = untracked = False
+        for definition, state in catalog:
+            covered = _covering_columns(definition, shape)
+            if covered is None:
+                continue
+            if any(table_versions.get(t.lower()) is None for t in definition.tables):
+                # No timestamp column (or an empty table): a reload would go unnoticed
+                untracked = True
+                continue
+            if any(state["source_versions"].get(t.lower()) != table_versions.get(t.lower()) for t in definition.tables):
+                stale = True
+                continue
+            if best is None or (state["row_count"] or 0) < (best[1]["row_count"] or 0):
+                best = (definition, state, covered)
+        if best is None:
+            if stale:
+                self.stale += 1
+            elif untracked:
+                self.untracked += 1
+            else:
+                self.not_covered += 1
+            return None
+
+        definition, _, covered = best
+        self.rewrites += 1
+        return {"sql": _rewrite(tree, shape, definition, covered).sql(dialect=dialect), "rollup": definition.name}
+
+    def stats(self) -> dict:
+        catalog = self._catalog or []
+        return {
+            "rollups": [
+                {"name": d.name, "rows": s["row_count"], "refreshed_at": s["refreshed_at"]} for d, s in catalog
+            ],
+            "rewrites": self.rewrites,
+            "not_covered": self.not_covered,
+            "stale": self.stale,
+            "untracked": self.untracked,
+            "enabled": sqlglot is not None,
+        }
+
+
+def _analyze(tree, tables_config: dict) -> dict:
+    """Tables, join edges, summed measures and plain column references of a single SELECT."""
+    if not isinstance(tree, exp.Select) or tree.args.get("with") or tree.args.get("distinct"):
+        raise _NotRoutable("not a plain SELECT")
+    if any(node is not tree for node in tree.find_all(exp.Select)) or tree.find(exp.Window):
+        raise _NotRoutable("subqueries or window functions")
+
+    aliases: Dict[str, str] = {}
+    for table in tree.find_all(exp.Table):
+        if table.args.get("db") or table.args.get("catalog"):
+            raise _NotRoutable("qualified table name")
+        aliases[table.alias_or_name.lower()] = table.name.lower()
+    if len(set(aliases.values())) != len(aliases):
+        raise _NotRoutable("table used twice")
+
+    columns_by_table = {t.lower(): {c.lower() for c in cfg.get("columns", {})} for t, cfg in tables_config.items()}
+    select_aliases = {e.alias.lower() for e in tree.expressions if isinstance(e, exp.Alias)}
+
+    def resolve(column) -> Optional[Tuple[str, str]]:
+        name = column.name.lower()
+        if column.table:
+            table = aliases.get(column.table.lower())
+            if table is None:
+                raise _NotRoutable(f"unknown alias {column.table}")
+            return table, name
+        owners = [t for t in set(aliases.values()) if name in columns_by_table.get(t, set())]
+        if not owners and name in select_aliases:
+            return None  # ORDER BY an output alias
+        if len(owners) != 1:
+            raise _NotRoutable(f"cannot place column {name}")
+        return owners[0], name
+
+    edges: Set[frozenset] = set()
+    for join in tree.args.get("joins") or []:
+        kind = (join.args.get("kind") or "").upper()
+        if join.args.get("side") or kind not in ("", "INNER") or join.args.get("using") or join.args.get("on") is None:
+            raise _NotRoutable("only inner joins with ON")
+        on = join.args["on"]
+        for condition in (on.flatten() if isinstance(on, exp.And) else [on]):
+            if not (isinstance(condition, exp.EQ) and isinstance(condition.left, exp.Column) and isinstance(condition.right, exp.Column)):
+                raise _NotRoutable("join condition is not column = column")
+            edges.add(frozenset({resolve(condition.left), resolve(condition.right)}))
+
+    for agg in tree.find_all(exp.AggFunc):
+        if not isinstance(agg, exp.Sum) or not isinstance(agg.this, exp.Column):
+            raise _NotRoutable("only SUM(column) rolls up")
+
+    # Without aggregation the query returns one row per fact row, which a rollup does not have
+    group = tree.args.get("group")
+    if group is None and not any(e.find(exp.AggFunc) for e in tree.expressions):
+        raise _NotRoutable("no GROUP BY or aggregate")
+    for select in tree.expressions:
+        expression = select.this if isinstance(select, exp.Alias) else select
+        if isinstance(expression, exp.Column):
+            continue
+        # Anything else must be built from SUMs only (SUM(a), SUM(a) / SUM(b), ...)
+        if not expression.find(exp.AggFunc) or any(c.find_ancestor(exp.AggFunc) is None for c in expression.find_all(exp.Column)):
+            raise _NotRoutable("SELECT items must be dimensions or SUMs of measures")
+
+    measures: Set[Tuple[str, str]] = set()
+    dims: Set[Tuple[str, str]] = set()
+    for column in tree.find_all(exp.Column):
+        if column.find_ancestor(exp.Join) is not None:
+            continue
+        ref = resolve(column)
+        if ref is None:
+            continue
+        (measures if column.find_ancestor(exp.AggFunc) is not None else dims).add(ref)
+
+    # Join columns are interchangeable: r.Branch_ID and b.Branch_ID name the same value
+    equivalents: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+    for edge in edges:
+        members = set(edge)
+        for ref in edge:
+            members |= equivalents.get(ref, set())
+        for ref in members:
+            equivalents[ref] = members
+
+    # A bare column in SELECT must be grouped on, or the rollup's finer rows would leak through
+    grouped: Set[Tuple[str, str]] = set()
+    for expression in (group.expressions if group is not None else []):
+        for column in expression.find_all(exp.Column):
+            ref = resolve(column)
+            if ref is not None:
+                grouped |= {ref} | equivalents.get(ref, set())
+    for select in tree.expressions:
+        expression = select.this if isinstance(select, exp.Alias) else select
+        if isinstance(expression, exp.Column) and resolve(expression) not in grouped:
+            raise _NotRoutable(f"{expression.sql()} is neither grouped nor aggregated")
+    return {
+        "tables": set(aliases.values()),
+        "edges": edges,
+        "measures": measures,
+        "dims": dims,
+        "equivalents": equivalents,
+        "resolve": resolve,
+    }
+
+
+def _covering_columns(definition: RollupDefinition, shape: dict) -> Optional[Dict[Tuple[str, str], str]]:
+    """Maps each referenced column to its rollup column, or None if the rollup cannot answer."""
+    fact = definition.fact.lower()
+    if shape["tables"] != {t.lower() for t in definition.tables} or shape["edges"] != definition.edge_set:
+        return None
+    measures = {m.lower() for m in definition.measures}
+    if any(table != fact or column not in measures for table, column in shape["measures"]):
+        return None
+    mapping = {(fact, m): m for m in measures}
+    for ref in shape["dims"]:
+        match = next((r for r in [ref] + sorted(shape["equivalents"].get(ref, ())) if r in definition.dim_set), None)
+        if match is None:
+            return None
+        mapping[ref] = definition.column_for(*match)
+    return mapping
+
+
+def _rewrite(tree, shape: dict, definition: RollupDefinition, mapping: dict):
+    rewritten = tree.copy()
+    # Keep the output column names the original query produced (d.year -> year)
+    for select in list(rewritten.expressions):
+        if isinstance(select, exp.Column):
+            identifier = select.this
+            name = identifier.name if identifier.quoted else identifier.name.lower()
+            select.replace(exp.alias_(select.copy(), name, quoted=identifier.quoted))
+    rewritten.set("joins", None)
+
+    def swap(node):
+        if isinstance(node, exp.Column):
+            ref = shape["resolve"](node)
+            if ref is not None:
+                return exp.column(mapping[ref], table="ru")
+        return node
+
+    rewritten = rewritten.transform(swap)
+    rewritten.from_(exp.alias_(exp.to_table(definition.name), "ru", table=True), copy=False)
+    return rewritten
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Create or refresh the semantic-layer rollup tables.")
+    parser.add_argument("--db-url", default=os.getenv("DB_URL"), help="SQLAlchemy URL (default: DB_URL)")
+    parser.add_argument("--semantic-layer", default=os.getenv("SEMANTIC_LAYER_PATH", "backend/semantic_config.json"))
+    parser.add_argument("--full", action="store_true", help="Rebuild instead of patching changed groups")
+    parser.add_argument("--rollups", nargs="*", help="Subset of rollups (table or grain names)")
+    args = parser.parse_args(argv)
+    if not args.db_url:
+        print("❌ No database URL (set DB_URL or pass --db-url)")
+        return 1
+
+    with open(args.semantic_layer) as f:
+        semantic_layer = json.load(f)
+    engine = create_local_engine(args.db_url) if is_local_url(args.db_url) else create_engine(args.db_url, pool_pre_ping=True)
+    try:
+        for report in refresh_rollups(engine, semantic_layer, full=args.full, names=args.rollups):
+            print_rollup_report(report)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    return 0
+
+
+def print_rollup_report(report: dict) -> None:
+    detail = f"{report['groups']} groups recomputed, " if report["mode"] == "incremental" else ""
+    print(f"✅ {report['rollup']}: {report['mode']}, {detail}{report['rows']} rows in {report['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import re
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from .question_index import tokenize
+
+try:
+    import tiktoken
+except Exception:  # pragma: no cover - tiktoken is optional
+    tiktoken = None  # type: ignore
+
+# Loaded on first use: get_encoding reads (or first downloads) the BPE file
+_encoding = None
+_encoding_built = False
+
+
+def get_encoding():
+    global _encoding, _encoding_built
+    if not _encoding_built:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base") if tiktoken is not None else None
+        except Exception:
+            _encoding = None
+        _encoding_built = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly four characters per token for English + SQL identifiers
+    return max(1, len(text) // 4)
+
+
+_YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+_MONTHS = {
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+}
+
+
+def question_tokens(question: str) -> List[str]:
+    tokens = tokenize(question)
+    # Literal dates point at date columns even when the word "year" never appears
+    if _YEAR_RE.search(question or ""):
+        tokens.append("year")
+    if _MONTHS & set(tokens):
+        tokens.append("month")
+    return tokens
+
+
+def _phrase_tokens(phrase: str) -> List[str]:
+    return tokenize(phrase.replace("_", " "))
+
+
+def _contains(haystack: List[str], needle: List[str]) -> bool:
+    if not needle or len(needle) > len(haystack):
+        return False
+    n = len(needle)
+    return any(haystack[i:i + n] == needle for i in range(len(haystack) - n + 1))
+
+
+def build_phrase_index(semantic_layer: dict) -> Dict[str, dict]:
+    """Tokenized table names, column names + synonyms and metric names, per table."""
+    index: Dict[str, dict] = {}
+    for table, config in semantic_layer.get("tables", {}).items():
+        index[table] = {
+            "table": _phrase_tokens(table),
+            "columns": {
+                column: [_phrase_tokens(phrase) for phrase in [column] + list(synonyms or [])]
+                for column, synonyms in config.get("columns", {}).items()
+            },
+            "metrics": [_phrase_tokens(metric) for metric in config.get("metrics", {})],
+        }
+    return index
+
+
+def score_semantic_layer(question: str, semantic_layer: dict, phrase_index: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """Scores every table and column against the question using names, synonyms and metrics."""
+    q_tokens = question_tokens(question)
+    phrase_index = phrase_index if phrase_index is not None else build_phrase_index(semantic_layer)
+    scores: Dict[str, dict] = {}
+    for table, phrases in phrase_index.items():
+        table_score = 2.0 if _contains(q_tokens, phrases["table"]) else 0.0
+        column_scores = {}
+        for column, column_phrases in phrases["columns"].items():
+            best = 0.0
+            for tokens in column_phrases:
+                if _contains(q_tokens, tokens):
+                    # Longer phrases are more specific evidence
+                    best = max(best, float(len(tokens)))
+            if best:
+                column_scores[column] = best
+        metric_score = 0.0
+        for tokens in phrases["metrics"]:
+            if _contains(q_tokens, tokens):
+                metric_score = max(metric_score, float(len(tokens)))
+        scores[table] = {
+            "score": table_score + metric_score + sum(column_scores.values()),
+            "columns": column_scores,
+        }
+    return scores
+
+
+def build_join_graph(semantic_layer: dict, db_schema: Optional[dict] = None) -> Dict[str, Dict[str, Tuple[str, str]]]:
+    """
+    Returns {table: {neighbour: (column, neighbour_column)}}.
+    Declared foreign keys from /schema introspection are used when available; otherwise
+    tables sharing an *_id column are assumed to join on it (the star schema has no FKs).
+    """
+    tables = list(semantic_layer.get("tables", {}).keys())
+    graph: Dict[str, Dict[str, Tuple[str, str]]] = {t: {} for t in tables}
+    by_lower = {t.lower(): t for t in tables}
+
+    def add_edge(a: str, a_col: str, b: str, b_col: str) -> None:
+        if a == b or a not in graph or b not in graph:
+            return
+        graph[a].setdefault(b, (a_col, b_col))
+        graph[b].setdefault(a, (b_col, a_col))
+
+    if db_schema:
+        for table, tdef in db_schema.get("tables", {}).items():
+            src = by_lower.get(table.lower())
+            for fk in tdef.get("foreign_keys", []):
+                dst = by_lower.get(str(fk.get("referred_table", "")).lower())
+                cols, ref_cols = fk.get("constrained_columns", []), fk.get("referred_columns", [])
+                if src and dst and cols and ref_cols:
+                    add_edge(src, cols[0], dst, ref_cols[0])
+
+    id_columns: Dict[str, List[Tuple[str, str]]] = {}
+    for table in tables:
+        for column in semantic_layer["tables"][table].get("columns", {}):
+            if column.lower().endswith("_id"):
+                id_columns.setdefault(column.lower(), []).append((table, column))
+    for owners in id_columns.values():
+        for i, (a, a_col) in enumerate(owners):
+            for b, b_col in owners[i + 1:]:
+                add_edge(a, a_col, b, b_col)
+    return graph
+
+
+def shortest_join_path(graph: dict, sources: Set[str], target: str) -> List[str]:
+    """Returns [source, ..., target] from the nearest source, or [target] when unreachable."""
+    queue = deque([target])
+    parent = {target: None}
+    while queue:
+        node = queue.popleft()
+        if node in sources:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = parent[node]
+            return path
+        for neighbour in graph.get(node, {}):
+            if neighbour not in parent:
+                parent[neighbour] = node
+                queue.append(neighbour)
+    return [target]
+
+
+def prune_semantic_layer(
+    question: str,
+    semantic_layer: dict,
+    db_schema: Optional[dict] = None,
+    max_columns_per_table: int = 30,
+    phrase_index: Optional[Dict[str, dict]] = None,
+    graph: Optional[Dict[str, Dict[str, Tuple[str, str]]]] = None,
+) -> Tuple[dict, List[Tuple[str, str, str, str]]]:
+    """
+    Keeps the tables the question refers to plus whatever tables are needed to join them.
+    Returns (pruned_layer, joins). When nothing matches, the full layer is returned so the
+    LLM is never left without context. ``phrase_index`` and ``graph`` may be passed in
+    precomputed (see SemanticSnapshot).
+    """
+    tables = semantic_layer.get("tables", {})
+    scores = score_semantic_layer(question, semantic_layer, phrase_index)
+    matched = sorted((t for t, s in scores.items() if s["score"] > 0), key=lambda t: -scores[t]["score"])
+    if not matched:
+        return semantic_layer, []
+
+    if graph is None:
+        graph = build_join_graph(semantic_layer, db_schema)
+    keep: Set[str] = {matched[0]}
+    for table in matched[1:]:
+        keep.update(shortest_join_path(graph, keep, table))
+
+    pruned = {"tables": {}}
+    for table in tables:
+        if table not in keep:
+            continue
+        config = tables[table]
+        columns = config.get("columns", {})
+        if len(columns) > max_columns_per_table:
+            join_cols = {c for c, _ in graph.get(table, {}).values()}
+            wanted = set(scores[table]["columns"]) | join_cols
+            columns = {c: syn for c, syn in columns.items() if c in wanted}
+        pruned["tables"][table] = dict(config, columns=columns)
+
+    joins = []
+    for table in pruned["tables"]:
+        for neighbour, (col, ref_col) in graph.get(table, {}).items():
+            if neighbour in keep and table < neighbour:
+                joins.append((table, col, neighbour, ref_col))
+    return pruned, joins
+
+
+def format_joins(joins: List[Tuple[str, str, str, str]]) -> str:
+    if not joins:
+        return ""
+    return "Joins:\n" + "\n".join(f"{a}.{a_col} = {b}.{b_col}" for a, a_col, b, b_col in joins)
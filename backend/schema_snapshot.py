@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine, ObjectKind
+
+TIMESTAMP_CANDIDATES = {"updated_at", "modified_at", "created_at", "ingested_at", "_load_ts", "_ingested_ts", "_updated_at", "timestamp", "ts"}
+
+
+def fetch_schema(engine: Engine) -> dict:
+    """
+    Introspects every table in a handful of bulk catalog queries.
+
+    SQLAlchemy's get_multi_* reflection issues one query per kind of object for all tables
+    at once on PostgreSQL, instead of one get_columns/get_pk_constraint/get_foreign_keys
+    round trip per table; other dialects fall back to their own per-table reflection.
+    Views are included: the embedded engine (local_engine.py) exposes its files as views.
+    """
+    if engine.dialect.name == "duckdb":
+        return _fetch_duckdb_schema(engine)
+    inspector = inspect(engine)
+    kind = ObjectKind.TABLE | ObjectKind.VIEW
+    multi_columns = inspector.get_multi_columns(kind=kind)
+    multi_pks = inspector.get_multi_pk_constraint(kind=kind)
+    multi_fks = inspector.get_multi_foreign_keys(kind=kind)
+
+    tables = {}
+    for key in sorted(multi_columns, key=lambda k: k[1]):
+        table_name = key[1]
+        tables[table_name] = {
+            "columns": [
+                {"name": col["name"], "type": str(col["type"])}
+                for col in multi_columns[key]
+            ],
+            "primary_key": (multi_pks.get(key) or {}).get("constrained_columns", []),
+            "foreign_keys": [
+                {
+                    "constrained_columns": fk.get("constrained_columns", []),
+                    "referred_table": fk.get("referred_table"),
+                    "referred_columns": fk.get("referred_columns", []),
+                }
+                for fk in multi_fks.get(key, [])
+            ],
+        }
+    return {"tables": tables}
+
+
+def _fetch_duckdb_schema(engine: Engine) -> dict:
+    """
+    DuckDB's own catalog functions: duckdb-engine reflects through PostgreSQL catalog
+    queries (pg_collation, ::regclass) that DuckDB does not implement.
+    """
+    tables: Dict[str, dict] = {}
+    with engine.connect() as conn:
+        columns = conn.exec_driver_sql(
+            "SELECT table_name, column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position"
+        )
+        for table, column, data_type in columns:
+            tables.setdefault(table, {"columns": [], "primary_key": [], "foreign_keys": []})
+            tables[table]["columns"].append({"name": column, "type": data_type})
+        constraints = conn.exec_driver_sql(
+            "SELECT table_name, constraint_type, constraint_column_names, referenced_table, referenced_column_names "
+            "FROM duckdb_constraints() WHERE schema_name = current_schema() "
+            "AND constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')"
+        )
+        for table, kind, constrained, referred_table, referred in constraints:
+            if table not in tables:
+                continue
+            if kind == "PRIMARY KEY":
+                tables[table]["primary_key"] = list(constrained)
+            else:
+                tables[table]["foreign_keys"].append({
+                    "constrained_columns": list(constrained),
+                    "referred_table": referred_table,
+                    "referred_columns": list(referred),
+                })
+    return {"tables": dict(sorted(tables.items()))}
+
+
+def hash_schema(schema: dict) -> str:
+    payload = json.dumps(schema, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def timestamp_column(table_def: dict) -> Optional[str]:
+    for col in table_def.get("columns", []):
+        if col["name"].lower() in TIMESTAMP_CANDIDATES:
+            return col["name"].lower()
+    return None
+
+
+def _probe_one(engine: Engine, table: str, column: str):
+    try:
+        with engine.connect() as conn:
+            res = conn.execute(text(f"SELECT MAX({column}) AS last_ts FROM {table}")).fetchone()
+            return res[0] if res else None
+    except Exception:
+        return None
+
+
+def probe_freshness(engine: Engine, schema: dict, max_workers: int = 4) -> List[dict]:
+    """
+    Last-load timestamp per table, fetched with one UNION ALL statement.
+    If that statement fails (e.g. one unreadable table), probes run in parallel over the pool.
+    """
+    probes = {}
+    for table, tdef in schema.get("tables", {}).items():
+        column = timestamp_column(tdef)
+        if column:
+            probes[table] = column
+
+    last_loaded: Dict[str, object] = {}
+    if probes:
+        union = " UNION ALL ".join(
+            f"SELECT '{table}' AS table_name, CAST(MAX({column}) AS VARCHAR(64)) AS last_ts FROM {table}"
+            for table, column in probes.items()
+        )
+        try:
+            with engine.connect() as conn:
+                last_loaded = {row[0]: row[1] for row in conn.execute(text(union))}
+        except Exception:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                futures = {t: pool.submit(_probe_one, engine, t, c) for t, c in probes.items()}
+                last_loaded = {t: f.result() for t, f in futures.items()}
+
+    return [
+        {
+            "table": table,
+            "timestamp_column": probes.get(table),
+            "last_loaded": str(last_loaded[table]) if last_loaded.get(table) is not None else None,
+        }
+        for table in schema.get("tables", {})
+    ]
+
+
+class SchemaSnapshotService:
+    """
+    Caches the introspected schema. The snapshot is rebuilt on refresh() or once it is
+    older than ``ttl`` seconds (0 keeps it until an explicit refresh).
+    """
+
+    def __init__(self, engine_factory, ttl: float = 300, on_change=None):
+        self.engine_factory = engine_factory
+        self.ttl = ttl
+        self.on_change = on_change
+        self._schema: Optional[dict] = None
+        self._version: Optional[str] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        if self._schema is None:
+            return True
+        return self.ttl > 0 and time.monotonic() - self._built_at > self.ttl
+
+    def get(self) -> dict:
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._rebuild()
+        return self._schema
+
+    def refresh(self) -> dict:
+        with self._lock:
+            self._rebuild()
+        return self._schema
+
+    def _rebuild(self) -> None:
+        schema = fetch_schema(self.engine_factory())
+        version = hash_schema(schema)
+        changed = version != self._version
+        self._schema, self._version, self._built_at = schema, version, time.monotonic()
+        if changed and self.on_change is not None:
+            self.on_change(schema)
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._schema = None
@@ -0,0 +1,82 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import Optional
+
+from .metric_compiler import MetricIndex
+from .schema_retrieval import build_join_graph, build_phrase_index
+
+_serials = itertools.count(1)
+
+
+def format_semantic_layer(semantic_layer: dict) -> str:
+    formatted = []
+    for table, config in semantic_layer["tables"].items():
+        columns = ", ".join(config["columns"].keys())
+        metrics = ", ".join(config.get("metrics", {}).keys())
+        formatted.append(f"Table: {table}\nColumns: {columns}")
+        if metrics:
+            formatted.append(f"Metrics: {metrics}")
+    return "\n\n".join(formatted)
+
+
+def hash_semantic_layer(semantic_layer: dict) -> str:
+    payload = json.dumps(semantic_layer, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_semantic_layer_file(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"tables": {}}
+
+
+def file_signature(path: str) -> Optional[tuple]:
+    """(mtime_ns, size) of path, or None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SemanticSnapshot:
+    """
+    One immutable version of a semantic layer with everything derived from it computed
+    once: the prompt text, the synonym/phrase index, the join graph, the metric index and
+    the content hash (``version``) that caches key on.
+
+    Never mutated after construction: changes produce a new snapshot that is swapped in
+    whole, so a request holding a snapshot sees a consistent layer until it finishes.
+    ``serial`` orders snapshots; ``version`` is equal for equal content.
+    """
+
+    def __init__(self, layer: dict, db_schema: Optional[dict] = None):
+        # Copy-on-write: the caller keeps its dict, the snapshot owns this one
+        self.layer = copy.deepcopy(layer) if layer else {"tables": {}}
+        self.layer.setdefault("tables", {})
+        self.db_schema = db_schema
+        self.serial = next(_serials)
+        self.created_at = time.time()
+        self.version = hash_semantic_layer(self.layer)
+        self.knowledge = format_semantic_layer(self.layer)
+        self.phrase_index = build_phrase_index(self.layer)
+        self.graph = build_join_graph(self.layer, db_schema)
+        self.metric_index = MetricIndex(self.layer, db_schema, graph=self.graph)
+
+    def with_db_schema(self, db_schema: Optional[dict]) -> "SemanticSnapshot":
+        """Same layer, re-derived against newly introspected DB schema (declared FKs)."""
+        return SemanticSnapshot(self.layer, db_schema)
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "serial": self.serial,
+            "created_at": self.created_at,
+            "tables": len(self.layer["tables"]),
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List
+
+from .schema_retrieval import build_join_graph, estimate_tokens
+
+
+def table_fingerprint(table: str, tdef: dict, dialect: str, model: str) -> str:
+    """Cache key of one table's suggestion: changes when its definition, the dialect or the model does."""
+    payload = json.dumps({"table": table, "definition": tdef, "dialect": dialect, "model": model}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fk_clusters(db_schema: dict) -> List[List[str]]:
+    """
+    Tables grouped into connected components of the join graph (declared foreign keys,
+    else shared *_id columns), so related tables are described in the same prompt.
+    """
+    tables = db_schema.get("tables", {})
+    layer = {"tables": {t: {"columns": {c["name"]: [] for c in tdef.get("columns", [])}} for t, tdef in tables.items()}}
+    graph = build_join_graph(layer, db_schema)
+    seen, clusters = set(), []
+    for table in tables:
+        if table in seen:
+            continue
+        cluster, stack = [], [table]
+        seen.add(table)
+        while stack:
+            current = stack.pop()
+            cluster.append(current)
+            for neighbour in graph.get(current, {}):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        clusters.append(sorted(cluster, key=list(tables).index))
+    return clusters
+
+
+def chunk_tables(db_schema: dict, tables: List[str], max_tables: int, max_tokens: int) -> List[List[str]]:
+    """
+    Splits ``tables`` into prompt-sized chunks, keeping FK clusters together where the
+    limits allow. A table that alone exceeds ``max_tokens`` still gets a chunk of its own.
+    """
+    wanted = set(tables)
+    chunks: List[List[str]] = []
+    for cluster in fk_clusters(db_schema):
+        chunk, chunk_tokens = [], 0
+        for table in cluster:
+            if table not in wanted:
+                continue
+            tokens = estimate_tokens(json.dumps(db_schema["tables"][table], default=str))
+            if chunk and (len(chunk) >= max_tables or chunk_tokens + tokens > max_tokens):
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(table)
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def fallback_table(tdef: dict) -> dict:
+    """The layer entry used when the LLM gave nothing usable for a table: its columns, no synonyms."""
+    return {"columns": {c["name"]: [] for c in tdef.get("columns", [])}, "metrics": {}}
+
+
+def parse_suggestion(text: str, tables: List[str]) -> Dict[str, dict]:
+    """
+    Reads one chunk's LLM output and returns {table: entry} for the requested tables it
+    describes validly. Raises ValueError when the output is not a semantic layer at all.
+    """
+    text = text.strip()
+    # Clean common wrappers
+    if text.startswith("```"):
+        text = text.strip("`\n ")
+        if text.lower().startswith("json"):
+            text = text[4:].strip()
+    proposed = json.loads(text)
+    if not isinstance(proposed, dict) or not isinstance(proposed.get("tables"), dict):
+        raise ValueError("Invalid shape")
+    by_lower = {t.lower(): t for t in tables}
+    entries = {}
+    for name, entry in proposed["tables"].items():
+        table = by_lower.get(str(name).lower())
+        if table is None or not isinstance(entry, dict) or not isinstance(entry.get("columns"), dict):
+            continue
+        columns = {
+            column: [str(s) for s in synonyms] if isinstance(synonyms, list) else []
+            for column, synonyms in entry["columns"].items()
+        }
+        metrics = entry.get("metrics") if isinstance(entry.get("metrics"), dict) else {}
+        entries[table] = {"columns": columns, "metrics": {m: str(sql) for m, sql in metrics.items()}}
+    return entries
+
+
+class RateLimiter:
+    """
+    Spaces call starts at least 60 / ``per_minute`` seconds apart across every caller
+    and event loop. A ``per_minute`` of 0 (or less) disables the limit.
+    """
+
+    def __init__(self, per_minute: float = 0):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claims the next slot and returns how long to wait for it."""
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    async def wait(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def merge_suggestions(db_schema: dict, entries: Dict[str, dict]) -> dict:
+    """One layer in the schema's table order; tables without a suggestion fall back to bare columns."""
+    return {
+        "tables": {
+            table: entries.get(table) or fallback_table(tdef)
+            for table, tdef in db_schema.get("tables", {}).items()
+        }
+    }
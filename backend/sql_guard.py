@@ -0,0 +1,302 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional, Set
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except Exception:  # pragma: no cover - without sqlglot only the keyword checks run
+    sqlglot = None  # type: ignore
+    exp = None  # type: ignore
+
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite", "mysql": "mysql", "duckdb": "duckdb"}
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\")")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_WRITE_KEYWORDS_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE|COPY|VACUUM|CALL|DO|SET|LOCK)\b",
+    re.IGNORECASE,
+)
+# Functions a SELECT can call that sleep, lock, kill backends, touch files or other servers,
+# or advance sequences: read-only in syntax only
+_SIDE_EFFECT_FUNCTIONS = frozenset({
+    # PostgreSQL
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_terminate_backend", "pg_cancel_backend",
+    "pg_reload_conf", "pg_rotate_logfile", "pg_promote", "pg_switch_wal", "pg_create_restore_point",
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "pg_file_write",
+    "lo_import", "lo_export", "lo_unlink", "lo_create", "lo_creat", "lo_from_bytea", "lo_put",
+    "dblink", "dblink_exec", "dblink_connect", "dblink_send_query", "set_config", "nextval", "setval",
+    "pg_notify", "pg_advisory_lock", "pg_advisory_xact_lock", "pg_try_advisory_lock",
+    "query_to_xml", "query_to_xmlschema", "query_to_xml_and_xmlschema", "cursor_to_xml",
+    # MySQL
+    "sleep", "benchmark", "get_lock", "release_lock", "release_all_locks", "load_file",
+    # SQLite
+    "load_extension", "readfile", "writefile",
+    # DuckDB: files and URLs other than the configured tables
+    "read_csv", "read_csv_auto", "read_parquet", "parquet_scan", "read_json", "read_json_auto",
+    "read_text", "read_blob", "glob",
+})
+_SIDE_EFFECT_CALL_RE = re.compile(
+    r"\b(" + "|".join(sorted(_SIDE_EFFECT_FUNCTIONS)) + r")\s*\(",
+    re.IGNORECASE,
+)
+
+
+class SQLRejected(Exception):
+    """Generated SQL that must not run; ``estimate`` holds the plan estimate when one was made."""
+
+    def __init__(self, reason: str, sql: Optional[str] = None, estimate: Optional[dict] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.sql = sql
+        self.estimate = estimate
+
+
+def _strip_literals(sql: str) -> str:
+    return _QUOTED_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+
+
+def _capped(sql: str, max_rows: int) -> str:
+    """Caps the rows of any query, whatever LIMIT or FETCH it carries."""
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n) AS guarded LIMIT {max_rows}"
+
+
+def _function_name(node) -> str:
+    return (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+
+
+def _arg(node, name: str):
+    # sqlglot renamed some args ("from" -> "from_") between releases
+    return node.args.get(name) if node.args.get(name) is not None else node.args.get(name + "_")
+
+
+def _conjuncts(condition) -> list:
+    return list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+
+
+def _disconnected_tables(select, columns_by_table: Dict[str, Set[str]]) -> Optional[List[List[str]]]:
+    """
+    Groups of base tables in one SELECT that no ON/WHERE predicate links together, i.e. a
+    cartesian product. Returns None when they are connected or when an unqualified column
+    makes it impossible to tell.
+    """
+    sources: Dict[str, str] = {}
+    from_ = _arg(select, "from")
+    nodes = [from_.this] if from_ is not None else []
+    joins = select.args.get("joins") or []
+    nodes += [join.this for join in joins]
+    for node in nodes:
+        if isinstance(node, exp.Table):
+            sources[node.alias_or_name.lower()] = node.name.lower()
+    if len(sources) < 2:
+        return None
+
+    parent = {alias: alias for alias in sources}
+
+    def find(alias: str) -> str:
+        while parent[alias] != alias:
+            alias = parent[alias]
+        return alias
+
+    conditions = [join.args["on"] for join in joins if join.args.get("on") is not None]
+    if any(join.args.get("using") for join in joins):
+        return None
+    where = select.args.get("where")
+    if where is not None:
+        conditions.append(where.this)
+
+    for condition in conditions:
+        for conjunct in _conjuncts(condition):
+            linked = set()
+            for column in conjunct.find_all(exp.Column):
+                if column.table:
+                    if column.table.lower() in sources:
+                        linked.add(column.table.lower())
+                    continue
+                owners = [a for a, t in sources.items() if column.name.lower() in columns_by_table.get(t, set())]
+                if len(owners) != 1:
+                    return None
+                linked.add(owners[0])
+            linked = sorted(linked)
+            for alias in linked[1:]:
+                parent[find(alias)] = find(linked[0])
+
+    groups: Dict[str, List[str]] = {}
+    for alias, table in sources.items():
+        groups.setdefault(find(alias), []).append(table)
+    return sorted(groups.values()) if len(groups) > 1 else None
+
+
+class SQLGuard:
+    """
+    Checks generated SQL before it runs.
+
+    prepare() rejects anything but a single read-only query (including calls to functions with
+    side effects such as pg_sleep or lo_export), rejects joins that lack a join predicate
+    (cartesian products), and adds a LIMIT when the query has none (or lowers a LIMIT or FETCH
+    FIRST above ``max_rows``). check_estimate() refuses plans whose EXPLAIN cost exceeds
+    ``max_cost``. session_statements() are run on the executing connection to make its
+    transaction read-only (PostgreSQL, MySQL) and bound its runtime.
+    """
+
+    def __init__(self, max_rows: int = 10000, max_cost: Optional[float] = None, statement_timeout_ms: int = 30000):
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.statement_timeout_ms = statement_timeout_ms
+        self.rejected = 0
+        self.limited = 0
+
+    def prepare(self, sql: str, dialect_name: str, columns_by_table: Optional[Dict[str, Set[str]]] = None, max_rows: Optional[int] = None) -> str:
+        max_rows = max_rows or self.max_rows
+        try:
+            if sqlglot is None:
+                guarded = self._prepare_without_parser(sql, max_rows)
+            else:
+                guarded = self._prepare_parsed(sql, _SQLGLOT_DIALECTS.get(dialect_name), columns_by_table or {}, max_rows)
+        except SQLRejected:
+            self.rejected += 1
+            raise
+        if guarded != sql:
+            self.limited += 1
+        return guarded
+
+    def _prepare_parsed(self, sql: str, dialect: Optional[str], columns_by_table: Dict[str, Set[str]], max_rows: int) -> str:
+        try:
+            statements = [s for s in sqlglot.parse(sql, read=dialect) if s is not None]
+        except sqlglot.errors.SqlglotError as e:
+            raise SQLRejected(f"SQL does not parse: {e}", sql)
+        if len(statements) != 1:
+            raise SQLRejected("Only a single statement may run", sql)
+        tree = statements[0]
+        if not isinstance(tree, exp.Query):
+            raise SQLRejected(f"Only SELECT queries may run, not {tree.key.upper()}", sql)
+        for node in tree.walk():
+            if isinstance(node, (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.Command)):
+                raise SQLRejected(f"Query contains a {node.key.upper()} statement", sql)
+            if isinstance(node, exp.Func) and _function_name(node) in _SIDE_EFFECT_FUNCTIONS:
+                raise SQLRejected(f"Query calls {_function_name(node)}(), which is not read-only", sql)
+        for select in tree.find_all(exp.Select):
+            if select.args.get("into") is not None:
+                raise SQLRejected("SELECT INTO creates a table", sql)
+            if select.args.get("locks"):
+                raise SQLRejected("SELECT ... FOR UPDATE/SHARE takes row locks", sql)
+            groups = _disconnected_tables(select, columns_by_table)
+            if groups:
+                described = " and ".join("(" + ", ".join(g) + ")" for g in groups)
+                raise SQLRejected(f"Missing join predicate between {described}: the query is a cartesian product", sql)
+
+        limit = tree.args.get("limit")
+        if limit is None:
+            if tree.args.get("offset") is None:
+                # Appending keeps the generated SQL byte-for-byte; re-rendering is the fallback
+                return sql.strip().rstrip(";").rstrip() + f"\nLIMIT {max_rows}"
+            return tree.limit(max_rows).sql(dialect=dialect)
+        if isinstance(limit, exp.Fetch):
+            options = limit.args.get("limit_options")
+            if options is not None and (options.args.get("percent") or options.args.get("with_ties")):
+                return _capped(sql, max_rows)
+            if limit.args.get("count") is None:
+                # FETCH FIRST ROW ONLY
+                return sql
+            value, arg = limit.args["count"], "count"
+        else:
+            value, arg = limit.expression, "expression"
+        if not (isinstance(value, exp.Literal) and value.is_int):
+            # LIMIT ALL, LIMIT NULL, a computed limit: cap whatever it returns
+            return _capped(sql, max_rows)
+        if int(value.this) > max_rows:
+            limit.set(arg, exp.Literal.number(max_rows))
+            return tree.sql(dialect=dialect)
+        return sql
+
+    def _prepare_without_parser(self, sql: str, max_rows: int) -> str:
+        bare = _strip_literals(sql).strip().rstrip(";")
+        if ";" in bare:
+            raise SQLRejected("Only a single statement may run", sql)
+        if not re.match(r"^\s*(SELECT|WITH)\b", bare, re.IGNORECASE):
+            raise SQLRejected("Only SELECT queries may run", sql)
+        match = _WRITE_KEYWORDS_RE.search(bare)
+        if match:
+            raise SQLRejected(f"Query contains {match.group(1).upper()}", sql)
+        match = _SIDE_EFFECT_CALL_RE.search(bare)
+        if match:
+            raise SQLRejected(f"Query calls {match.group(1).lower()}(), which is not read-only", sql)
+        # Without a parser the query's own LIMIT cannot be checked, so it is always wrapped
+        return _capped(sql, max_rows)
+
+    @staticmethod
+    def explain_statement(dialect_name: str, sql: str) -> Optional[str]:
+        """EXPLAIN returning a cost estimate, for the dialects that have one."""
+        if dialect_name == "postgresql":
+            return "EXPLAIN (FORMAT JSON) " + sql
+        return None
+
+    @staticmethod
+    def validate_statement(dialect_name: str, sql: str) -> Optional[str]:
+        """EXPLAIN that only plans, for dialects without a cost estimate: fails if the SQL is broken."""
+        if dialect_name == "sqlite":
+            return "EXPLAIN QUERY PLAN " + sql
+        if dialect_name in ("mysql", "duckdb"):
+            return "EXPLAIN " + sql
+        return None
+
+    @staticmethod
+    def parse_estimate(plan) -> dict:
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        return {
+            "cost": float(top["Total Cost"]),
+            "rows": int(top["Plan Rows"]),
+            "startup_cost": float(top["Startup Cost"]),
+            "node": top.get("Node Type"),
+        }
+
+    def check_estimate(self, sql: str, estimate: Optional[dict]) -> None:
+        if estimate is None or self.max_cost is None or estimate["cost"] <= self.max_cost:
+            return
+        self.rejected += 1
+        raise SQLRejected(
+            f"Estimated cost {estimate['cost']:,.0f} exceeds the budget of {self.max_cost:,.0f}; "
+            "narrow the question (e.g. a year or a branch) or ask for an aggregate",
+            sql,
+            estimate,
+        )
+
+    def session_statements(self, dialect_name: str) -> List[str]:
+        """
+        Statements making the next transaction on this connection read-only and bounding its
+        runtime. MySQL's SET TRANSACTION (no SESSION) covers only that next transaction, so a
+        pooled connection can still write once it is handed to the loaders or rollup refresh.
+        """
+        statements = []
+        if dialect_name == "postgresql":
+            statements.append("SET TRANSACTION READ ONLY")
+            if self.statement_timeout_ms:
+                statements.append(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+        elif dialect_name == "mysql":
+            statements.append("SET TRANSACTION READ ONLY")
+            if self.statement_timeout_ms:
+                statements.append(f"SET SESSION max_execution_time = {int(self.statement_timeout_ms)}")
+        return statements
+
+    def stats(self) -> dict:
+        return {
+            "max_rows": self.max_rows,
+            "max_cost": self.max_cost,
+            "statement_timeout_ms": self.statement_timeout_ms,
+            "rejected": self.rejected,
+            "limited": self.limited,
+        }
+
+
+def build_sql_guard() -> Optional[SQLGuard]:
+    if os.getenv("SQL_GUARD_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    # PostgreSQL cost units; 0 turns the budget off
+    max_cost = float(os.getenv("SQL_GUARD_MAX_COST", "5000000"))
+    return SQLGuard(
+        max_rows=int(os.getenv("SQL_GUARD_MAX_ROWS", "10000")),
+        max_cost=max_cost if max_cost > 0 else None,
+        statement_timeout_ms=int(os.getenv("SQL_GUARD_STATEMENT_TIMEOUT_MS", "30000")),
+    )
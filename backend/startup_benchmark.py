@@ -0,0 +1,127 @@
+"""
+Cold-start benchmark. Each run starts a fresh interpreter and measures:
+
+- how long ``import backend.main`` takes
+- how long until /ready reports that the warm-up has finished
+- the latency of the first and the second /query
+
+    python -m backend.startup_benchmark
+    python -m backend.startup_benchmark --runs 5 --question "total revenue by year"
+    python -m backend.startup_benchmark --no-warmup     # the first request pays for everything
+
+The default question is one the metric compiler answers, so no LLM call is needed. Pass a
+question that needs the LLM to include generation in the first-request latency.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+METRICS = ["import_s", "startup_s", "ready_s", "first_query_s", "second_query_s"]
+
+
+def run_child(question: str, ready_timeout: float) -> dict:
+    started = time.perf_counter()
+    from backend import main
+    report = {"import_s": time.perf_counter() - started}
+
+    from fastapi.testclient import TestClient
+
+    started = time.perf_counter()
+    with TestClient(main.app) as client:
+        report["startup_s"] = time.perf_counter() - started
+        while True:
+            ready = client.get("/ready")
+            if ready.status_code == 200 or time.perf_counter() - started > ready_timeout:
+                break
+            time.sleep(0.01)
+        report["ready_s"] = time.perf_counter() - started
+        report["warmup_steps"] = ready.json().get("steps")
+
+        client.post("/auth/register", json={"username": "bench", "password": "bench"})
+        token = client.post("/auth/login", json={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for key in ("first_query_s", "second_query_s"):
+            started = time.perf_counter()
+            response = client.post("/query", json={"question": question}, headers=headers).json()
+            report[key] = time.perf_counter() - started
+            if not response.get("success") or response.get("response", {}).get("type") == "error":
+                report["error"] = response.get("error") or response["response"].get("error")
+    return report
+
+
+def run_once(question: str, warmup: bool, ready_timeout: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            USERS_DB_PATH=os.path.join(tmp, "users.db"),
+            QUERY_LOG_PATH=os.path.join(tmp, "query_log.jsonl"),
+            WARMUP_ENABLED="true" if warmup else "false",
+        )
+        completed = subprocess.run(
+            [sys.executable, "-m", "backend.startup_benchmark", "--child", "--question", question,
+             "--ready-timeout", str(ready_timeout)],
+            env=env, capture_output=True, text=True,
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "child failed")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_summary(reports: list) -> None:
+    print(f"{'metric':<16}{'min':>10}{'median':>10}{'max':>10}")
+    for metric in METRICS:
+        values = [r[metric] for r in reports if metric in r]
+        if values:
+            print(f"{metric:<16}{min(values) * 1000:>8.0f}ms{statistics.median(values) * 1000:>8.0f}ms{max(values) * 1000:>8.0f}ms")
+    print_steps(reports[-1].get("warmup_steps") or {}, "   ")
+
+
+def print_steps(steps: dict, indent: str) -> None:
+    for name, step in steps.items():
+        seconds = step.get("seconds")
+        line = f"{indent}{name}: {seconds * 1000:.0f}ms" if seconds is not None else f"{indent}{name}"
+        print(line + (f" ⚠️  {step['error']}" if step.get("error") else ""))
+        print_steps(step.get("steps") or {}, indent + "   ")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import time, warm-up and first-request latency.")
+    parser.add_argument("--question", default="total revenue by year")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-warmup", action="store_true", help="Disable the startup warm-up (WARMUP_ENABLED=false)")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="Print the raw per-run reports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.question, args.ready_timeout), default=str))
+        return 0
+
+    reports = []
+    for run in range(1, args.runs + 1):
+        try:
+            report = run_once(args.question, not args.no_warmup, args.ready_timeout)
+        except Exception as e:
+            print(f"❌ Run {run} failed: {e}")
+            return 1
+        print(
+            f"✅ Run {run}: import {report['import_s'] * 1000:.0f}ms, ready {report['ready_s'] * 1000:.0f}ms, "
+            f"first /query {report['first_query_s'] * 1000:.0f}ms, second {report['second_query_s'] * 1000:.0f}ms"
+            + (f" ⚠️  {report['error']}" if report.get("error") else "")
+        )
+        reports.append(report)
+
+    if args.json:
+        print(json.dumps(reports, indent=2, default=str))
+    print_summary(reports)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Synthetic version of the star schema (revenue fact; dealer, branch, product, date and
+country dimensions) at any scale, for load tests and planner experiments. The output
+is deterministic for a given seed and row count.
+
+    python -m backend.synthetic_star --db-url sqlite:////tmp/star_1m.db --fact-rows 1000000
+    python -m backend.synthetic_star --db-url postgresql+psycopg2://... --fact-rows 50000000
+
+Column names follow db/schema/create_tables.sql. Every table also gets the _ingested_ts
+column the freshness probes look for. Dimension sizes grow with the fact table:
+dealers ~ rows/200, branches ~ rows/100, capped.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+
+from sqlalchemy import Column, Date, Integer, MetaData, Numeric, String, Table, create_engine, func, inspect, select
+from sqlalchemy.engine import Engine
+
+START_DATE = date(2017, 1, 1)
+DAYS = 4 * 365 + 1
+MAKES = ["BMW", "Audi", "Toyota", "Ford", "Honda", "Kia", "Tesla", "Volvo", "Mazda", "Nissan"]
+COUNTRIES = 250
+
+
+def build_metadata() -> MetaData:
+    metadata = MetaData()
+
+    def ingested() -> Column:
+        return Column("_ingested_ts", String)
+
+    Table("country", metadata, Column("country_id", String, primary_key=True), Column("country_name", String), ingested())
+    Table(
+        "dealer", metadata, Column("dealer_id", String, primary_key=True), Column("dealer_nm", String),
+        Column("location_id", String), Column("location_nm", String), Column("country_id", String), ingested(),
+    )
+    Table(
+        "branch", metadata, Column("branch_id", String, primary_key=True), Column("branch_nm", String),
+        Column("country_name", String), ingested(),
+    )
+    Table(
+        "product", metadata, Column("model_id", String, primary_key=True), Column("product_id", String),
+        Column("product_name", String), Column("model_name", String), ingested(),
+    )
+    Table(
+        "date", metadata, Column("date_id", String, primary_key=True), Column("date", Date), Column("year", Integer),
+        Column("month", String), Column("quarter", String), ingested(),
+    )
+    Table(
+        "revenue", metadata,
+        Column("dealer_id", String, primary_key=True), Column("model_id", String, primary_key=True),
+        Column("branch_id", String, primary_key=True), Column("date_id", String, primary_key=True),
+        Column("units_sold", Integer), Column("revenue", Numeric), ingested(),
+    )
+    return metadata
+
+
+def dimension_sizes(fact_rows: int) -> Dict[str, int]:
+    return {
+        "country": COUNTRIES,
+        "dealer": max(50, min(20000, fact_rows // 200)),
+        "branch": max(100, min(50000, fact_rows // 100)),
+        "product": len(MAKES) * 30,
+        "date": DAYS,
+    }
+
+
+def dimension_rows(table: str, count: int, stamp: str) -> List[dict]:
+    if table == "country":
+        return [{"country_id": f"CNTR{i:03d}", "country_name": f"Country {i}", "_ingested_ts": stamp} for i in range(1, count + 1)]
+    if table == "dealer":
+        return [
+            {
+                "dealer_id": f"DLR{i:05d}", "dealer_nm": f"{MAKES[i % len(MAKES)]} Motors {i}",
+                "location_id": f"LOC{i % 997:03d}", "location_nm": f"City {i % 997}",
+                "country_id": f"CNTR{i % COUNTRIES + 1:03d}", "_ingested_ts": stamp,
+            }
+            for i in range(1, count + 1)
+        ]
+    if table == "branch":
+        return [
+            {"branch_id": f"BR{i:05d}", "branch_nm": f"Branch {i}", "country_name": f"Country {i % COUNTRIES + 1}", "_ingested_ts": stamp}
+            for i in range(1, count + 1)
+        ]
+    if table == "product":
+        per_make = count // len(MAKES)
+        return [
+            {
+                "model_id": f"{make}-M{m}", "product_id": make, "product_name": make,
+                "model_name": f"{make[0]}{m}", "_ingested_ts": stamp,
+            }
+            for make in MAKES for m in range(1, per_make + 1)
+        ]
+    if table == "date":
+        rows = []
+        for i in range(count):
+            day = START_DATE + timedelta(days=i)
+            rows.append({
+                "date_id": f"DT{i + 1:05d}", "date": day, "year": day.year, "month": str(day.month),
+                "quarter": f"Q{(day.month - 1) // 3 + 1}", "_ingested_ts": stamp,
+            })
+        return rows
+    raise ValueError(table)
+
+
+def fact_rows_iter(fact_rows: int, sizes: Dict[str, int], seed: int, stamp: str, chunk_size: int) -> Iterator[List[dict]]:
+    """
+    Unique (date, dealer, model, branch) keys: the row number is spread over the key space
+    and decomposed into one digit per dimension, so every dimension value occurs.
+    """
+    rng = random.Random(seed)
+    dates, dealers, models, branches = sizes["date"], sizes["dealer"], sizes["product"], sizes["branch"]
+    space = dates * dealers * models * branches
+    if fact_rows > space:
+        raise ValueError(f"At most {space} distinct fact rows at these dimension sizes")
+    # Golden-ratio step (a Weyl sequence), coprime to the key space so i -> i * stride is a
+    # permutation of it: consecutive rows land far apart in every dimension
+    stride = int(space * 0.6180339887) | 1
+    while math.gcd(stride, space) != 1:
+        stride += 2
+    product_ids = [f"{make}-M{m}" for make in MAKES for m in range(1, models // len(MAKES) + 1)]
+    chunk = []
+    for i in range(fact_rows):
+        key = (i * stride) % space
+        key, d = divmod(key, dates)
+        key, k = divmod(key, dealers)
+        key, m = divmod(key, models)
+        b = key % branches
+        units = rng.randint(1, 12)
+        chunk.append({
+            "dealer_id": f"DLR{k + 1:05d}", "model_id": product_ids[m % len(product_ids)],
+            "branch_id": f"BR{b + 1:05d}", "date_id": f"DT{d + 1:05d}",
+            "units_sold": units, "revenue": units * rng.randint(15000, 90000), "_ingested_ts": stamp,
+        })
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fact_row_count(engine: Engine) -> int:
+    """Rows in revenue, or -1 when the schema is not there."""
+    if "revenue" not in inspect(engine).get_table_names():
+        return -1
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Table("revenue", MetaData(), autoload_with=engine))).scalar()
+
+
+def generate(engine: Engine, fact_rows: int, seed: int = 42, chunk_size: int = 50000, progress=None) -> Dict[str, int]:
+    """(Re)creates the star schema with ``fact_rows`` facts; returns {table: rows}."""
+    metadata = build_metadata()
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    stamp = datetime.utcnow().isoformat(sep=" ")
+    sizes = dimension_sizes(fact_rows)
+    counts = {}
+    with engine.begin() as conn:
+        for table in ("country", "dealer", "branch", "product", "date"):
+            rows = dimension_rows(table, sizes[table], stamp)
+            conn.execute(metadata.tables[table].insert(), rows)
+            counts[table] = len(rows)
+    counts["revenue"] = 0
+    insert = metadata.tables["revenue"].insert()
+    for chunk in fact_rows_iter(fact_rows, sizes, seed, stamp, chunk_size):
+        # One transaction per chunk keeps memory flat at 50M rows
+        with engine.begin() as conn:
+            conn.execute(insert, chunk)
+        counts["revenue"] += len(chunk)
+        if progress is not None:
+            progress(counts["revenue"], fact_rows)
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic star schema at a given scale.")
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--fact-rows", type=int, default=10000, help="Rows in the revenue fact table")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.db_url)
+    started = time.perf_counter()
+
+    def progress(done: int, total: int) -> None:
+        if done % (args.chunk_size * 20) == 0 or done == total:
+            print(f"📥 {done:,}/{total:,} fact rows ({done / (time.perf_counter() - started):,.0f} rows/sec)")
+
+    try:
+        counts = generate(engine, args.fact_rows, args.seed, args.chunk_size, progress)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    for table, rows in counts.items():
+        print(f"✅ {table}: {rows:,} rows")
+    print(f"🏁 {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+SQL workload regression runner. Runs every query of a corpus directory (by default the
+hand-written notebooks/sql_queries/*.sql) against a database and compares it with a
+stored baseline, so that schema, index or data-growth regressions show up before a deploy.
+
+For each query it does a few warm-up runs and then timed runs (execute and fetch), and
+captures the plan: EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL, EXPLAIN QUERY PLAN on SQLite.
+A query regresses when its median time grows by more than --threshold (and by more than
+--min-delta-ms, to keep fast queries out of the noise), when its plan shape changes (node
+types, relations and indexes; not costs or row counts), or when it starts failing.
+
+    python -m backend.workload_regression --update-baseline      # record the baseline
+    python -m backend.workload_regression                        # compare; exits 1 on regressions
+    python -m backend.workload_regression --corpus db/workload --threshold 0.5 --json
+
+Queries are keyed by file and a hash of their normalized SQL, so editing one starts it a
+fresh baseline instead of comparing it with its old self. Every query runs in a
+transaction that is rolled back, and only read-only queries are run at all.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from .load_test import percentile
+from .local_engine import create_local_engine, is_local_url
+from .result_cache import normalize_sql
+from .sql_guard import SQLGuard, SQLRejected
+
+DEFAULT_CORPUS = "notebooks/sql_queries"
+BASELINE_NAME = "baseline.json"
+_LABEL_RE = re.compile(r"^\s*--\s*(?:\d+\.\s*)?(.+?)\s*$")
+
+
+def split_statements(sql_text: str) -> List[Tuple[str, str]]:
+    """
+    [(label, sql)] for the statements of a file, split on semicolons outside quotes and
+    comments. The label is the comment line right above the statement ("-- 3. Revenue by country").
+    """
+    statements, current, label = [], [], ""
+    i, n = 0, len(sql_text)
+    while i < n:
+        ch = sql_text[i]
+        if ch == "-" and sql_text.startswith("--", i):
+            end = sql_text.find("\n", i)
+            end = n if end == -1 else end
+            if not "".join(current).strip():
+                match = _LABEL_RE.match(sql_text[i:end])
+                label = match.group(1) if match else label
+            else:
+                current.append(sql_text[i:end])
+            i = end
+            continue
+        if ch == "/" and sql_text.startswith("/*", i):
+            end = sql_text.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            current.append(" ")
+            i = end
+            continue
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql_text[end] == ch:
+                    # A doubled quote is an escaped one
+                    if end + 1 < n and sql_text[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql_text[i:end + 1])
+            i = end + 1
+            continue
+        if ch == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append((label, statement))
+            current, label = [], ""
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+    statement = "".join(current).strip()
+    if statement:
+        statements.append((label, statement))
+    return statements
+
+
+def load_corpus(corpus_dir: str) -> List[dict]:
+    """Every statement of every *.sql file in corpus_dir, in file order."""
+    queries = []
+    for entry in sorted(os.listdir(corpus_dir)):
+        stem, ext = os.path.splitext(entry)
+        if ext.lower() != ".sql":
+            continue
+        with open(os.path.join(corpus_dir, entry)) as f:
+            statements = split_statements(f.read())
+        for position, (label, sql) in enumerate(statements, start=1):
+            digest = hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:10]
+            queries.append({
+                "id": f"{stem}:{digest}",
+                "label": label or f"{stem} #{position}",
+                "sql": sql,
+            })
+    return queries
+
+
+def _postgres_shape(node: dict, depth: int = 0) -> List[str]:
+    parts = [node.get("Node Type", "?")]
+    for key in ("Join Type", "Strategy", "Relation Name", "Index Name", "Parent Relationship"):
+        if node.get(key):
+            parts.append(f"{key.split()[0].lower()}={node[key]}")
+    lines = ["  " * depth + " ".join(parts)]
+    for child in node.get("Plans", []):
+        lines.extend(_postgres_shape(child, depth + 1))
+    return lines
+
+
+def explain(conn, dialect_name: str, sql: str) -> Optional[dict]:
+    """
+    The plan of sql: its shape (one line per node, without costs or row counts, so it only
+    changes when the planner picks a different plan) plus what the dialect measures.
+    """
+    if dialect_name == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]
+        root = top["Plan"]
+        return {
+            "shape": _postgres_shape(root),
+            "planning_ms": top.get("Planning Time"),
+            "execution_ms": top.get("Execution Time"),
+            "actual_rows": root.get("Actual Rows"),
+            # Cumulative over the whole tree at the root node
+            "shared_hit_blocks": root.get("Shared Hit Blocks"),
+            "shared_read_blocks": root.get("Shared Read Blocks"),
+            "temp_written_blocks": root.get("Temp Written Blocks"),
+            "total_cost": root.get("Total Cost"),
+        }
+    if dialect_name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).fetchall()
+        depth = {0: -1}
+        shape = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            shape.append("  " * depth[node_id] + detail)
+        return {"shape": shape}
+    return None
+
+
+def run_query(engine: Engine, query: dict, warmups: int, runs: int, guard: SQLGuard) -> dict:
+    dialect_name = engine.dialect.name
+    result = {"id": query["id"], "label": query["label"], "status": "ok"}
+    try:
+        # Only as a check: the query itself runs unchanged (no LIMIT added)
+        guard.prepare(query["sql"], dialect_name)
+    except SQLRejected as e:
+        return {**result, "status": "skipped", "error": e.reason}
+
+    timings = []
+    try:
+        with engine.connect() as conn:
+            for i in range(warmups + runs):
+                transaction = conn.begin()
+                try:
+                    for statement in guard.session_statements(dialect_name):
+                        conn.exec_driver_sql(statement)
+                    started = time.perf_counter()
+                    rows = conn.exec_driver_sql(query["sql"]).fetchall()
+                    elapsed = (time.perf_counter() - started) * 1000
+                finally:
+                    transaction.rollback()
+                if i >= warmups:
+                    timings.append(elapsed)
+            result["rows"] = len(rows)
+            transaction = conn.begin()
+            try:
+                for statement in guard.session_statements(dialect_name):
+                    conn.exec_driver_sql(statement)
+                result["plan"] = explain(conn, dialect_name, query["sql"])
+            finally:
+                # EXPLAIN ANALYZE executes the query; nothing it did is kept
+                transaction.rollback()
+    except Exception as e:
+        return {**result, "status": "error", "error": str(e).splitlines()[0]}
+
+    result.update({
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "min_ms": round(min(timings), 3),
+        "runs": len(timings),
+    })
+    if result["plan"] is not None:
+        result["plan_hash"] = hashlib.sha1("\n".join(result["plan"]["shape"]).encode("utf-8")).hexdigest()[:12]
+    return result
+
+
+def compare(current: dict, baseline: Optional[dict], threshold: float, min_delta_ms: float) -> List[str]:
+    """Why current regressed against baseline; empty when it did not (or has no baseline)."""
+    if baseline is None or current["status"] == "skipped":
+        return []
+    if current["status"] == "error":
+        return [f"fails: {current['error']}"] if baseline["status"] == "ok" else []
+    if baseline["status"] != "ok":
+        return []
+    problems = []
+    before, after = baseline["median_ms"], current["median_ms"]
+    if after - before > min_delta_ms and after > before * (1 + threshold):
+        problems.append(f"median {before:.1f}ms → {after:.1f}ms ({(after - before) / before * 100:+.0f}%)")
+    if baseline.get("plan_hash") and current.get("plan_hash") and baseline["plan_hash"] != current["plan_hash"]:
+        problems.append("plan changed")
+    return problems
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_baseline(path: str, dialect_name: str, results: List[dict]) -> None:
+    baseline = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "dialect": dialect_name,
+        "queries": {r["id"]: {k: v for k, v in r.items() if k not in ("regressions", "baseline_median_ms")} for r in results},
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(baseline, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _print_plan_diff(before: List[str], after: List[str]) -> None:
+    import difflib
+
+    for line in difflib.unified_diff(before, after, "baseline", "current", lineterm="", n=1):
+        print(f"      {line}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the SQL corpus and compare timings and plans with a baseline.")
+    parser.add_argument("--db-url", default=os.getenv("DB_URL"), help="SQLAlchemy or local:// URL (default: DB_URL)")
+    parser.add_argument("--corpus", default=os.getenv("WORKLOAD_CORPUS_DIR", DEFAULT_CORPUS), help="Directory of .sql files")
+    parser.add_argument("--baseline", help=f"Baseline file (default: <corpus>/{BASELINE_NAME})")
+    parser.add_argument("--update-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative median slowdown that counts (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--statement-timeout-ms", type=int, default=300000)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    if not args.db_url:
+        print("❌ No database URL (set DB_URL or pass --db-url)")
+        return 1
+    baseline_path = args.baseline or os.path.join(args.corpus, BASELINE_NAME)
+    try:
+        queries = load_corpus(args.corpus)
+    except OSError as e:
+        print(f"❌ Error: {e}")
+        return 1
+    if not queries:
+        print(f"⚠️  No queries in {args.corpus}")
+        return 1
+
+    engine = create_local_engine(args.db_url) if is_local_url(args.db_url) else create_engine(args.db_url, pool_pre_ping=True)
+    dialect_name = engine.dialect.name
+    guard = SQLGuard(statement_timeout_ms=args.statement_timeout_ms)
+    baseline = None if args.update_baseline else load_baseline(baseline_path)
+    if baseline is not None and baseline.get("dialect") != dialect_name:
+        print(f"⚠️  Baseline was recorded on {baseline.get('dialect')}, this run is on {dialect_name}; plans are not compared")
+    previous = (baseline or {}).get("queries", {})
+    same_dialect = baseline is not None and baseline.get("dialect") == dialect_name
+
+    if not args.json:
+        print(f"📥 {len(queries)} queries from {args.corpus} on {dialect_name} ({args.warmups} warm-up, {args.runs} timed runs)")
+    results, regressions = [], 0
+    for query in queries:
+        result = run_query(engine, query, args.warmups, args.runs, guard)
+        before = previous.get(query["id"])
+        if before is not None and not same_dialect:
+            before = {**before, "plan_hash": None}
+        result["regressions"] = compare(result, before, args.threshold, args.min_delta_ms)
+        result["baseline_median_ms"] = before.get("median_ms") if before else None
+        regressions += bool(result["regressions"])
+        results.append(result)
+        if args.json:
+            continue
+
+        if result["status"] == "skipped":
+            print(f"⚠️  {result['label']}: skipped ({result['error']})")
+        elif result["status"] == "error":
+            marker = "❌" if result["regressions"] else "⚠️ "
+            print(f"{marker} {result['label']}: {result['error']}")
+        else:
+            reference = f" (baseline {before['median_ms']:.1f}ms)" if before and before.get("median_ms") is not None else (" (new)" if baseline else "")
+            marker = "❌" if result["regressions"] else "✅"
+            print(f"{marker} {result['label']}: {result['median_ms']:.1f}ms median, {result['rows']} rows{reference}")
+            for problem in result["regressions"]:
+                print(f"      {problem}")
+            if "plan changed" in result["regressions"]:
+                _print_plan_diff(before["plan"]["shape"], result["plan"]["shape"])
+    engine.dispose()
+
+    missing = sorted(set(previous) - {r["id"] for r in results})
+    if args.json:
+        print(json.dumps({"dialect": dialect_name, "regressions": regressions, "missing": missing, "queries": results}, indent=2))
+    else:
+        if missing:
+            print(f"⚠️  {len(missing)} baseline queries are no longer in the corpus")
+        print(f"🏁 {len(results)} queries, {regressions} regressions")
+
+    if args.update_baseline:
+        write_baseline(baseline_path, dialect_name, results)
+        if not args.json:
+            print(f"✅ Baseline written to {baseline_path}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Incremental ingestion from data/raw/star-schema-2.xlsx.
+
+Each sheet is streamed row by row (openpyxl read-only mode), coerced against the DDL and
+fingerprinted by primary key. Only new or changed rows are upserted; they are stamped with
+_ingested_ts, which /freshness picks up, and carry a _row_hash used to detect the next change.
+A refresh therefore costs time proportional to the delta, not to the table size.
+
+    python db/load_scripts/ingest_workbook.py
+    python db/load_scripts/ingest_workbook.py --db-url sqlite:///star.db --delete-missing
+    python db/load_scripts/ingest_workbook.py --refresh-rollups
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import MetaData, Table, create_engine, inspect, text
+
+from load_data import (
+    DEFAULT_DDL_PATH,
+    FACT_TABLES,
+    INGESTED_COLUMN,
+    REPO_ROOT,
+    coercer_for,
+    default_db_url,
+    parse_ddl,
+    refresh_rollups_after_load,
+)
+
+DEFAULT_WORKBOOK = os.path.join(REPO_ROOT, "data", "raw", "star-schema-2.xlsx")
+
+# Sheet names in the workbook (including its "Procduct" spelling) to table names
+sheet_table_map = {
+    "Branch": "branch",
+    "Country": "country",
+    "Date": "date",
+    "Dealer": "dealer",
+    "Procduct": "product",
+    "Revenue": "revenue",
+}
+
+HASH_COLUMN = "_row_hash"
+# Dialects with an upsert SQLAlchemy can compile (see upsert_statement)
+UPSERT_DIALECTS = ("postgresql", "sqlite", "mysql")
+
+
+def coerce_cell(value, coerce):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        value = value.date() if value.time() == datetime.min.time() else value
+        value = value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value)
+    # Sheet values carry non-breaking spaces ("\xa0Afghanistan"), also inside names; as plain
+    # spaces the stored value and its fingerprint match what load_data.py stores
+    value = value.replace("\xa0", " ")
+    return coerce(value) if value.strip() != "" else None
+
+
+def fingerprint(values) -> str:
+    canonical = "\x1f".join("\x00" if v is None else str(v) for v in values)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def stream_sheet(workbook, sheet: str, table_def: dict, report: dict):
+    """Yields coerced row tuples in DDL column order."""
+    ddl_columns = table_def["columns"]
+    coercers = [coercer_for(t) for _, t in ddl_columns]
+    rows = workbook[sheet].iter_rows(values_only=True)
+    header = [str(h).strip().lower() if h is not None else "" for h in next(rows)]
+    # First occurrence wins; the Date sheet repeats Date_ID as its last column
+    positions = [header.index(name) if name in header else None for name, _ in ddl_columns]
+    for raw in rows:
+        if raw is None or all(v is None for v in raw):
+            continue
+        try:
+            yield tuple(
+                coerce_cell(raw[pos] if pos is not None and pos < len(raw) else None, coerce)
+                for pos, coerce in zip(positions, coercers)
+            )
+        except Exception as e:
+            report["rejected"] += 1
+            if len(report["errors"]) < 10:
+                report["errors"].append(str(e))
+
+
+def ensure_tracking_columns(engine, table: str) -> None:
+    existing = {c["name"].lower() for c in inspect(engine).get_columns(table)}
+    timestamp_type = "TIMESTAMP" if engine.dialect.name != "sqlite" else "TEXT"
+    with engine.begin() as conn:
+        if HASH_COLUMN not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {HASH_COLUMN} TEXT"))
+        if INGESTED_COLUMN not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {INGESTED_COLUMN} {timestamp_type}"))
+
+
+def upsert_statement(target: Table, pk: list, update_cols: list, dialect_name: str):
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(target)
+        # Conflicts on any unique key, which for these tables is the primary key
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(target)
+    return stmt.on_conflict_do_update(
+        index_elements=pk,
+        set_={c: getattr(stmt.excluded, c) for c in update_cols},
+    )
+
+
+def ingest_table(engine, workbook, sheet: str, table: str, table_def: dict, ingested_at, delete_missing: bool, batch_size: int) -> dict:
+    report = {"table": table, "new": 0, "changed": 0, "unchanged": 0, "deleted": 0,
+              "duplicates": 0, "rejected": 0, "errors": [], "seconds": 0.0}
+    started = time.perf_counter()
+    columns = [name for name, _ in table_def["columns"]]
+    pk = table_def["primary_key"]
+    if not pk:
+        raise ValueError(f"{table} has no primary key to fingerprint rows by")
+    pk_positions = [columns.index(c) for c in pk]
+    value_positions = [i for i in range(len(columns)) if i not in pk_positions]
+
+    ensure_tracking_columns(engine, table)
+    with engine.connect() as conn:
+        existing = {
+            tuple(row[:-1]): row[-1]
+            for row in conn.execute(text(f"SELECT {', '.join(pk)}, {HASH_COLUMN} FROM {table}"))
+        }
+
+    # First occurrence of a key wins, like load_data.py, which skips later duplicates
+    latest = {}
+    for row in stream_sheet(workbook, sheet, table_def, report):
+        key = tuple(row[i] for i in pk_positions)
+        if key in latest:
+            report["duplicates"] += 1
+            continue
+        latest[key] = row
+
+    upserts = []
+    for key, row in latest.items():
+        row_hash = fingerprint(row[i] for i in value_positions)
+        previous = existing.get(key, False)
+        if previous is False:
+            report["new"] += 1
+        elif previous == row_hash:
+            report["unchanged"] += 1
+            continue
+        else:
+            report["changed"] += 1
+        upserts.append(dict(zip(columns, row), **{HASH_COLUMN: row_hash, INGESTED_COLUMN: ingested_at}))
+
+    target = Table(table, MetaData(), autoload_with=engine)
+    update_cols = [c for c in columns if c not in pk] + [HASH_COLUMN, INGESTED_COLUMN]
+    stmt = upsert_statement(target, pk, update_cols, engine.dialect.name)
+
+    with engine.begin() as conn:
+        for start in range(0, len(upserts), batch_size):
+            conn.execute(stmt, upserts[start:start + batch_size])
+        # A rejected row's key would look missing; never delete on a partial read
+        if delete_missing and not report["rejected"]:
+            stale = [key for key in existing if key not in latest]
+            condition = " AND ".join(f"{c} = :{c}" for c in pk)
+            for start in range(0, len(stale), batch_size):
+                conn.execute(
+                    text(f"DELETE FROM {table} WHERE {condition}"),
+                    [dict(zip(pk, key)) for key in stale[start:start + batch_size]],
+                )
+            report["deleted"] = len(stale)
+
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Upsert changed rows from the star-schema workbook.")
+    parser.add_argument("--db-url", default=default_db_url(), help="SQLAlchemy URL (default: DB_URL or PG* env)")
+    parser.add_argument("--workbook", default=DEFAULT_WORKBOOK)
+    parser.add_argument("--ddl", default=DEFAULT_DDL_PATH)
+    parser.add_argument("--tables", nargs="*", help="Subset of tables to ingest (default: all)")
+    parser.add_argument("--delete-missing", action="store_true", help="Delete rows whose key left the workbook")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--refresh-rollups", action="store_true", help="Patch the rollup groups the changed rows touch")
+    args = parser.parse_args(argv)
+
+    from openpyxl import load_workbook
+
+    ddl = parse_ddl(args.ddl)
+    engine = create_engine(args.db_url, pool_pre_ping=True)
+    if engine.dialect.name not in UPSERT_DIALECTS:
+        print(f"❌ Upserts are not supported on {engine.dialect.name} (supported: {', '.join(UPSERT_DIALECTS)})")
+        return 1
+    # read_only streams rows; data_only returns cached formula results (year/Month are formulas)
+    workbook = load_workbook(args.workbook, read_only=True, data_only=True)
+    ingested_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    jobs = [(sheet, table) for sheet, table in sheet_table_map.items()
+            if sheet in workbook.sheetnames and (not args.tables or table in args.tables)]
+    # Dimensions before facts, as in load_data.py
+    jobs.sort(key=lambda job: job[1] in FACT_TABLES)
+
+    deleted = 0
+    try:
+        for sheet, table in jobs:
+            print(f"📥 Ingesting sheet {sheet} → {table}")
+            report = ingest_table(engine, workbook, sheet, table, ddl[table], ingested_at, args.delete_missing, args.batch_size)
+            print(
+                f"✅ {table}: {report['new']} new, {report['changed']} changed, "
+                f"{report['unchanged']} unchanged, {report['deleted']} deleted in {report['seconds']:.2f}s"
+                + (f", {report['duplicates']} duplicate keys" if report["duplicates"] else "")
+                + (f", {report['rejected']} invalid rows skipped" if report["rejected"] else "")
+            )
+            for error in report["errors"]:
+                print(f"   ⚠️  {error}")
+            deleted += report["deleted"]
+        # Changed rows carry _ingested_ts, so rollups only recompute the groups they touch;
+        # deletions leave no timestamp behind and force a rebuild
+        if args.refresh_rollups:
+            refresh_rollups_after_load(engine, full=deleted > 0)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    finally:
+        workbook.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,19 @@
 -- branch table
 CREATE TABLE branch (
-    branch_id INT PRIMARY KEY,
+    branch_id TEXT PRIMARY KEY,
     branch_nm TEXT,
     country_name TEXT
 );
 
 -- country table
 CREATE TABLE country (
-    country_id INT PRIMARY KEY,
+    country_id TEXT PRIMARY KEY,
     country_name TEXT
 );
 
 -- date table
 CREATE TABLE date (
-    date_id INT PRIMARY KEY,
+    date_id TEXT PRIMARY KEY,
     date DATE,
     year INT,
     month TEXT,
@@ -22,26 +22,27 @@ CREATE TABLE date (
 
 -- dealer table
 CREATE TABLE dealer (
-    dealer_id INT PRIMARY KEY,
+    dealer_id TEXT PRIMARY KEY,
     dealer_nm TEXT,
-    location_id INT,
+    location_id TEXT,
     location_nm TEXT,
-    country_id INT
+    country_id TEXT
 );
 
 -- product table
 CREATE TABLE product (
-    model_id INT PRIMARY KEY,
+    model_id TEXT PRIMARY KEY,
+    product_id TEXT,
     product_name TEXT,
     model_name TEXT
 );
 
 -- revenue table (fact)
 CREATE TABLE revenue (
-    dealer_id INT,
-    model_id INT,
-    branch_id INT,
-    date_id INT,
+    dealer_id TEXT,
+    model_id TEXT,
+    branch_id TEXT,
+    date_id TEXT,
     units_sold INT,
     revenue NUMERIC,
     PRIMARY KEY (dealer_id, model_id, branch_id, date_id)
@@ -1,4 +1,4 @@
-import { fetchQueryResult } from './fetchQueryResult';
+import { streamQueryEvents, StageTimings, Cell, ColumnMeta } from './fetchQueryResult';
 import { getToken, setToken as saveToken, clearToken } from './auth';
 import React, { useState, useEffect } from 'react';
 import { 
@@ -19,9 +19,22 @@ import {
 
 interface QueryResult {
   columns: string[];
-  rows: (string | number)[][];
+  rows: Cell[][];
+  columnTypes?: ColumnMeta[];
+  truncatedAt?: number;
 }
 
+// Decimals for "number" columns, thousands separators for integers; dates as sent (ISO)
+const formatCell = (cell: Cell, column?: ColumnMeta) => {
+  if (cell === null) return '';
+  if (typeof cell === 'number') {
+    return column?.type === 'number' || (!column && cell % 1 !== 0)
+      ? cell.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })
+      : cell.toLocaleString();
+  }
+  return String(cell);
+};
+
 interface SQLQuery {
   query: string;
   explanation: string;
@@ -33,6 +46,8 @@ function App() {
   const [results, setResults] = useState<QueryResult | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [stage, setStage] = useState<string | null>(null);
+  const [timings, setTimings] = useState<StageTimings | null>(null);
   const [darkMode, setDarkMode] = useState(false);
   const [token, setToken] = useState<string | null>(getToken());
   const [authMode, setAuthMode] = useState<'login' | 'register'>('login');
@@ -118,30 +133,47 @@ const handleSubmit = async (e: React.FormEvent) => {
   setError(null);
   setSqlQuery(null);
   setResults(null);
+  setStage(null);
+  setTimings(null);
 
   try {
-    const data = await fetchQueryResult(question);
-
-    if (!data.success) {
-      setError(data.error || "Something went wrong.");
-    } else {
-      const response = data.response;
-
-      if (response.type === "query_result") {
-        setSqlQuery({ query: response.sql, explanation: "Here is the generated SQL query." });
-        setResults({ columns: response.columns, rows: response.rows });
-      } else if (response.type === "error") {
-        setError(response.error);
-      }
-    }
+    await streamQueryEvents(question, {
+      onStage: setStage,
+      onToken: (text) => {
+        setSqlQuery((prev) => ({ query: (prev?.query ?? '') + text, explanation: "Writing the SQL query…" }));
+      },
+      onSql: (sql) => {
+        setSqlQuery({ query: sql, explanation: "Here is the generated SQL query." });
+      },
+      onMeta: (meta) => {
+        setSqlQuery({ query: meta.sql, explanation: "Here is the generated SQL query." });
+        setResults({ columns: meta.columns, rows: [] });
+      },
+      onRows: (rows, columnTypes) => {
+        setResults((prev) => (prev ? { ...prev, rows: prev.rows.concat(rows), columnTypes: columnTypes ?? prev.columnTypes } : prev));
+      },
+      onTruncated: (maxRows) => {
+        setResults((prev) => (prev ? { ...prev, truncatedAt: maxRows } : prev));
+      },
+      onEnd: (_rowCount, stageTimings) => setTimings(stageTimings ?? null),
+      onError: (message) => setError(message || "Something went wrong."),
+    });
   } catch (err) {
     console.error(err);
     setError("Failed to connect to backend or parse response.");
   } finally {
     setIsLoading(false);
+    setStage(null);
   }
 };
 
+const stageLabels: Record<string, string> = {
+  received: 'Starting…',
+  retrieving_schema: 'Retrieving schema…',
+  generating: 'Generating…',
+  executing: 'Executing…',
+};
+
 
   const toggleDarkMode = () => {
     setDarkMode(!darkMode);
@@ -395,7 +427,7 @@ const handleSubmit = async (e: React.FormEvent) => {
                   {isLoading ? (
                     <>
                       <div className="animate-spin rounded-full h-4 w-4 border-2 border-white border-t-transparent"></div>
-                      <span>Generating...</span>
+                      <span>{(stage && stageLabels[stage]) || 'Generating...'}</span>
                     </>
                   ) : (
                     <>
@@ -460,6 +492,18 @@ const handleSubmit = async (e: React.FormEvent) => {
                   Query Results
                 </h3>
               </div>
+              {timings && Object.keys(timings).length > 0 && (
+                <p className="mt-1 text-xs text-gray-500 dark:text-gray-400">
+                  {Object.entries(timings)
+                    .map(([stageName, ms]) => `${stageName} ${ms < 10 ? ms.toFixed(1) : Math.round(ms)} ms`)
+                    .join(' · ')}
+                </p>
+              )}
+              {results.truncatedAt !== undefined && (
+                <p className="mt-1 text-xs text-amber-600 dark:text-amber-400">
+                  Showing the first {results.truncatedAt.toLocaleString()} rows; narrow the question to see the rest.
+                </p>
+              )}
             </div>
             <div className="overflow-x-auto">
               <table className="w-full">
@@ -483,10 +527,7 @@ const handleSubmit = async (e: React.FormEvent) => {
                           key={cellIndex}
                           className="px-4 py-3 text-sm text-gray-900 dark:text-gray-300"
                         >
-                          {typeof cell === 'number' && cell % 1 !== 0 
-                            ? cell.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })
-                            : cell.toLocaleString()
-                          }
+                          {formatCell(cell, results.columnTypes?.[cellIndex])}
                         </td>
                       ))}
                     </tr>
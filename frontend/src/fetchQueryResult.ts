@@ -1,5 +1,28 @@
 import { getToken } from "./auth";
 
+// Milliseconds per pipeline stage (llm, db_execute, serialize, ...), from the Server-Timing header
+// or the "timings" of a stream's end message.
+export type StageTimings = Record<string, number>;
+
+export const parseServerTiming = (header: string | null): StageTimings => {
+  const timings: StageTimings = {};
+  for (const entry of (header ?? "").split(",")) {
+    const [name, ...params] = entry.trim().split(";");
+    const dur = params.map((p) => p.trim()).find((p) => p.startsWith("dur="));
+    if (name && dur) timings[name] = Number(dur.slice(4));
+  }
+  return timings;
+};
+
+// Type of a result column, as the backend infers it (response_encoding.py)
+export type ColumnType = "integer" | "number" | "string" | "boolean" | "date" | "datetime" | "null";
+export interface ColumnMeta {
+  name: string;
+  type: ColumnType;
+}
+
+export type Cell = string | number | boolean | null;
+
 export const fetchQueryResult = async (question: string) => {
   try {
     const token = getToken();
@@ -17,7 +40,7 @@ export const fetchQueryResult = async (question: string) => {
     });
 
     const data = await response.json();
-    return data;
+    return { ...data, timings: parseServerTiming(response.headers.get("Server-Timing")) };
   } catch (error) {
     console.error("Fetch error:", error);
     return {
@@ -26,3 +49,146 @@ export const fetchQueryResult = async (question: string) => {
     };
   }
 };
+
+export interface QueryStreamHandlers {
+  onMeta: (meta: { sql: string; columns: string[]; path?: string; cached?: boolean }) => void;
+  onRows: (rows: Cell[][], columnTypes?: ColumnMeta[]) => void;
+  onEnd?: (rowCount: number, timings?: StageTimings) => void;
+  // The server stopped at its row cap; there are more rows than were sent
+  onTruncated?: (maxRows: number) => void;
+  onError: (error: string) => void;
+}
+
+// Reads the NDJSON stream from /query/stream so rows can be rendered as they arrive.
+export const streamQueryResult = async (question: string, handlers: QueryStreamHandlers) => {
+  try {
+    const token = getToken();
+    const headers: Record<string, string> = {
+      "Content-Type": "application/json",
+    };
+    if (token) {
+      headers["Authorization"] = `Bearer ${token}`;
+    }
+
+    const response = await fetch("http://localhost:8000/query/stream", {
+      method: "POST",
+      headers,
+      body: JSON.stringify({ question }),
+    });
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => ({}));
+      handlers.onError(body.detail || "Failed to run query.");
+      return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    const handleLine = (line: string) => {
+      if (!line.trim()) return;
+      const message = JSON.parse(line);
+      if (message.type === "meta") {
+        handlers.onMeta(message);
+      } else if (message.type === "rows") {
+        handlers.onRows(message.rows, message.column_types);
+      } else if (message.type === "truncated") {
+        handlers.onTruncated?.(message.max_rows);
+      } else if (message.type === "end") {
+        handlers.onEnd?.(message.row_count, message.timings);
+      } else if (message.type === "error") {
+        handlers.onError(message.error);
+      }
+    };
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop() ?? "";
+      lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+  } catch (error) {
+    console.error("Stream error:", error);
+    handlers.onError("Failed to connect to backend or parse response.");
+  }
+};
+
+export interface QueryEventHandlers extends QueryStreamHandlers {
+  onStage?: (stage: string) => void;
+  onToken?: (text: string) => void;
+  onSql?: (sql: string) => void;
+}
+
+// Reads the Server-Sent Events from /query/events: progress stages and SQL tokens while the
+// LLM is writing, then the same meta/rows/end messages as /query/stream.
+export const streamQueryEvents = async (question: string, handlers: QueryEventHandlers) => {
+  try {
+    const token = getToken();
+    const headers: Record<string, string> = {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    };
+    if (token) {
+      headers["Authorization"] = `Bearer ${token}`;
+    }
+
+    const response = await fetch("http://localhost:8000/query/events", {
+      method: "POST",
+      headers,
+      body: JSON.stringify({ question }),
+    });
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => ({}));
+      handlers.onError(body.detail || "Failed to run query.");
+      return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    const handleEvent = (block: string) => {
+      let event = "message";
+      const data: string[] = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+      }
+      if (!data.length) return;
+      const message = JSON.parse(data.join("\n"));
+      if (event === "stage") {
+        handlers.onStage?.(message.stage);
+      } else if (event === "token") {
+        handlers.onToken?.(message.text);
+      } else if (event === "sql") {
+        handlers.onSql?.(message.sql);
+      } else if (event === "meta") {
+        handlers.onMeta(message);
+      } else if (event === "rows") {
+        handlers.onRows(message.rows, message.column_types);
+      } else if (event === "truncated") {
+        handlers.onTruncated?.(message.max_rows);
+      } else if (event === "end") {
+        handlers.onEnd?.(message.row_count, message.timings);
+      } else if (event === "error") {
+        handlers.onError(message.error);
+      }
+    };
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const blocks = buffer.split("\n\n");
+      buffer = blocks.pop() ?? "";
+      blocks.forEach(handleEvent);
+    }
+    handleEvent(buffer + decoder.decode());
+  } catch (error) {
+    console.error("Event stream error:", error);
+    handlers.onError("Failed to connect to backend or parse response.");
+  }
+};
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from backend.metric_compiler import CompileError, MetricIndex, compile_question
+
+SEMANTIC_LAYER = os.path.join(os.path.dirname(__file__), "..", "backend", "semantic_config.json")
+
+
+@pytest.fixture(scope="module")
+def index():
+    with open(SEMANTIC_LAYER) as f:
+        return MetricIndex(json.load(f))
+
+
+def compiled_sql(index, question):
+    return " ".join(compile_question(index, question)["sql"].split())
+
+
+def test_metric_by_dimension(index):
+    sql = compiled_sql(index, "total revenue by year")
+    assert "SUM(r.Revenue) AS total_revenue" in sql
+    assert "JOIN date d ON r.Date_ID = d.Date_ID" in sql
+    assert "GROUP BY d.year" in sql
+
+
+def test_year_filter(index):
+    assert "WHERE d.year = 2018" in compiled_sql(index, "total revenue in 2018")
+
+
+def test_top_n(index):
+    sql = compiled_sql(index, "top 5 dealers by revenue")
+    assert sql.endswith("ORDER BY total_revenue DESC LIMIT 5")
+
+
+def test_key_and_name_filters(index):
+    assert "WHERE r.Dealer_ID = 'DLR0001'" in compiled_sql(index, "total revenue for dealer DLR0001")
+    assert "WHERE d.Dealer_NM = 'AC Cars Motors'" in compiled_sql(index, "total revenue for dealer name 'AC Cars Motors'")
+
+
+@pytest.mark.parametrize("question", [
+    # Range or list: the LLM decides
+    "total revenue between 2017 and 2019",
+    "total revenue in 2017 and 2018",
+    "total revenue for dealer DLR0001 and dealer DLR0002",
+    # A name compared to a key column, and a key compared to a name column
+    "total revenue for dealer 'AC Cars Motors'",
+    "total revenue for dealer name DLR0001",
+    # Several columns answer to "country"
+    "total revenue by country",
+    "revenue by frobnicate",
+    "dealer by year",
+])
+def test_ambiguous_questions_raise(index, question):
+    with pytest.raises(CompileError):
+        compile_question(index, question)
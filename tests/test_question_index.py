@@ -0,0 +1,39 @@
+import pytest
+
+from backend.question_index import HashingEmbedder, NumpyQuestionIndex, SimilarityCache, question_literals
+
+VERSION = "v1"
+
+
+@pytest.fixture
+def cache():
+    embedder = HashingEmbedder()
+    return SimilarityCache(embedder, NumpyQuestionIndex(dim=embedder.dim), threshold=0.92)
+
+
+def test_literals_keep_question_order():
+    assert question_literals("revenue in 2018 but not in 2019") == ("2018", "2019")
+    assert question_literals("revenue in 2019 but not in 2018") == ("2019", "2018")
+
+
+def test_rephrased_question_reuses_sql(cache):
+    cache.remember("total revenue by year", "SELECT 1", VERSION)
+    match = cache.lookup("show me the total revenue by year", VERSION)
+    assert match is not None and match["sql"] == "SELECT 1"
+
+
+def test_other_layer_version_misses(cache):
+    cache.remember("total revenue by year", "SELECT 1", VERSION)
+    assert cache.lookup("total revenue by year", "v2") is None
+
+
+@pytest.mark.parametrize("saved, asked", [
+    ("list dealers by revenue sorted from lowest to highest", "list dealers by revenue sorted from highest to lowest"),
+    ("revenue in 2018 but not in 2019", "revenue in 2019 but not in 2018"),
+    ("dealers with revenue less than 5", "dealers with revenue greater than 5"),
+    ("top 5 dealers by revenue", "bottom 5 dealers by revenue"),
+    ("revenue by dealer", "dealer by revenue"),
+])
+def test_opposite_questions_miss(cache, saved, asked):
+    cache.remember(saved, "SELECT 1", VERSION)
+    assert cache.lookup(asked, VERSION) is None
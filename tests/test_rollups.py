@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from backend.rollups import RollupRouter, refresh_rollups
+from backend.schema_snapshot import fetch_schema, probe_freshness
+from backend.synthetic_star import generate
+
+SEMANTIC_LAYER = os.path.join(os.path.dirname(__file__), "..", "backend", "semantic_config.json")
+
+
+@pytest.fixture(scope="module")
+def star(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('rollups') / 'star.db'}")
+    generate(engine, 2000, seed=7)
+    with open(SEMANTIC_LAYER) as f:
+        layer = json.load(f)
+    refresh_rollups(engine, layer)
+    schema = fetch_schema(engine)
+    router = RollupRouter(lambda: engine, lambda: layer, lambda: schema)
+    versions = {f["table"].lower(): f["last_loaded"] for f in probe_freshness(engine, schema)}
+    yield engine, router, versions
+    engine.dispose()
+
+
+def rows(engine, sql):
+    with engine.connect() as conn:
+        return sorted(tuple(row) for row in conn.execute(text(sql)))
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT d.year, SUM(r.revenue) AS total FROM revenue r JOIN date d ON r.date_id = d.date_id GROUP BY d.year",
+    "SELECT d.quarter, SUM(r.units_sold) FROM revenue r JOIN date d ON r.date_id = d.date_id GROUP BY d.quarter",
+    "SELECT dl.dealer_nm, SUM(r.revenue) FROM revenue r JOIN dealer dl ON r.dealer_id = dl.dealer_id GROUP BY dl.dealer_nm",
+    "SELECT d.year, b.branch_nm, SUM(r.revenue) FROM revenue r JOIN date d ON r.date_id = d.date_id "
+    "JOIN branch b ON r.branch_id = b.branch_id WHERE d.year = 2019 GROUP BY d.year, b.branch_nm",
+    "SELECT SUM(r.revenue) FROM revenue r JOIN date d ON r.date_id = d.date_id WHERE d.year = 2018",
+])
+def test_rewrite_matches_base_query(star, sql):
+    engine, router, versions = star
+    rewritten = router.rewrite(sql, versions)
+    assert rewritten is not None, "expected a rollup to cover the query"
+    assert rows(engine, rewritten["sql"]) == rows(engine, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT r.dealer_id, r.revenue FROM revenue r",
+    "SELECT d.year, COUNT(DISTINCT r.dealer_id) FROM revenue r JOIN date d ON r.date_id = d.date_id GROUP BY d.year",
+])
+def test_leaves_uncovered_queries(star, sql):
+    _, router, versions = star
+    assert router.rewrite(sql, versions) is None
+
+
+def test_skips_stale_and_untracked_rollups(star):
+    _, router, versions = star
+    sql = "SELECT d.year, SUM(r.revenue) FROM revenue r JOIN date d ON r.date_id = d.date_id GROUP BY d.year"
+    assert router.rewrite(sql, {**versions, "revenue": "2099-01-01 00:00:00"}) is None
+    assert router.rewrite(sql, {**versions, "revenue": None}) is None
@@ -0,0 +1,94 @@
+import pytest
+
+from backend import sql_guard
+from backend.sql_guard import SQLGuard, SQLRejected
+
+COLUMNS = {
+    "revenue": {"dealer_id", "branch_id", "revenue", "units_sold"},
+    "dealer": {"dealer_id", "dealer_nm"},
+    "branch": {"branch_id", "branch_nm"},
+}
+
+
+@pytest.fixture
+def guard():
+    return SQLGuard(max_rows=100)
+
+
+def prepare(guard, sql, dialect="postgresql"):
+    return guard.prepare(sql, dialect, COLUMNS)
+
+
+def test_adds_missing_limit(guard):
+    assert prepare(guard, "SELECT dealer_nm FROM dealer").endswith("LIMIT 100")
+
+
+def test_keeps_small_limit(guard):
+    sql = "SELECT dealer_nm FROM dealer LIMIT 5"
+    assert prepare(guard, sql) == sql
+
+
+def test_lowers_large_limit(guard):
+    assert "LIMIT 100" in prepare(guard, "SELECT dealer_nm FROM dealer LIMIT 5000000")
+
+
+def test_lowers_large_fetch_first(guard):
+    guarded = prepare(guard, "SELECT dealer_nm FROM dealer FETCH FIRST 5000000 ROWS ONLY")
+    assert "5000000" not in guarded and "100" in guarded
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT dealer_nm FROM dealer LIMIT ALL",
+    "SELECT dealer_nm FROM dealer LIMIT 50 + 50000",
+    "SELECT dealer_nm FROM dealer FETCH FIRST 50 PERCENT ROWS ONLY",
+    "SELECT dealer_nm FROM dealer ORDER BY dealer_nm FETCH FIRST 5 ROWS WITH TIES",
+])
+def test_caps_limits_it_cannot_check(guard, sql):
+    assert prepare(guard, sql).endswith("AS guarded LIMIT 100")
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM dealer",
+    "UPDATE dealer SET dealer_nm = 'x'",
+    "DROP TABLE dealer",
+    "SELECT 1; DELETE FROM dealer",
+    "WITH gone AS (DELETE FROM dealer RETURNING *) SELECT * FROM gone",
+    "SELECT * INTO copy FROM dealer",
+    "SELECT * FROM dealer FOR UPDATE",
+])
+def test_rejects_writes(guard, sql):
+    with pytest.raises(SQLRejected):
+        prepare(guard, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT pg_sleep(60)",
+    "SELECT lo_export(1234, '/tmp/out')",
+    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity",
+    "SELECT * FROM dblink('host=elsewhere', 'SELECT 1') AS t(a int)",
+])
+def test_rejects_side_effect_functions(guard, sql):
+    with pytest.raises(SQLRejected, match="not read-only"):
+        prepare(guard, sql)
+
+
+def test_rejects_cartesian_product(guard):
+    with pytest.raises(SQLRejected, match="cartesian"):
+        prepare(guard, "SELECT d.dealer_nm, b.branch_nm FROM dealer d, branch b")
+
+
+def test_allows_joined_tables(guard):
+    prepare(guard, "SELECT d.dealer_nm, SUM(r.revenue) FROM revenue r JOIN dealer d ON r.dealer_id = d.dealer_id GROUP BY d.dealer_nm")
+
+
+def test_without_parser_wraps_existing_limit(guard, monkeypatch):
+    monkeypatch.setattr(sql_guard, "sqlglot", None)
+    assert prepare(guard, "SELECT dealer_nm FROM dealer LIMIT 5000000").endswith("AS guarded LIMIT 100")
+    with pytest.raises(SQLRejected, match="not read-only"):
+        prepare(guard, "SELECT pg_sleep(60)")
+
+
+def test_session_statements_are_read_only(guard):
+    assert guard.session_statements("postgresql")[0] == "SET TRANSACTION READ ONLY"
+    assert guard.session_statements("mysql")[0] == "SET TRANSACTION READ ONLY"
+    assert guard.session_statements("sqlite") == []